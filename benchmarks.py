@@ -0,0 +1,350 @@
+"""
+Micro-benchmarks for the bot's hot paths.
+
+Covers number extraction, token allocation/release, panel status decoding,
+the tracker's status state machine, stats event recording and the file
+writes the bot actually does (stats snapshot, accounts, settings) at
+realistic file sizes. All corpora are generated from fixed seeds so
+runs are comparable between commits.
+
+Usage:
+    python benchmarks.py                      # run and print a report
+    python benchmarks.py --save base.json     # store results as a baseline
+    python benchmarks.py --baseline base.json # fail if slower than baseline
+    python benchmarks.py --filter extract     # only run matching benchmarks
+
+Exit status is 1 when any benchmark drops below its absolute floor in
+THRESHOLDS or regresses by more than --tolerance against a baseline.
+"""
+import argparse
+import contextlib
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+START_DIR = os.getcwd()
+
+# The bot reads its config at import time and creates files in the working
+# directory, so isolate it before importing.
+os.environ.setdefault("BOT_TOKEN", "0:benchmark")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("BASE_URL", "http://127.0.0.1:9")
+os.environ.pop("RENDER", None)
+
+WORK_DIR = tempfile.mkdtemp(prefix="wsotpall-bench-")
+shutil.copy(os.path.join(REPO_DIR, "accounts.json"), os.path.join(WORK_DIR, "accounts.json"))
+os.chdir(WORK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+with open(os.devnull, "w") as _devnull, contextlib.redirect_stdout(_devnull):
+    import wsotpall
+
+# Minimum acceptable ops/sec per benchmark. These are deliberately loose
+# floors that catch order-of-magnitude regressions on slow CI machines;
+# use --baseline for tighter, machine-specific comparisons.
+THRESHOLDS = {
+    "extract_phone_numbers[single_plus]": 2000,
+    "extract_phone_numbers[single_digits]": 2000,
+    "extract_phone_numbers[mixed_text]": 500,
+    "extract_phone_numbers[paste_1k]": 1,
+    "token_acquire_release[pool=1]": 20000,
+    "token_acquire_release[pool=10]": 10000,
+    "token_acquire_release[pool=100]": 1000,
+    "parse_status_response[one_record]": 20000,
+    "parse_status_response[bom_page_15]": 2000,
+    "status_transition[typical_run]": 2000,
+    "status_transition[timeout_run]": 200,
+    "stats_service_events": 5000,
+    "save_stats_snapshot[users=100]": 20,
+    "save_accounts[real,changed_users=1]": 50,
+    "save_accounts[real,full]": 20,
+    "load_save_settings": 200,
+}
+
+
+# ───────────────── CORPORA ─────────────────
+
+def build_phone_corpus():
+    rng = random.Random(1337)
+    country_codes = ["1", "229", "44", "234", "880", "91"]
+
+    lines = []
+    for _ in range(1000):
+        cc = rng.choice(country_codes)
+        length = 8 if cc == "229" else 10
+        number = "".join(rng.choice("0123456789") for _ in range(length))
+        lines.append(f"+{cc} {number}")
+
+    return {
+        "single_plus": "+1 (234) 567-8900",
+        "single_digits": "22947879817",
+        "mixed_text": (
+            "Hi team, please check these: +229 47879817 and +44 7911 123456. "
+            "Also the canada one +1 (234) 567-8900 was pending since 10:30, "
+            "ref #4471 — thanks!"
+        ),
+        "paste_1k": "\n".join(lines),
+    }
+
+
+def build_tracking(users):
+    rng = random.Random(7)
+    tracking = {
+        "added_numbers": {},
+        "success_numbers": {},
+        "today_added": {},
+        "yesterday_added": {},
+        "today_success": {},
+        "yesterday_success": {},
+        "today_success_counts": {},
+        "daily_stats": {},
+        "last_reset": "2026-01-01T10:00:00",
+    }
+    for i in range(users):
+        user_id = str(7000000000 + i)
+        tracking["today_added"][user_id] = rng.randint(0, 300)
+        tracking["yesterday_added"][user_id] = rng.randint(0, 300)
+        tracking["today_success_counts"][user_id] = rng.randint(0, 100)
+        tracking["yesterday_success"][user_id] = rng.randint(0, 100)
+        for _ in range(20):
+            tracking["today_success"][str(rng.randint(10**9, 10**10 - 1))] = user_id
+    for day in range(30):
+        tracking["daily_stats"][f"2026-01-{day + 1:02d}"] = {
+            str(7000000000 + i): rng.randint(0, 100) for i in range(users)
+        }
+    return tracking
+
+
+def build_otp_stats(users):
+    rng = random.Random(11)
+    return {
+        "total_success": 123456,
+        "today_success": 789,
+        "yesterday_success": 654,
+        "user_stats": {
+            str(7000000000 + i): {
+                "total_success": rng.randint(0, 5000),
+                "today_success": rng.randint(0, 100),
+                "yesterday_success": rng.randint(0, 100),
+                "username": f"user{i}",
+                "full_name": "",
+            }
+            for i in range(users)
+        },
+        "last_reset": "2026-01-01T10:00:00",
+    }
+
+
+def build_status_bodies():
+    """getAullNum response bodies as the panel sends them"""
+    rng = random.Random(23)
+
+    def record(i):
+        return {
+            "id": 1000 + i,
+            "phoneNum": str(rng.randint(10**9, 10**10 - 1)),
+            "registrationStatus": rng.choice([1, 2, 4, 16]),
+            "cc": "1",
+            "createTime": "2026-01-01 10:00:00",
+            "remark": None,
+        }
+
+    def body(records):
+        return json.dumps({"code": 200, "msg": "success", "data": {"records": records, "total": len(records)}}).encode()
+
+    return {
+        "one_record": body([record(0)]),
+        "bom_page_15": b"\xef\xbb\xbf" + body([record(i) for i in range(15)]),
+    }
+
+
+def build_status_runs():
+    """Status code sequences one tracked number sees over its lifetime"""
+    return {
+        # a few empty lookups, in progress until the OTP, then success
+        "typical_run": [(code, checks) for checks, code in enumerate([None] * 3 + [2] * 40 + [1])],
+        # stuck in progress until TRACK_MAX_CHECKS
+        "timeout_run": [(2, checks) for checks in range(wsotpall.TRACK_MAX_CHECKS + 1)],
+    }
+
+
+def build_token_pool(size):
+    # Each pool gets its own user so the benchmarks don't share one token list
+    manager = wsotpall.account_manager
+    user_id_str = str(900000 + size)
+    tokens = [f"bench-token-{size}-{i}" for i in range(size)]
+    manager.user_tokens[user_id_str] = tokens
+    for i, token in enumerate(tokens):
+        manager.token_info[token] = {
+            "username": f"acc{i}",
+            "custom_name": f"Account {i}",
+            "api_user_id": str(i),
+            "usage": i % wsotpall.MAX_PER_ACCOUNT,
+            "account_id": i + 1,
+            "user_id": user_id_str,
+        }
+    return manager, int(user_id_str)
+
+
+# ───────────────── RUNNER ─────────────────
+
+def measure(func, min_time=0.5):
+    """Return (ops_per_sec, peak_alloc_bytes_per_op) for a zero-arg callable."""
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        func()  # warm-up
+
+        iterations = 0
+        start = time.perf_counter()
+        elapsed = 0.0
+        while elapsed < min_time:
+            func()
+            iterations += 1
+            elapsed = time.perf_counter() - start
+
+        tracemalloc.start()
+        tracemalloc.reset_peak()
+        base, _ = tracemalloc.get_traced_memory()
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    return iterations / elapsed, max(0, peak - base)
+
+
+def collect_benchmarks():
+    benchmarks = {}
+
+    for name, text in build_phone_corpus().items():
+        benchmarks[f"extract_phone_numbers[{name}]"] = (
+            lambda text=text: wsotpall.extract_phone_numbers(text)
+        )
+
+    for size in (1, 10, 100):
+        manager, user_id = build_token_pool(size)
+
+        def acquire_release(manager=manager, user_id=user_id):
+            token_data = manager.get_next_available_token(user_id)
+            if token_data:
+                manager.release_token(token_data[0])
+
+        benchmarks[f"token_acquire_release[pool={size}]"] = acquire_release
+
+    for name, body in build_status_bodies().items():
+        benchmarks[f"parse_status_response[{name}]"] = (
+            lambda body=body: wsotpall.parse_status_response(body)
+        )
+
+    for name, run in build_status_runs().items():
+        def walk_states(run=run):
+            for status_code, checks in run:
+                wsotpall.status_transition(status_code, checks)
+
+        benchmarks[f"status_transition[{name}]"] = walk_states
+
+    # One added + checked + successful number, as the handlers and tracker record them
+    phones = itertools.count(10**9)
+
+    def record_events(service=wsotpall.stats_service):
+        phone = str(next(phones))
+        service.record_added(7000000000, "acc0", "1")
+        service.record_checked()
+        service.record_success(phone, 7000000000, "acc0", "1")
+
+    benchmarks["stats_service_events"] = record_events
+
+    # Per-day history lives in the time series store, not in the snapshot
+    tracking = build_tracking(100)
+    tracking["daily_stats"] = {}
+    snapshot = {
+        "stats_day": "2026-01-01",
+        "tracking": tracking,
+        "stats": wsotpall.create_default_stats(),
+        "otp_stats": build_otp_stats(100),
+    }
+    benchmarks["save_stats_snapshot[users=100]"] = (
+        lambda: wsotpall.save_stats_snapshot(snapshot)
+    )
+
+    # load_accounts() is served from the in-memory directory, so only the save is measured
+    accounts = wsotpall.load_accounts()
+    changed_user = next(iter(accounts))
+    benchmarks["save_accounts[real,changed_users=1]"] = (
+        lambda: wsotpall.save_accounts(accounts, changed_users=[changed_user])
+    )
+    benchmarks["save_accounts[real,full]"] = (
+        lambda: wsotpall.save_accounts(accounts)
+    )
+
+    settings = {"settlement_rate": 0.1, "last_updated": "2026-01-01T10:00:00", "updated_by": 1}
+    benchmarks["load_save_settings"] = (
+        lambda: wsotpall.save_settings(settings) or wsotpall.load_settings()
+    )
+
+    return benchmarks
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=0.5, help="seconds to spend on each benchmark")
+    parser.add_argument("--baseline", help="JSON file from a previous --save run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown vs baseline (0.25 = 25%%)")
+    parser.add_argument("--save", help="write results to this JSON file")
+    args = parser.parse_args()
+
+    baseline = {}
+    if args.baseline:
+        with open(os.path.join(START_DIR, args.baseline), "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = {}
+    failures = []
+
+    print(f"{'benchmark':<42} {'ops/sec':>12} {'alloc KiB/op':>14}  status")
+    print("-" * 80)
+
+    for name, func in collect_benchmarks().items():
+        if args.filter and args.filter not in name:
+            continue
+
+        ops, peak = measure(func, args.min_time)
+        results[name] = {"ops_per_sec": ops, "peak_alloc_bytes": peak}
+
+        status = "ok"
+        floor = THRESHOLDS.get(name)
+        if floor and ops < floor:
+            status = f"BELOW FLOOR ({floor})"
+            failures.append(name)
+        elif name in baseline:
+            base_ops = baseline[name]["ops_per_sec"]
+            if ops < base_ops * (1 - args.tolerance):
+                status = f"REGRESSED ({ops / base_ops - 1:+.0%})"
+                failures.append(name)
+            else:
+                status = f"ok ({ops / base_ops - 1:+.0%})"
+
+        print(f"{name:<42} {ops:>12.1f} {peak / 1024:>14.1f}  {status}")
+
+    if args.save:
+        with open(os.path.join(START_DIR, args.save), "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=4)
+
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    if failures:
+        print(f"\n❌ {len(failures)} benchmark(s) regressed: {', '.join(failures)}")
+        return 1
+
+    print("\n✅ All benchmarks within thresholds")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import contextlib
+import os
+import sys
+import tempfile
+
+import pytest
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The bot reads its config at import time and creates files in the working
+# directory, so import it from a scratch directory (same as benchmarks.py).
+os.environ.setdefault("BOT_TOKEN", "0:test")
+os.environ.setdefault("ADMIN_ID", "1")
+os.environ.setdefault("BASE_URL", "http://127.0.0.1:9")
+os.environ.pop("RENDER", None)
+
+WORK_DIR = tempfile.mkdtemp(prefix="wsotpall-tests-")
+os.chdir(WORK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+with open(os.devnull, "w") as _devnull, contextlib.redirect_stdout(_devnull):
+    import wsotpall
+
+
+@pytest.fixture
+def bot():
+    return wsotpall
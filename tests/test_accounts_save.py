@@ -0,0 +1,55 @@
+import json
+
+import pytest
+
+
+@pytest.fixture
+def accounts_file(bot, monkeypatch, tmp_path):
+    path = tmp_path / "accounts.json"
+    monkeypatch.setattr(bot, "ACCOUNTS_FILE", str(path))
+    monkeypatch.setattr(bot, "accounts_fragments", {})
+    monkeypatch.setattr(bot, "account_directory", bot.AccountDirectory())
+    return path
+
+
+def sample_accounts():
+    return {
+        "100": {"accounts": [{"id": 1, "username": "alice", "custom_name": "Alïce"}], "selected_account_id": 1},
+        "200": {"accounts": [{"id": 1, "username": "bob", "friends": []}], "selected_account_id": 1},
+    }
+
+
+def test_layout_matches_json_dump(bot, accounts_file):
+    accounts = sample_accounts()
+    bot.save_accounts(accounts)
+
+    assert accounts_file.read_text(encoding="utf-8") == json.dumps(accounts, indent=4, ensure_ascii=False)
+
+
+def test_only_changed_users_are_reserialized(bot, accounts_file):
+    accounts = sample_accounts()
+    bot.save_accounts(accounts)
+
+    accounts["100"]["selected_account_id"] = 2
+    accounts["200"]["selected_account_id"] = 3
+    bot.save_accounts(accounts, changed_users=[100])
+
+    saved = json.loads(accounts_file.read_text(encoding="utf-8"))
+    assert saved["100"]["selected_account_id"] == 2
+    # Not listed as changed, so its cached fragment was written
+    assert saved["200"]["selected_account_id"] == 1
+
+    bot.save_accounts(accounts)
+    assert json.loads(accounts_file.read_text(encoding="utf-8")) == accounts
+
+
+def test_added_and_removed_users(bot, accounts_file):
+    accounts = sample_accounts()
+    bot.save_accounts(accounts)
+
+    del accounts["200"]
+    accounts["300"] = {"accounts": [], "selected_account_id": 1}
+    bot.save_accounts(accounts, changed_users=["300"])
+
+    assert json.loads(accounts_file.read_text(encoding="utf-8")) == accounts
+    assert set(bot.accounts_fragments) == {"100", "300"}
@@ -0,0 +1,43 @@
+def test_known_country_gets_only_its_own_rate(bot):
+    matcher = bot.CountryRateMatcher({"Niger": 0.1, "Nigeria": 0.2}, None)
+
+    assert matcher.rate_for("Nigeria") == 0.2
+    assert matcher.rate_for("Niger") == 0.1
+    assert matcher.rate_for("NG") == 0.2
+    assert matcher.rate_for("🇳🇪") == 0.1
+
+
+def test_known_country_does_not_borrow_a_neighbours_rate(bot):
+    matcher = bot.CountryRateMatcher({"Niger": 0.1}, None)
+
+    assert matcher.rate_for("Nigeria") is None
+
+
+def test_one_word_keys_match_multi_word_countries(bot):
+    matcher = bot.CountryRateMatcher({"Ivory": 0.05, "South": 0.06, "Congo": 0.07}, None)
+
+    assert matcher.match("Ivory Coast") == ("Ivory", 0.05)
+    assert matcher.match("Côte d'Ivoire") == ("Ivory", 0.05)
+    assert matcher.match("South Africa") == ("South", 0.06)
+    assert matcher.match("DR Congo") == ("Congo", 0.07)
+    assert matcher.match("Congo") == ("Congo", 0.07)
+
+
+def test_exact_key_wins_over_partial_key(bot):
+    matcher = bot.CountryRateMatcher({"Congo": 0.07, "Drc": 0.09}, None)
+
+    assert matcher.rate_for("DR Congo") == 0.09
+    assert matcher.rate_for("Republic of the Congo") == 0.07
+
+
+def test_unknown_names_fall_back_to_substring(bot):
+    matcher = bot.CountryRateMatcher({"Foo Land": 0.3}, None)
+
+    assert matcher.match("Foo Land, Region") == ("Foo Land", 0.3)
+    assert matcher.match("Elsewhere") is None
+
+
+def test_default_rate_applies_without_country_rates(bot):
+    matcher = bot.CountryRateMatcher({}, 0.08)
+
+    assert matcher.rate_for("Anywhere") == 0.08
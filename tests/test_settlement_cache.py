@@ -0,0 +1,71 @@
+from datetime import date
+
+
+def settlement(record_id, day, country="Benin", count=1):
+    return {"id": record_id, "gmtCreate": f"{day} 10:00:00", "countryName": country, "count": count}
+
+
+def history(first_id, last_id, day_of):
+    """Records first_id..last_id, newest (highest id) first"""
+    return [settlement(i, day_of(i)) for i in range(last_id, first_id - 1, -1)]
+
+
+def ten_per_day(record_id):
+    return f"2026-01-{10 + record_id // 10:02d}"
+
+
+def test_partial_history_covers_only_whole_days(bot):
+    cache = bot.SettlementCache()
+    # ids 15..29: day 11 is only half there (ids 15-19 of 10-19)
+    cache.store("7", history(15, 29, ten_per_day), total=100, persist=False)
+
+    assert cache.covers("7", date(2026, 1, 12))
+    assert not cache.covers("7", date(2026, 1, 11))
+    assert len(cache.records_for("7", date(2026, 1, 12))) == 10
+
+
+def test_full_history_covers_everything(bot):
+    cache = bot.SettlementCache()
+    cache.store("7", history(0, 29, ten_per_day), total=30, persist=False)
+
+    assert cache.covers("7", date(2025, 1, 1))
+
+
+def test_refresh_overlapping_the_newest_record_extends_history(bot):
+    cache = bot.SettlementCache()
+    cache.store("7", history(15, 29, ten_per_day), total=100, persist=False)
+    cache.store("7", history(25, 44, ten_per_day), total=115, persist=False)
+
+    assert [r["id"] for r in cache.owners["7"]["records"]] == list(range(44, 14, -1))
+    assert cache.covers("7", date(2026, 1, 12))
+    assert len(cache.records_for("7", date(2026, 1, 13))) == 10
+
+
+def test_refresh_with_a_gap_drops_older_history(bot):
+    cache = bot.SettlementCache()
+    cache.store("7", history(15, 29, ten_per_day), total=100, persist=False)
+    # ids 30..34 were never fetched
+    cache.store("7", history(35, 54, ten_per_day), total=125, persist=False)
+
+    assert [r["id"] for r in cache.owners["7"]["records"]][-1] == 35
+    assert not cache.covers("7", date(2026, 1, 12))
+    assert not cache.covers("7", date(2026, 1, 13))
+    assert cache.covers("7", date(2026, 1, 14))
+
+
+def test_entries_without_watermark_are_not_trusted(bot):
+    cache = bot.SettlementCache()
+    cache.owners["7"] = {"records": history(15, 29, ten_per_day), "total": 100, "fetched_at": 0}
+
+    assert not cache.covers("7", date(2026, 1, 12))
+    assert not cache.is_fresh("7", date(2026, 1, 12))
+
+
+def test_get_page_serves_contiguous_pages(bot):
+    cache = bot.SettlementCache()
+    cache.store("7", history(15, 29, ten_per_day), total=100, persist=False)
+    cache.store("7", history(25, 44, ten_per_day), total=115, persist=False)
+
+    page = cache.get_page("7", 2, 5)
+    assert [r["id"] for r in page["records"]] == [39, 38, 37, 36, 35]
+    assert cache.get_page("7", 7, 5) is None
@@ -0,0 +1,81 @@
+import asyncio
+from datetime import date, timedelta
+
+import pytest
+
+PER_DAY = 50  # one panel page (SETTLEMENT_PAGE_SIZE) per day
+
+
+def settlement(record_id):
+    day = date(2026, 1, 1) + timedelta(days=record_id // PER_DAY)
+    return {"id": record_id, "gmtCreate": f"{day} 10:00:00", "countryName": "Benin", "count": 1}
+
+
+@pytest.fixture
+def panel(bot, monkeypatch):
+    """closingEntries for Jan 1..10 (ids 0..499), newest first; records the pages requested"""
+    history = [settlement(i) for i in range(10 * PER_DAY - 1, -1, -1)]
+    requested = []
+
+    async def get_user_settlements(session, token, api_user_id, page=1, page_size=5):
+        requested.append(page)
+        start = (page - 1) * page_size
+        return {
+            "records": history[start:start + page_size],
+            "total": len(history),
+            "pages": (len(history) + page_size - 1) // page_size,
+        }, None
+
+    monkeypatch.setattr(bot, "get_user_settlements", get_user_settlements)
+    return requested
+
+
+def fetch(bot, since_date, cached_newest=None, cached_covers=False):
+    return asyncio.run(bot.fetch_settlements_since(
+        None, "token", "7", since_date, cached_newest, cached_covers
+    ))
+
+
+def test_without_cache_stops_past_since_date(bot, panel):
+    records, total, error = fetch(bot, date(2026, 1, 8))
+
+    assert error is None and total == 500
+    assert panel == [1, 2, 3, 4]
+    assert records[-1]["id"] == 7 * PER_DAY - PER_DAY
+
+
+def test_stops_at_cached_newest_when_cache_covers_since_date(bot, panel):
+    fetch(bot, date(2026, 1, 3), cached_newest=settlement(360), cached_covers=True)
+
+    # id 360 is on Jan 8, the third page
+    assert panel == [1, 2, 3]
+
+
+def test_pages_past_since_date_until_it_reaches_the_cache(bot, panel):
+    # since_date is passed on page 1, but the cache starts on Jan 6
+    records, _, _ = fetch(bot, date(2026, 1, 10), cached_newest=settlement(260), cached_covers=False)
+
+    assert panel == [1, 2, 3, 4, 5]
+    assert 260 in [r["id"] for r in records]
+
+
+def test_gives_up_once_older_than_the_cached_newest(bot, panel):
+    # A cached record the panel no longer has can never be reached
+    lost = {"id": 9999, "gmtCreate": "2026-01-07 10:00:00", "countryName": "Benin"}
+    fetch(bot, date(2026, 1, 10), cached_newest=lost, cached_covers=True)
+
+    # Page 5 (Jan 6) is older than Jan 7
+    assert panel == [1, 2, 3, 4, 5]
+
+
+def test_refresh_joins_the_cache_without_a_gap(bot, panel):
+    cache = bot.SettlementCache()
+    cache.store("7", [settlement(i) for i in range(299, 99, -1)], total=300, persist=False)
+    since_date = date(2026, 1, 4)
+
+    records, total, _ = fetch(bot, since_date, cache.newest("7"), cache.covers("7", since_date))
+    cache.store("7", records, total, persist=False)
+
+    assert panel == [1, 2, 3, 4, 5]
+    assert [r["id"] for r in cache.owners["7"]["records"]] == list(range(499, 99, -1))
+    assert cache.covers("7", since_date)
@@ -0,0 +1,21 @@
+from datetime import date, datetime
+
+
+def at(bot, monkeypatch, moment):
+    monkeypatch.setattr(bot, "bd_now", lambda: moment)
+
+
+def test_stats_day_changes_at_rollover_hour(bot, monkeypatch):
+    at(bot, monkeypatch, datetime(2026, 3, 10, 15, 59, 59))
+    assert bot.current_stats_day() == date(2026, 3, 9)
+
+    at(bot, monkeypatch, datetime(2026, 3, 10, 16, 0, 0))
+    assert bot.current_stats_day() == date(2026, 3, 10)
+
+
+def test_grace_covers_a_daily_job_that_fires_early(bot, monkeypatch):
+    at(bot, monkeypatch, datetime(2026, 3, 10, 15, 59, 58))
+    assert bot.current_stats_day(bot.ROLLOVER_GRACE) == date(2026, 3, 10)
+
+    at(bot, monkeypatch, datetime(2026, 3, 10, 15, 0, 0))
+    assert bot.current_stats_day(bot.ROLLOVER_GRACE) == date(2026, 3, 9)
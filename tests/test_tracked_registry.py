@@ -0,0 +1,46 @@
+def tracked(bot, phone, message_id, token="token-a"):
+    return bot.TrackedNumber(phone, token, "acc", 100, 555, message_id)
+
+
+def test_state_counts_follow_add_set_state_and_finish(bot):
+    registry = bot.TrackedNumberRegistry()
+    first = registry.add(tracked(bot, "111", 1))
+    registry.add(tracked(bot, "222", 2))
+
+    registry.set_state(first, bot.TRACK_AWAITING_OTP)
+    assert registry.count(bot.TRACK_PENDING) == 1
+    assert registry.count(bot.TRACK_AWAITING_OTP) == 1
+
+    registry.finish("111")
+    assert registry.count(bot.TRACK_AWAITING_OTP) == 0
+    assert registry.count(bot.TRACK_PENDING) == 1
+
+
+def test_readd_replaces_the_old_record_in_every_index(bot):
+    registry = bot.TrackedNumberRegistry()
+    old = registry.add(tracked(bot, "111", 1))
+    registry.set_state(old, bot.TRACK_AWAITING_OTP)
+    new = registry.add(tracked(bot, "111", 2, token="token-b"))
+    registry.add(new)
+
+    assert old.state == bot.TRACK_FINISHED
+    assert registry.for_message(555, 1) is None
+    assert registry.for_message(555, 2) is new
+    assert registry.for_token("token-a") == []
+    assert registry.count(bot.TRACK_PENDING) == 1
+    assert registry.count(bot.TRACK_AWAITING_OTP) == 0
+
+    # A finished record's state no longer moves the counts
+    registry.set_state(old, bot.TRACK_AWAITING_OTP)
+    assert registry.count(bot.TRACK_AWAITING_OTP) == 0
+
+
+def test_evict_stale_returns_the_evicted_records(bot):
+    registry = bot.TrackedNumberRegistry()
+    stale = registry.add(tracked(bot, "111", 1))
+    live = registry.add(tracked(bot, "222", 2))
+    stale.updated_at = live.updated_at - bot.TRACKED_NUMBER_TTL - 1
+
+    assert registry.evict_stale(now=live.updated_at) == [stale]
+    assert registry.get("111") is None
+    assert registry.count(bot.TRACK_PENDING) == 1
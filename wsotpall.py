@@ -4,19 +4,31 @@ import threading
 import requests
 import time
 import json
+import codecs
+import hashlib
 import re
 import logging
 import aiohttp
 from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CommandHandler, MessageHandler, filters, CallbackContext, CallbackQueryHandler
-from datetime import datetime, timedelta
-from telegram.error import BadRequest
+from datetime import date, datetime, timedelta, time as dtime
+import pytz
+from telegram.error import BadRequest, Forbidden, RetryAfter
 from fastapi import FastAPI
 import uvicorn
 import random
+import unicodedata
+from collections import OrderedDict, deque
+from urllib.parse import urlsplit
 from typing import Dict, List, Optional, Tuple
 import jwt
 
+try:
+    import orjson  # Optional, faster decoding of panel responses
+    json_loads = orjson.loads
+except ImportError:
+    json_loads = json.loads
+
 # Configure logging to focus on errors only
 logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', 
@@ -45,14 +57,87 @@ if 'RENDER' in os.environ:
     STATS_FILE = "/tmp/stats.json"
     OTP_STATS_FILE = "/tmp/otp_stats.json"
     SETTINGS_FILE = "/tmp/settings.json"
+    ACTIVE_STATE_FILE = "/tmp/active_state.json"
+    PENDING_DELETES_FILE = "/tmp/pending_deletes.json"
+    SETTLEMENT_CACHE_FILE = "/tmp/settlement_cache.json"
+    SETTLEMENT_RUNS_FILE = "/tmp/settlement_runs.json"
+    BROADCASTS_FILE = "/tmp/broadcasts.json"
+    TIMESERIES_FILE = "/tmp/timeseries.json"
+    STATS_SNAPSHOT_FILE = "/tmp/stats_snapshot.json"
 else:
     ACCOUNTS_FILE = "accounts.json"
     STATS_FILE = "stats.json"
     OTP_STATS_FILE = "otp_stats.json"
     SETTINGS_FILE = "settings.json"
+    ACTIVE_STATE_FILE = "active_state.json"
+    PENDING_DELETES_FILE = "pending_deletes.json"
+    SETTLEMENT_CACHE_FILE = "settlement_cache.json"
+    SETTLEMENT_RUNS_FILE = "settlement_runs.json"
+    BROADCASTS_FILE = "broadcasts.json"
+    TIMESERIES_FILE = "timeseries.json"
+    STATS_SNAPSHOT_FILE = "stats_snapshot.json"
 
 USD_TO_BDT = 125  # Exchange rate
 MAX_PER_ACCOUNT = 10
+ACTIVE_STATE_FLUSH_INTERVAL = 10  # Seconds between tracked-number checkpoints
+TRACKED_NUMBER_TTL = 1800  # Drop tracked numbers whose tracker has not run for this long
+TRACK_INTERVAL = 2  # Seconds between status checks of a tracked number
+OTP_FAST_POLL_INTERVAL = 0.3  # Status check interval right after an OTP is accepted
+OTP_FAST_POLL_CHECKS = 10
+HTTP_POOL_SIZE = 100  # Max open connections of the shared panel session
+ADD_CONCURRENCY_PER_TOKEN = 3  # Concurrent addNum calls per account token in a batch
+ADD_LISTING_PAGE_SIZE = 100  # Numbers read per account when checking a batch for duplicates
+
+# Recent terminal outcomes per (cc, phone); resubmitting such a number is
+# answered from memory instead of spending a slot. Seconds to remember each status:
+RECENT_OUTCOME_POLICY = {
+    4: 6 * 3600,    # Not Register
+    7: 24 * 3600,   # Ban Number
+    13: 24 * 3600,  # Used Number
+    16: 6 * 3600,   # Already Exists
+}
+RECENT_OUTCOME_MAX = 50000  # Least recently used outcomes are dropped beyond this
+
+# Panel API protection - per-host and per-account-token token buckets, plus a
+# circuit breaker that pauses calls while the panel is failing
+PANEL_HOST_RATE = float(os.environ.get("PANEL_HOST_RATE", 30))  # Requests per second to BASE_URL
+PANEL_HOST_BURST = 60
+PANEL_TOKEN_RATE = 8  # Requests per second per account token (10 numbers polled every 2 s need 5)
+PANEL_TOKEN_BURST = 15
+PANEL_BREAKER_WINDOW = 50  # Recent calls the error rate is computed over
+PANEL_BREAKER_MIN_CALLS = 20
+PANEL_BREAKER_THRESHOLD = 0.5  # Error rate that opens the breaker
+PANEL_BREAKER_COOLDOWN = 15  # Seconds before a probe call is let through
+TOKEN_REFRESH_COOLDOWN = 30  # Seconds before the same expired token is logged in again
+
+# Daily counters roll over at 4 PM Bangladesh time
+BD_TZ = pytz.timezone("Asia/Dhaka")
+ROLLOVER_HOUR = 16
+ROLLOVER_GRACE = 300  # Seconds early the daily reset job may fire and still roll over
+
+STATS_FLUSH_INTERVAL = 5  # Seconds between writes of changed statistics files
+TIMESERIES_HOURLY_RETENTION = 72  # Hours of hourly buckets kept
+TIMESERIES_DAILY_RETENTION = 120  # Days of daily buckets kept
+
+# Deferred panel deletions
+DELETE_QUEUE_INTERVAL = 3  # Seconds between deletion batches
+DELETE_BATCH_SIZE = 5  # Max deletes per account token per batch
+DELETE_RETRY_BASE = 5  # First retry delay in seconds, doubled per attempt
+DELETE_MAX_BACKOFF = 300
+DELETE_MAX_ATTEMPTS = 8
+DELETE_NOT_FOUND = 'not_found'  # The panel had no record of the number, nothing to delete
+
+# Broadcasts (notices, settlement notifications) - Telegram allows ~30 msg/s overall, 1 msg/s per chat
+BROADCAST_RATE = 25  # Messages per second across all chats
+BROADCAST_CONCURRENCY = 10
+BROADCAST_CHAT_INTERVAL = 1.0  # Seconds between two messages to the same chat
+BROADCAST_MAX_ATTEMPTS = 5
+BROADCAST_PROGRESS_INTERVAL = 3  # Seconds between progress message edits
+
+# Max accounts whose settlements are fetched at the same time during /setrate
+SETTLEMENT_FETCH_CONCURRENCY = int(os.environ.get("SETTLEMENT_FETCH_CONCURRENCY", 8))
+SETTLEMENT_PAGE_SIZE = 50  # closingEntries page size used by the paginator
+SETTLEMENT_CACHE_TTL = int(os.environ.get("SETTLEMENT_CACHE_TTL", 300))  # Seconds before today's records are refetched
 
 # Status map
 status_map = {
@@ -91,7 +176,18 @@ async def ping():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy", "bot": "online"}
+    return {"status": "healthy", "bot": "online", "pending_deletes": deletion_queue.backlog_size()}
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "panel": panel_gate.snapshot(),
+        "tracked_numbers": len(tracked_registry),
+        "awaiting_otp": tracked_registry.count(TRACK_AWAITING_OTP),
+        "recent_outcomes": {"size": len(recent_outcomes), "hits": recent_outcomes.hits},
+        "pending_deletes": deletion_queue.backlog_size(),
+        "timestamp": datetime.now().isoformat()
+    }
 
 # Enhanced keep-alive system for Render
 async def keep_alive_enhanced():
@@ -170,58 +266,27 @@ def load_tracking():
             "last_reset": datetime.now().isoformat()
         }
 
-def save_tracking(tracking):
-    try:
-        with open("tracking.json", 'w', encoding='utf-8') as f:
-            json.dump(tracking, f, indent=4, ensure_ascii=False)
-    except Exception as e:
-        print(f"❌ Error saving tracking: {e}")
-
 async def reset_daily_stats(context: CallbackContext):
-    stats = load_stats()
-    otp_stats = load_otp_stats()
-    tracking = load_tracking()
-    
-    today_date = datetime.now().date().isoformat()
-    
-    # Save yesterday's data
-    tracking["yesterday_added"] = tracking.get("today_added", {}).copy()
-    
-    if "daily_stats" not in tracking:
-        tracking["daily_stats"] = {}
-    
-    today_success_by_user = tracking.get("today_success_counts", {}).copy()
-    tracking["daily_stats"][today_date] = today_success_by_user
-    
-    # Reset today's data
-    tracking["today_added"] = {}
-    tracking["yesterday_success"] = tracking.get("today_success_counts", {}).copy()
-    tracking["today_success"] = {}
-    tracking["today_success_counts"] = {}
-    tracking["last_reset"] = datetime.now().isoformat()
-    
-    # Reset stats
-    stats["yesterday_checked"] = stats["today_checked"]
-    stats["today_checked"] = 0
-    stats["yesterday_deleted"] = stats["today_deleted"]
-    stats["today_deleted"] = 0
-    
-    # Reset OTP stats
-    otp_stats["yesterday_success"] = otp_stats["today_success"]
-    otp_stats["today_success"] = 0
+    """Scheduled at ROLLOVER_HOUR BD time, and once at startup to catch up missed rollovers"""
+    # The daily run carries ROLLOVER_GRACE, so firing a little early still rolls over
+    grace = (context.job.data if context.job else None) or 0
+    missed = stats_service.roll_to(current_stats_day(grace))
+    if not missed:
+        return
     
-    for user_id_str in otp_stats.get("user_stats", {}):
-        otp_stats["user_stats"][user_id_str]["yesterday_success"] = otp_stats["user_stats"][user_id_str].get("today_success", 0)
-        otp_stats["user_stats"][user_id_str]["today_success"] = 0
+    tracking = stats_service.tracking
+    stats = stats_service.stats
+    otp_stats = stats_service.otp_stats
     
-    save_stats(stats)
-    save_otp_stats(otp_stats)
-    save_tracking(tracking)
+    today_date = stats_service.stats_day.isoformat()
     
     # Send reset notification to admin
     reset_message = "🔄 Daily Statistics Reset 🔄\n\n"
     reset_message += f"📅 Date: {datetime.now().strftime('%d %B %Y')}\n"
-    reset_message += f"⏰ Reset Time: 4:00 PM (Bangladesh Time)\n\n"
+    reset_message += f"⏰ Reset Time: 4:00 PM (Bangladesh Time)\n"
+    if missed > 1:
+        reset_message += f"⚠️ Caught up {missed} missed resets after downtime\n"
+    reset_message += "\n"
     reset_message += "📊 Yesterday's Final Stats:\n"
     reset_message += f"• 🔵 In Progress: {sum(tracking['yesterday_added'].values())}\n"
     reset_message += f"• 🟢 Success: {sum(tracking['yesterday_success'].values())}\n"
@@ -237,7 +302,68 @@ async def reset_daily_stats(context: CallbackContext):
     print(f"✅ Daily tracking reset (BD Time 4PM) - Date: {today_date}")
     
 # Enhanced file operations with error handling
+class AccountDirectory:
+    """
+    accounts.json parsed once per process and shared by every handler.
+    save_accounts() makes the saved dict authoritative and drops the lookup
+    indexes, which are rebuilt on the next lookup.
+    """
+    def __init__(self):
+        self.data = None
+        self.indexes = None
+    
+    def replace(self, accounts):
+        self.data = accounts
+        self.indexes = None
+    
+    def _build_indexes(self):
+        by_account_id = {}
+        by_username = {}
+        by_api_user_id = {}
+        for user_id_str, user_data in (self.data or {}).items():
+            if not isinstance(user_data, dict):
+                continue
+            for acc in user_data.get("accounts", []):
+                entry = (user_id_str, acc)
+                by_account_id[(user_id_str, acc.get('id'))] = entry
+                if acc.get('username'):
+                    by_username.setdefault(acc['username'], entry)
+                if acc.get('api_user_id'):
+                    by_api_user_id.setdefault(str(acc['api_user_id']), entry)
+        self.indexes = {
+            'account_id': by_account_id,
+            'username': by_username,
+            'api_user_id': by_api_user_id
+        }
+        return self.indexes
+    
+    def _lookup(self, index, key):
+        indexes = self.indexes or self._build_indexes()
+        return indexes[index].get(key)
+    
+    def user(self, user_id):
+        user_data = load_accounts().get(str(user_id))
+        return user_data if isinstance(user_data, dict) else None
+    
+    def account(self, user_id, account_id):
+        """(user_id_str, account) for a user's account id, or None"""
+        load_accounts()
+        return self._lookup('account_id', (str(user_id), account_id))
+    
+    def find_by_username(self, username):
+        load_accounts()
+        return self._lookup('username', username)
+    
+    def find_by_api_user_id(self, api_user_id):
+        load_accounts()
+        return self._lookup('api_user_id', str(api_user_id))
+
+account_directory = AccountDirectory()
+
 def load_accounts():
+    if account_directory.data is not None:
+        return account_directory.data
+    
     try:
         possible_paths = [
             ACCOUNTS_FILE,
@@ -252,6 +378,7 @@ def load_accounts():
                     with open(file_path, 'r', encoding='utf-8') as f:
                         data = json.load(f)
                         print(f"✅ Loaded accounts from {file_path}")
+                        account_directory.replace(data)
                         return data
             except Exception as e:
                 print(f"❌ Error loading from {file_path}: {e}")
@@ -281,8 +408,42 @@ def load_accounts():
         }
         return initial_data
 
-def save_accounts(accounts):
+# user_id -> that user's JSON fragment as last written, so save_accounts only
+# re-serializes users that changed
+accounts_fragments = {}
+
+def serialize_account_entry(user_data):
+    # Same layout json.dump(indent=4) produces for a top-level value
+    return json.dumps(user_data, indent=4, ensure_ascii=False).replace('\n', '\n    ')
+
+def save_accounts(accounts, changed_users=None):
+    """
+    Write accounts.json. changed_users lists the user ids modified since the
+    last save; everyone else is written from their cached fragment. None
+    re-serializes every user.
+    """
+    account_directory.replace(accounts)
+    
     try:
+        if changed_users is None:
+            accounts_fragments.clear()
+        else:
+            for changed_user in changed_users:
+                accounts_fragments.pop(str(changed_user), None)
+        
+        parts = []
+        for user_id_str, user_data in accounts.items():
+            user_id_str = str(user_id_str)
+            fragment = accounts_fragments.get(user_id_str)
+            if fragment is None:
+                fragment = accounts_fragments[user_id_str] = serialize_account_entry(user_data)
+            parts.append(f"    {json.dumps(user_id_str, ensure_ascii=False)}: {fragment}")
+        
+        for user_id_str in set(accounts_fragments) - set(map(str, accounts)):
+            del accounts_fragments[user_id_str]
+        
+        content = "{\n" + ",\n".join(parts) + "\n}" if parts else "{}"
+        
         possible_paths = [
             ACCOUNTS_FILE,
             "accounts.json", 
@@ -293,7 +454,7 @@ def save_accounts(accounts):
         for file_path in possible_paths:
             try:
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(accounts, f, indent=4, ensure_ascii=False)
+                    f.write(content)
                 print(f"✅ Saved accounts to {file_path}")
                 success = True
                 break
@@ -302,9 +463,11 @@ def save_accounts(accounts):
                 continue
         
         if not success:
+            accounts_fragments.clear()
             print("❌ Failed to save accounts to any location")
             
     except Exception as e:
+        accounts_fragments.clear()
         print(f"❌ Critical error saving accounts: {e}")
 
 def load_stats():
@@ -360,38 +523,6 @@ def create_default_stats():
         "last_reset": datetime.now().isoformat()
     }
 
-def save_stats(stats):
-    try:
-        # Ensure all required keys exist before saving
-        required_keys = [
-            "total_checked", "total_deleted", 
-            "today_checked", "today_deleted",
-            "yesterday_checked", "yesterday_deleted",
-            "last_reset"
-        ]
-        
-        for key in required_keys:
-            if key not in stats:
-                if key in ["total_checked", "today_checked", "yesterday_checked"]:
-                    stats[key] = 0
-                elif key in ["total_deleted", "today_deleted", "yesterday_deleted"]:
-                    stats[key] = 0
-                elif key == "last_reset":
-                    stats[key] = datetime.now().isoformat()
-        
-        possible_paths = [STATS_FILE, "stats.json", "/tmp/stats.json"]
-        for file_path in possible_paths:
-            try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(stats, f, indent=4, ensure_ascii=False)
-                print(f"✅ Stats saved to {file_path}")
-                break
-            except Exception as e:
-                print(f"❌ Error saving to {file_path}: {e}")
-                continue
-    except Exception as e:
-        print(f"❌ Error saving stats: {e}")
-
 def load_otp_stats():
     try:
         possible_paths = [OTP_STATS_FILE, "otp_stats.json", "/tmp/otp_stats.json", "./otp_stats.json"]
@@ -422,18 +553,354 @@ def load_otp_stats():
             "last_reset": datetime.now().isoformat()
         }
 
-def save_otp_stats(otp_stats):
-    try:
-        possible_paths = [OTP_STATS_FILE, "otp_stats.json", "/tmp/otp_stats.json"]
+def bd_now():
+    """Current Bangladesh wall-clock time (naive)"""
+    return datetime.now(BD_TZ).replace(tzinfo=None)
+
+def current_stats_day(grace=0):
+    """
+    The stats day in progress; a new one starts at ROLLOVER_HOUR BD time.
+    A rollover at most grace seconds away already counts as done.
+    """
+    return (bd_now() + timedelta(seconds=grace) - timedelta(hours=ROLLOVER_HOUR)).date()
+
+def write_json_atomic(file_path, data):
+    """Write to a temp file and rename over the target, so readers never see a partial file"""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+def load_stats_snapshot():
+    possible_paths = [STATS_SNAPSHOT_FILE, "stats_snapshot.json", "/tmp/stats_snapshot.json"]
+    for file_path in possible_paths:
+        try:
+            if os.path.exists(file_path):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                    if isinstance(data, dict) and {"tracking", "stats", "otp_stats"} <= data.keys():
+                        return data
+        except Exception as e:
+            print(f"❌ Error loading from {file_path}: {e}")
+            continue
+    return None
+
+def save_stats_snapshot(snapshot):
+    possible_paths = [STATS_SNAPSHOT_FILE, "stats_snapshot.json", "/tmp/stats_snapshot.json"]
+    for file_path in possible_paths:
+        try:
+            write_json_atomic(file_path, snapshot)
+            return True
+        except Exception as e:
+            print(f"❌ Error saving to {file_path}: {e}")
+            continue
+    print("❌ Failed to save stats snapshot to any location")
+    return False
+
+class TimeSeriesStore:
+    """
+    Hourly and daily counters per user ('u'), account ('a') and country
+    code ('c'), plus global totals ('g'). Buckets older than the retention
+    windows are dropped whenever a new one opens, so the file stays bounded
+    and range queries only touch the buckets inside the range.
+    """
+    DIMENSIONS = ('g', 'u', 'a', 'c')
+    
+    def __init__(self):
+        data = self._load()
+        self.hourly = data.get('hourly', {})
+        self.daily = data.get('daily', {})
+        self.dirty = False
+    
+    def _load(self):
+        possible_paths = [TIMESERIES_FILE, "timeseries.json", "/tmp/timeseries.json"]
+        for file_path in possible_paths:
+            try:
+                if os.path.exists(file_path):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        if isinstance(data, dict):
+                            return data
+            except Exception as e:
+                print(f"❌ Error loading from {file_path}: {e}")
+                continue
+        return {}
+    
+    def save(self):
+        possible_paths = [TIMESERIES_FILE, "timeseries.json", "/tmp/timeseries.json"]
         for file_path in possible_paths:
             try:
                 with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(otp_stats, f, indent=4, ensure_ascii=False)
-                break
+                    json.dump({'hourly': self.hourly, 'daily': self.daily}, f, separators=(',', ':'), ensure_ascii=False)
+                self.dirty = False
+                return
             except:
                 continue
-    except Exception as e:
-        print(f"❌ Error saving OTP stats: {e}")
+        print("❌ Failed to save time series to any location")
+    
+    def _bucket(self, series, key):
+        bucket = series.get(key)
+        if bucket is None:
+            bucket = series[key] = {dimension: {} for dimension in self.DIMENSIONS}
+            self._prune()
+        return bucket
+    
+    def _prune(self):
+        now = bd_now()
+        hourly_cutoff = (now - timedelta(hours=TIMESERIES_HOURLY_RETENTION)).strftime('%Y-%m-%dT%H')
+        daily_cutoff = (now - timedelta(days=TIMESERIES_DAILY_RETENTION)).strftime('%Y-%m-%d')
+        for key in [k for k in self.hourly if k < hourly_cutoff]:
+            del self.hourly[key]
+        for key in [k for k in self.daily if k < daily_cutoff]:
+            del self.daily[key]
+    
+    @staticmethod
+    def _add(bucket, dimension, name, metric, count):
+        counters = bucket[dimension].setdefault(str(name), {})
+        counters[metric] = counters.get(metric, 0) + count
+    
+    def record(self, metric, user_id=None, account=None, country=None, count=1):
+        now = bd_now()
+        for series, key in ((self.hourly, now.strftime('%Y-%m-%dT%H')), (self.daily, now.strftime('%Y-%m-%d'))):
+            bucket = self._bucket(series, key)
+            self._add(bucket, 'g', 'all', metric, count)
+            for dimension, name in (('u', user_id), ('a', account), ('c', country)):
+                if name is not None:
+                    self._add(bucket, dimension, name, metric, count)
+        self.dirty = True
+    
+    def import_daily(self, date_str, metric, per_user):
+        """Backfill a day's per-user counts (used for the old tracking daily_stats)"""
+        bucket = self._bucket(self.daily, date_str)
+        for user_id_str, count in per_user.items():
+            if isinstance(count, (int, float)) and count:
+                self._add(bucket, 'u', user_id_str, metric, count)
+                self._add(bucket, 'g', 'all', metric, count)
+        self.dirty = True
+    
+    def range_totals(self, start, dimension='u', hourly=False):
+        """{name: {metric: count}} summed over buckets from start until now"""
+        series = self.hourly if hourly else self.daily
+        start_key = start.strftime('%Y-%m-%dT%H' if hourly else '%Y-%m-%d')
+        totals = {}
+        for key, bucket in series.items():
+            if key < start_key:
+                continue
+            for name, counters in bucket.get(dimension, {}).items():
+                aggregate = totals.setdefault(name, {})
+                for metric, count in counters.items():
+                    aggregate[metric] = aggregate.get(metric, 0) + count
+        return totals
+    
+    def daily_series(self, start, dimension, name):
+        """[(date, {metric: count})] for one user/account/country since start"""
+        start_key = start.strftime('%Y-%m-%d')
+        return [
+            (key, bucket.get(dimension, {}).get(str(name), {}))
+            for key, bucket in sorted(self.daily.items())
+            if key >= start_key
+        ]
+    
+    def leaderboard(self, start, metric='success', dimension='u', hourly=False):
+        totals = self.range_totals(start, dimension, hourly)
+        return sorted(totals.items(), key=lambda item: item[1].get(metric, 0), reverse=True)
+
+timeseries_store = TimeSeriesStore()
+
+class StatsService:
+    """
+    Tracking, stats and OTP stats kept in memory with running totals.
+    Handlers record events here instead of load/modify/save cycles on the
+    files. All three families are committed together as one atomic
+    snapshot (stats_snapshot.json) by flush() on a timer, at rollover and
+    at shutdown. The old per-family files are only read once, to migrate.
+    """
+    def __init__(self):
+        snapshot = load_stats_snapshot()
+        self.dirty = set()
+        if snapshot:
+            self.tracking = snapshot["tracking"]
+            self.stats = snapshot["stats"]
+            self.otp_stats = snapshot["otp_stats"]
+            self.stats_day = datetime.strptime(snapshot["stats_day"], '%Y-%m-%d').date()
+        else:
+            self.tracking = load_tracking()
+            self.stats = load_stats()
+            self.otp_stats = load_otp_stats()
+            self.stats_day = current_stats_day()
+            self.dirty.add("snapshot")
+        self.otp_stats.setdefault("user_stats", {})
+        self._recount()
+        
+        # Per-day history now lives in the time series store
+        if self.tracking.get("daily_stats"):
+            for date_str, per_user in self.tracking["daily_stats"].items():
+                if date_str not in timeseries_store.daily and isinstance(per_user, dict):
+                    timeseries_store.import_daily(date_str, 'success', per_user)
+            self.tracking["daily_stats"] = {}
+            self.dirty.add("tracking")
+    
+    def _recount(self):
+        self.today_added_total = sum(
+            count for count in self.tracking["today_added"].values() if isinstance(count, (int, float))
+        )
+        self.today_success_total = sum(
+            count for count in self.tracking["today_success_counts"].values() if isinstance(count, (int, float))
+        )
+    
+    def _otp_user(self, user_id_str, username):
+        user_stats = self.otp_stats["user_stats"]
+        if user_id_str not in user_stats:
+            user_stats[user_id_str] = {
+                "total_success": 0,
+                "today_success": 0,
+                "yesterday_success": 0,
+                "username": username,
+                "full_name": ""
+            }
+        return user_stats[user_id_str]
+    
+    def record_added(self, user_id, account=None, country=None):
+        user_id_str = str(user_id)
+        today_added = self.tracking["today_added"]
+        today_added[user_id_str] = today_added.get(user_id_str, 0) + 1
+        self.today_added_total += 1
+        self.dirty.add("tracking")
+        timeseries_store.record('added', user_id_str, account, country)
+    
+    def record_checked(self, count=1):
+        self.stats["total_checked"] = self.stats.get("total_checked", 0) + count
+        self.stats["today_checked"] = self.stats.get("today_checked", 0) + count
+        self.dirty.add("stats")
+        timeseries_store.record('checked', count=count)
+    
+    def record_deleted(self, count=1):
+        self.stats["total_deleted"] = self.stats.get("total_deleted", 0) + count
+        self.stats["today_deleted"] = self.stats.get("today_deleted", 0) + count
+        self.dirty.add("stats")
+        timeseries_store.record('deleted', count=count)
+    
+    def record_otp_success(self, user_id, username):
+        timeseries_store.record('otp', str(user_id), username)
+        otp_user = self._otp_user(str(user_id), username)
+        otp_user["total_success"] = otp_user.get("total_success", 0) + 1
+        otp_user["today_success"] = otp_user.get("today_success", 0) + 1
+        self.otp_stats["total_success"] = self.otp_stats.get("total_success", 0) + 1
+        self.otp_stats["today_success"] = self.otp_stats.get("today_success", 0) + 1
+        self.dirty.add("otp_stats")
+    
+    def record_success(self, phone, user_id, username, country=None):
+        """Count a successful number once per day. Returns False if already counted"""
+        if phone in self.tracking["today_success"]:
+            return False
+        
+        user_id_str = str(user_id)
+        timeseries_store.record('success', user_id_str, username, country)
+        self.record_otp_success(user_id_str, username)
+        self.tracking["today_success"][phone] = user_id_str
+        success_counts = self.tracking["today_success_counts"]
+        success_counts[user_id_str] = success_counts.get(user_id_str, 0) + 1
+        self.today_success_total += 1
+        self.dirty.add("tracking")
+        return True
+    
+    def user_today(self, user_id):
+        user_id_str = str(user_id)
+        otp_user = self.otp_stats["user_stats"].get(user_id_str, {})
+        return {
+            'in_progress': self.tracking["today_added"].get(user_id_str, 0),
+            'success': self.tracking["today_success_counts"].get(user_id_str, 0),
+            'otp_success': otp_user.get("today_success", 0),
+            'otp_yesterday': otp_user.get("yesterday_success", 0)
+        }
+    
+    def user_rows(self, accounts):
+        """Today's numbers for every user with accounts, best first"""
+        rows = []
+        for user_id_str, user_data in accounts.items():
+            if user_id_str == str(ADMIN_ID) or not isinstance(user_data, dict):
+                continue
+            user_accounts = user_data.get("accounts", [])
+            if not user_accounts:
+                continue
+            
+            today = self.user_today(user_id_str)
+            rows.append({
+                'user_id': user_id_str,
+                'username': user_accounts[0].get('username', 'Unknown'),
+                'in_progress': today['in_progress'],
+                'success': today['success'],
+                'otp_success': today['otp_success'],
+                'accounts': len(user_accounts)
+            })
+        
+        rows.sort(key=lambda x: x['success'], reverse=True)
+        return rows
+    
+    def _swap_days(self):
+        """Move today's figures to yesterday for every counter family"""
+        tracking = self.tracking
+        tracking["yesterday_added"] = tracking["today_added"]
+        tracking["yesterday_success"] = tracking["today_success_counts"]
+        tracking["today_added"] = {}
+        tracking["today_success"] = {}
+        tracking["today_success_counts"] = {}
+        tracking["last_reset"] = datetime.now().isoformat()
+        
+        self.stats["yesterday_checked"] = self.stats.get("today_checked", 0)
+        self.stats["today_checked"] = 0
+        self.stats["yesterday_deleted"] = self.stats.get("today_deleted", 0)
+        self.stats["today_deleted"] = 0
+        
+        self.otp_stats["yesterday_success"] = self.otp_stats.get("today_success", 0)
+        self.otp_stats["today_success"] = 0
+        for otp_user in self.otp_stats["user_stats"].values():
+            otp_user["yesterday_success"] = otp_user.get("today_success", 0)
+            otp_user["today_success"] = 0
+        
+        self.today_added_total = 0
+        self.today_success_total = 0
+    
+    def roll_to(self, stats_day):
+        """
+        Catch the counters up to stats_day; returns the number of days rolled.
+        After more than one missed day yesterday is empty, since nothing was
+        recorded on the day before stats_day.
+        """
+        missed = (stats_day - self.stats_day).days
+        if missed <= 0:
+            return 0
+        
+        for _ in range(min(missed, 2)):
+            self._swap_days()
+        self.stats_day = stats_day
+        self.dirty.add("snapshot")
+        self.flush()
+        return missed
+    
+    def flush(self):
+        if timeseries_store.dirty:
+            timeseries_store.save()
+        if not self.dirty:
+            return
+        
+        snapshot = {
+            "stats_day": self.stats_day.isoformat(),
+            "tracking": self.tracking,
+            "stats": self.stats,
+            "otp_stats": self.otp_stats,
+            "saved_at": datetime.now().isoformat()
+        }
+        if save_stats_snapshot(snapshot):
+            self.dirty.clear()
+
+stats_service = StatsService()
+
+async def flush_stats_job(context: CallbackContext):
+    if stats_service.dirty or timeseries_store.dirty:
+        stats_service.flush()
 
 def load_settings():
     try:
@@ -477,55 +944,106 @@ def save_settings(settings):
     except Exception as e:
         print(f"❌ Error saving settings: {e}")
 
+def load_settlement_runs():
+    """Per-date fingerprints of what each user was last notified about"""
+    possible_paths = [SETTLEMENT_RUNS_FILE, "settlement_runs.json", "/tmp/settlement_runs.json"]
+    for file_path in possible_paths:
+        try:
+            if os.path.exists(file_path):
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    return json.load(f)
+        except Exception as e:
+            print(f"❌ Error loading from {file_path}: {e}")
+            continue
+    return {}
+
+def save_settlement_runs(runs):
+    # Old dates are never re-run, keep the last 14
+    for date_str in sorted(runs)[:-14]:
+        del runs[date_str]
+    
+    possible_paths = [SETTLEMENT_RUNS_FILE, "settlement_runs.json", "/tmp/settlement_runs.json"]
+    for file_path in possible_paths:
+        try:
+            with open(file_path, 'w', encoding='utf-8') as f:
+                json.dump(runs, f, separators=(',', ':'))
+            return
+        except:
+            continue
+    print("❌ Failed to save settlement runs to any location")
+
+def record_settlement_deliveries(date_str, fingerprints):
+    """Mark users as notified about a settlement once their message was sent"""
+    if not fingerprints:
+        return
+    runs = load_settlement_runs()
+    runs.setdefault(date_str, {}).update(fingerprints)
+    save_settlement_runs(runs)
+
+def settlement_fingerprint(rates, owner_records):
+    """
+    Hash of everything a user's settlement notification is computed from:
+    the rates and the target day's records of the user and each friend
+    ({owner_id: records}, None for an owner whose fetch failed). Inputs
+    rather than results, so it can be checked from the cache before fetching.
+    """
+    payload = {
+        'rates': rates,
+        'owners': {
+            owner_id: None if records is None else sorted(json.dumps(r, sort_keys=True) for r in records)
+            for owner_id, records in owner_records.items()
+        }
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
 # Active OTP requests (in-memory only)
 active_otp_requests = {}
 
 # Async login - UPDATED VERSION
 async def login_api_async(username, password):
     try:
-        async with aiohttp.ClientSession() as session:
-            payload = {"account": username, "password": password, "identity": "Member"}
-            
-            print(f"🔄 Attempting login for: {username}")
-            
-            async with session.post(f"{BASE_URL}/user/login", json=payload, timeout=30) as response:
-                response_text = await response.text()
-                print(f"📥 Response status: {response.status}")
+        session = get_http_session()
+        payload = {"account": username, "password": password, "identity": "Member"}
+        
+        print(f"🔄 Attempting login for: {username}")
+        
+        http_status, body = await panel_call(session, 'login', 'POST', f"{BASE_URL}/user/login", json=payload)
+        print(f"📥 Response status: {http_status}")
+        
+        if http_status == 200:
+            try:
+                data = decode_panel_json(body)
                 
-                if response.status == 200:
-                    try:
-                        data = await response.json(content_type=None)
+                if data and isinstance(data, dict):
+                    if "data" in data and "token" in data["data"]:
+                        token = data["data"]["token"]
                         
-                        if data and isinstance(data, dict):
-                            if "data" in data and "token" in data["data"]:
-                                token = data["data"]["token"]
-                                
-                                try:
-                                    decoded = jwt.decode(token, options={"verify_signature": False})
-                                    api_user_id = decoded.get('id')
-                                    nickname = decoded.get('nickname')
-                                    
-                                    print(f"✅ Login successful for {username}")
-                                    print(f"📝 API User ID: {api_user_id}")
-                                    print(f"👤 Nickname: {nickname}")
-                                    
-                                    return token, api_user_id, nickname
-                                except Exception as jwt_error:
-                                    print(f"⚠️ Could not decode token: {jwt_error}")
-                                    return token, None, None
-                            else:
-                                print(f"❌ Token not found in response for {username}")
-                                return None, None, None
-                        else:
-                            print(f"❌ Invalid response format for {username}")
-                            return None, None, None
-                    except json.JSONDecodeError as e:
-                        print(f"❌ JSON decode error for {username}: {e}")
-                        print(f"❌ Raw response: {response_text[:200]}...")
+                        try:
+                            decoded = jwt.decode(token, options={"verify_signature": False})
+                            api_user_id = decoded.get('id')
+                            nickname = decoded.get('nickname')
+                            
+                            print(f"✅ Login successful for {username}")
+                            print(f"📝 API User ID: {api_user_id}")
+                            print(f"👤 Nickname: {nickname}")
+                            
+                            return token, api_user_id, nickname
+                        except Exception as jwt_error:
+                            print(f"⚠️ Could not decode token: {jwt_error}")
+                            return token, None, None
+                    else:
+                        print(f"❌ Token not found in response for {username}")
                         return None, None, None
                 else:
-                    print(f"❌ Login failed: {username} - Status: {response.status}")
+                    print(f"❌ Invalid response format for {username}")
                     return None, None, None
+            except json.JSONDecodeError as e:
+                print(f"❌ JSON decode error for {username}: {e}")
+                print(f"❌ Raw response: {body[:200]!r}...")
+                return None, None, None
+        else:
+            print(f"❌ Login failed: {username} - Status: {http_status}")
+            return None, None, None
     except asyncio.TimeoutError:
         print(f"❌ Login timeout for {username}")
         return None, None, None
@@ -534,63 +1052,22 @@ async def login_api_async(username, password):
         return None, None, None
 
 def calculate_daily_stats():
-    """Calculate daily statistics from tracking data"""
-    tracking = load_tracking()
-    stats = load_stats()
-    
-    today_date = datetime.now().date().isoformat()
-    
-    # Calculate totals
-    total_in_progress = 0
-    total_success = 0
-    
-    # Get counts from tracking
-    if "today_added" in tracking:
-        for user_id, count in tracking["today_added"].items():
-            if isinstance(count, (int, float)):
-                total_in_progress += count
-    
-    if "today_success_counts" in tracking:
-        for user_id, count in tracking["today_success_counts"].items():
-            if isinstance(count, (int, float)):
-                total_success += count
-    
-    # Get active in-progress numbers from active_numbers
-    active_in_progress = len(active_numbers)
-    
+    """Calculate daily statistics from the in-memory stats service"""
     return {
-        "date": today_date,
-        "total_in_progress": total_in_progress,
-        "active_in_progress": active_in_progress,
-        "total_success": total_success,
-        "total_checked": stats.get("today_checked", 0),
-        "total_deleted": stats.get("today_deleted", 0)
+        "date": datetime.now().date().isoformat(),
+        "total_in_progress": stats_service.today_added_total,
+        "active_in_progress": tracked_registry.count(TRACK_AWAITING_OTP),
+        "total_success": stats_service.today_success_total,
+        "total_checked": stats_service.stats.get("today_checked", 0),
+        "total_deleted": stats_service.stats.get("today_deleted", 0)
     }
 
-async def show_user_statistics(update: Update, context: CallbackContext):
-    """Show individual user statistics"""
-    user_id = update.effective_user.id
+def build_user_statistics_message(user_id):
     user_id_str = str(user_id)
+    today = stats_service.user_today(user_id_str)
     
-    tracking = load_tracking()
-    stats = load_stats()  # This will now work with the fixed function
-    otp_stats = load_otp_stats()
-    
-    today_date = datetime.now().date().isoformat()
-    
-    # Get user-specific stats with default values
-    user_in_progress = tracking.get("today_added", {}).get(user_id_str, 0)
-    user_success = tracking.get("today_success_counts", {}).get(user_id_str, 0)
-    
-    # Get OTP stats with default values
-    user_otp_stats = otp_stats.get("user_stats", {}).get(user_id_str, {})
-    today_otp_success = user_otp_stats.get("today_success", 0)
-    yesterday_otp_success = user_otp_stats.get("yesterday_success", 0)
-    
-    # Get account info
-    accounts = load_accounts()
-    user_data = accounts.get(user_id_str, {})
-    user_accounts = user_data.get("accounts", []) if isinstance(user_data, dict) else []
+    user_data = account_directory.user(user_id_str) or {}
+    user_accounts = user_data.get("accounts", [])
     active_accounts = account_manager.get_user_active_accounts_count(user_id)
     remaining_checks = account_manager.get_user_remaining_checks(user_id)
     
@@ -606,73 +1083,27 @@ async def show_user_statistics(update: Update, context: CallbackContext):
     message += f"• 🎯 Remaining Add: {remaining_checks}\n\n"
     
     message += "📈 Today's Performance:\n"
-    message += f"• 📱Added Numbers: {user_in_progress}\n"
-    message += f"• 🟢 Success Counts: {user_success}\n"
-    message += f"• ✅ OTP Success: {today_otp_success}\n\n"
-    
+    message += f"• 📱 Added Numbers: {today['in_progress']}\n"
+    message += f"• 🟢 Success Counts: {today['success']}\n"
+    message += f"• ✅ OTP Success: {today['otp_success']}\n\n"
     
     message += "🔄 Auto Reset: Daily at 4:00 PM (Bangladesh Time)"
-    
-    await update.message.reply_text(message, parse_mode='none')
+    return message
 
-async def show_admin_statistics(update: Update, context: CallbackContext):
-    """Show admin statistics with all users data"""
-    if update.effective_user.id != ADMIN_ID:
-        await update.message.reply_text("❌ Admin only command!")
-        return
-    
-    processing_msg = await update.message.reply_text("🔄 Generating statistics report...")
-    
-    tracking = load_tracking()
-    stats = load_stats()
-    otp_stats = load_otp_stats()
-    accounts = load_accounts()
+async def show_user_statistics(update: Update, context: CallbackContext):
+    """Show individual user statistics"""
+    await update.message.reply_text(build_user_statistics_message(update.effective_user.id), parse_mode='none')
+
+async def send_admin_statistics(edit_target, context):
+    """Summary into edit_target (a message or callback query), then per-user details and totals to the admin"""
+    stats = stats_service.stats
+    otp_stats = stats_service.otp_stats
+    user_stats = stats_service.user_rows(load_accounts())
     
-    today_date = datetime.now().date().isoformat()
     today_display = datetime.now().strftime('%d %B %Y')
-    
-    # Calculate totals
-    total_in_progress = 0
-    total_success = 0
-    total_users = 0
-    
-    # User-wise calculations
-    user_stats = []
-    
-    for user_id_str, user_data in accounts.items():
-        if user_id_str == str(ADMIN_ID):
-            continue
-        
-        if isinstance(user_data, dict):
-            user_accounts = user_data.get("accounts", [])
-        else:
-            user_accounts = []
-        
-        if not user_accounts:
-            continue
-        
-        total_users += 1
-        username = user_accounts[0].get('username', 'Unknown') if user_accounts else 'Unknown'
-        
-        # Get user stats
-        user_in_progress = tracking.get("today_added", {}).get(user_id_str, 0)
-        user_success = tracking.get("today_success_counts", {}).get(user_id_str, 0)
-        user_otp_success = otp_stats.get("user_stats", {}).get(user_id_str, {}).get("today_success", 0)
-        
-        total_in_progress += user_in_progress
-        total_success += user_success
-        
-        user_stats.append({
-            'user_id': user_id_str,
-            'username': username,
-            'in_progress': user_in_progress,
-            'success': user_success,
-            'otp_success': user_otp_success,
-            'accounts': len(user_accounts)
-        })
-    
-    # Sort users by success count (descending)
-    user_stats.sort(key=lambda x: x['success'], reverse=True)
+    total_users = len(user_stats)
+    total_in_progress = sum(u['in_progress'] for u in user_stats)
+    total_success = sum(u['success'] for u in user_stats)
     
     # Send summary first
     summary_message = "👑 ADMIN STATISTICS SUMMARY 👑\n\n"
@@ -687,7 +1118,8 @@ async def show_admin_statistics(update: Update, context: CallbackContext):
     summary_message += f"• 🟢 Total Success: {total_success}\n"
     summary_message += f"• ✅ Total OTP Success: {otp_stats.get('today_success', 0)}\n"
     summary_message += f"• 📊 Total Checked: {stats.get('today_checked', 0)}\n"
-    summary_message += f"• 🗑️ Total Deleted: {stats.get('today_deleted', 0)}\n\n"
+    summary_message += f"• 🗑️ Total Deleted: {stats.get('today_deleted', 0)}\n"
+    summary_message += f"• ⏳ Pending Deletes: {deletion_queue.backlog_size()}\n\n"
     
     summary_message += "📈 YESTERDAY'S SUMMARY:\n"
     summary_message += f"• 🟢 Success Counts: {otp_stats.get('yesterday_success', 0)}\n"
@@ -696,7 +1128,10 @@ async def show_admin_statistics(update: Update, context: CallbackContext):
     summary_message += "📌 Note: In Progress counts all numbers added today.\n"
     summary_message += "Success counts only unique successful numbers.\n"
     
-    await processing_msg.edit_text(summary_message, parse_mode='none')
+    if hasattr(edit_target, 'edit_message_text'):
+        await edit_target.edit_message_text(summary_message, parse_mode='none')
+    else:
+        await edit_target.edit_text(summary_message, parse_mode='none')
     
     # Send user details in chunks of 10
     users_per_message = 10
@@ -782,10 +1217,100 @@ async def show_admin_statistics(update: Update, context: CallbackContext):
     
     await context.bot.send_message(ADMIN_ID, final_message, parse_mode='none')
 
+async def show_admin_statistics(update: Update, context: CallbackContext):
+    """Show admin statistics with all users data"""
+    if update.effective_user.id != ADMIN_ID:
+        await update.message.reply_text("❌ Admin only command!")
+        return
+    
+    processing_msg = await update.message.reply_text("🔄 Generating statistics report...")
+    await send_admin_statistics(processing_msg, context)
+
+STATS_PERIODS = ('24h', '7d', '30d', 'week', 'month')
+
+def stats_period_start(period):
+    """(start, label, hourly) for a /stats period argument"""
+    now = bd_now()
+    midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if period == '24h':
+        return now - timedelta(hours=23), "Last 24 Hours", True
+    if period == '7d':
+        return midnight - timedelta(days=6), "Last 7 Days", False
+    if period == '30d':
+        return midnight - timedelta(days=29), "Last 30 Days", False
+    if period == 'week':
+        return midnight - timedelta(days=now.weekday()), "This Week", False
+    return midnight.replace(day=1), "This Month", False
+
+async def show_period_statistics(update: Update, period):
+    """/stats 7d|30d|week|month|24h - history from the time series store"""
+    user_id_str = str(update.effective_user.id)
+    start, label, hourly = stats_period_start(period)
+    
+    message = f"📊 Statistics - {label} 📊\n\n"
+    message += f"📅 From: {start.strftime('%d %B %Y %H:00' if hourly else '%d %B %Y')}\n\n"
+    
+    if update.effective_user.id == ADMIN_ID:
+        overall = timeseries_store.range_totals(start, 'g', hourly).get('all', {})
+        message += "📈 OVERALL:\n"
+        message += f"• 📱 Added: {overall.get('added', 0)}\n"
+        message += f"• 🟢 Success: {overall.get('success', 0)}\n"
+        message += f"• ✅ OTP Success: {overall.get('otp', 0)}\n"
+        message += f"• 📊 Checked: {overall.get('checked', 0)}\n"
+        message += f"• 🗑️ Deleted: {overall.get('deleted', 0)}\n\n"
+        
+        accounts = load_accounts()
+        message += "🏆 LEADERBOARD:\n"
+        for i, (leader_id, counters) in enumerate(timeseries_store.leaderboard(start, 'success', 'u', hourly)[:20], 1):
+            leader_data = accounts.get(leader_id, {})
+            leader_accounts = leader_data.get("accounts", []) if isinstance(leader_data, dict) else []
+            leader_name = leader_accounts[0].get('username', leader_id) if leader_accounts else leader_id
+            message += f"{i}. {leader_name} - {counters.get('success', 0)} success / {counters.get('added', 0)} added\n"
+        
+        countries = timeseries_store.leaderboard(start, 'success', 'c', hourly)[:10]
+        if countries:
+            message += "\n🌍 TOP COUNTRY CODES:\n"
+            for cc, counters in countries:
+                message += f"• +{cc}: {counters.get('success', 0)} success / {counters.get('added', 0)} added\n"
+    else:
+        mine = timeseries_store.range_totals(start, 'u', hourly).get(user_id_str, {})
+        message += "📈 Your Performance:\n"
+        message += f"• 📱 Added Numbers: {mine.get('added', 0)}\n"
+        message += f"• 🟢 Success Counts: {mine.get('success', 0)}\n"
+        message += f"• ✅ OTP Success: {mine.get('otp', 0)}\n\n"
+        
+        if not hourly:
+            message += "📅 Day by Day:\n"
+            for date_str, counters in timeseries_store.daily_series(start, 'u', user_id_str):
+                day = datetime.strptime(date_str, '%Y-%m-%d').strftime('%d %b')
+                message += f"• {day}: {counters.get('success', 0)} success / {counters.get('added', 0)} added\n"
+            message += "\n"
+        
+        user_data = account_directory.user(user_id_str) or {}
+        by_account = timeseries_store.range_totals(start, 'a', hourly)
+        account_lines = ""
+        for acc in user_data.get("accounts", []):
+            counters = by_account.get(acc.get('username', ''), {})
+            if counters:
+                name = acc.get('custom_name', acc.get('username', 'Unknown'))
+                account_lines += f"• {name}: {counters.get('success', 0)} success / {counters.get('added', 0)} added\n"
+        if account_lines:
+            message += "👤 By Account:\n" + account_lines
+    
+    await update.message.reply_text(message, parse_mode='none')
+
 async def statistics_command(update: Update, context: CallbackContext):
     """Handle /statistics command for both users and admin"""
     user_id = update.effective_user.id
     
+    if context.args:
+        period = context.args[0].lower()
+        if period not in STATS_PERIODS:
+            await update.message.reply_text("❌ Usage: /stats [24h|7d|30d|week|month]")
+            return
+        await show_period_statistics(update, period)
+        return
+    
     if user_id == ADMIN_ID:
         # Admin sees two buttons: Top Performers and All Statistics
         keyboard = [
@@ -817,58 +1342,13 @@ async def handle_statistics_callback(update: Update, context: CallbackContext):
 
 async def show_top_performers(query, context):
     """Show only top performers summary - SPLIT VERSION"""
-    await query.edit_message_text("🔄 Generating top performers report...")
-    
-    tracking = load_tracking()
-    stats = load_stats()
-    otp_stats = load_otp_stats()
-    accounts = load_accounts()
+    otp_stats = stats_service.otp_stats
+    user_stats = stats_service.user_rows(load_accounts())
     
-    today_date = datetime.now().date().isoformat()
     today_display = datetime.now().strftime('%d %B %Y')
-    
-    # Calculate totals
-    total_in_progress = 0
-    total_success = 0
-    total_users = 0
-    
-    # User-wise calculations
-    user_stats = []
-    
-    for user_id_str, user_data in accounts.items():
-        if user_id_str == str(ADMIN_ID):
-            continue
-        
-        if isinstance(user_data, dict):
-            user_accounts = user_data.get("accounts", [])
-        else:
-            user_accounts = []
-        
-        if not user_accounts:
-            continue
-        
-        total_users += 1
-        username = user_accounts[0].get('username', 'Unknown') if user_accounts else 'Unknown'
-        
-        # Get user stats
-        user_in_progress = tracking.get("today_added", {}).get(user_id_str, 0)
-        user_success = tracking.get("today_success_counts", {}).get(user_id_str, 0)
-        user_otp_success = otp_stats.get("user_stats", {}).get(user_id_str, {}).get("today_success", 0)
-        
-        total_in_progress += user_in_progress
-        total_success += user_success
-        
-        user_stats.append({
-            'user_id': user_id_str,
-            'username': username,
-            'in_progress': user_in_progress,
-            'success': user_success,
-            'otp_success': user_otp_success,
-            'accounts': len(user_accounts)
-        })
-    
-    # Sort users by success count (descending)
-    user_stats.sort(key=lambda x: x['success'], reverse=True)
+    total_users = len(user_stats)
+    total_in_progress = sum(u['in_progress'] for u in user_stats)
+    total_success = sum(u['success'] for u in user_stats)
     
     # =============== PART 1: HEADER AND SUMMARY ===============
     header_message = "🎯 TOP PERFORMERS SUMMARY 🎯\n\n"
@@ -893,7 +1373,6 @@ async def show_top_performers(query, context):
     await query.edit_message_text(header_message, parse_mode='none')
     
     # =============== PART 2: TOP PERFORMERS LIST ===============
-    # Split users into chunks of 15-20 users per message
     users_per_chunk = 50
     total_chunks = (len(user_stats) + users_per_chunk - 1) // users_per_chunk
     
@@ -944,202 +1423,12 @@ async def show_top_performers(query, context):
 
 async def show_user_statistics_from_callback(query, context):
     """Show user statistics from callback"""
-    user_id = query.from_user.id
-    
-    tracking = load_tracking()
-    stats = load_stats()
-    otp_stats = load_otp_stats()
-    
-    user_id_str = str(user_id)
-    today_date = datetime.now().date().isoformat()
-    
-    # Get user-specific stats
-    user_in_progress = tracking.get("today_added", {}).get(user_id_str, 0)
-    user_success = tracking.get("today_success_counts", {}).get(user_id_str, 0)
-    
-    # Get OTP stats
-    user_otp_stats = otp_stats.get("user_stats", {}).get(user_id_str, {})
-    today_otp_success = user_otp_stats.get("today_success", 0)
-    yesterday_otp_success = user_otp_stats.get("yesterday_success", 0)
-    
-    # Get account info
-    accounts = load_accounts()
-    user_data = accounts.get(user_id_str, {})
-    user_accounts = user_data.get("accounts", []) if isinstance(user_data, dict) else []
-    active_accounts = account_manager.get_user_active_accounts_count(user_id)
-    remaining_checks = account_manager.get_user_remaining_checks(user_id)
-    
-    message = "📊 Your Daily Statistics 📊\n\n"
-    
-    message += f"📅 Date: {datetime.now().strftime('%d %B %Y')}\n"
-    message += f"⏰ Time: {datetime.now().strftime('%H:%M:%S')} (BD Time)\n"
-    message += f"🔄 Next Reset: Today 4:00 PM (BD Time)\n\n"
-    
-    message += "👤 Account Information:\n"
-    message += f"• 📱 Total Accounts: {len(user_accounts)}\n"
-    message += f"• ✅ Active Login: {active_accounts}\n"
-    message += f"• 🎯 Remaining Add: {remaining_checks}\n\n"
-    
-    message += "📈 Today's Performance:\n"
-    message += f"• 📱 Added Numbers: {user_in_progress}\n"
-    message += f"• 🟢 Success Counts: {user_success}\n"
-    message += f"• ✅ OTP Success: {today_otp_success}\n\n"
-    
-    
-    message += "🔄 Auto Reset: Daily at 4:00 PM (Bangladesh Time)"
-    
-    await query.edit_message_text(message, parse_mode='none')
+    await query.edit_message_text(build_user_statistics_message(query.from_user.id), parse_mode='none')
 
 async def show_admin_statistics_from_callback(query, context):
     """Show admin statistics from callback"""
     await query.edit_message_text("🔄 Generating all users statistics report...")
-    await show_admin_statistics_from_message(query, context)
-
-async def show_admin_statistics_from_message(message_obj, context):
-    """Show admin statistics from message object"""
-    tracking = load_tracking()
-    stats = load_stats()
-    otp_stats = load_otp_stats()
-    accounts = load_accounts()
-    
-    today_date = datetime.now().date().isoformat()
-    today_display = datetime.now().strftime('%d %B %Y')
-    
-    # Calculate totals
-    total_in_progress = 0
-    total_success = 0
-    total_users = 0
-    
-    # User-wise calculations
-    user_stats = []
-    
-    for user_id_str, user_data in accounts.items():
-        if user_id_str == str(ADMIN_ID):
-            continue
-        
-        if isinstance(user_data, dict):
-            user_accounts = user_data.get("accounts", [])
-        else:
-            user_accounts = []
-        
-        if not user_accounts:
-            continue
-        
-        total_users += 1
-        username = user_accounts[0].get('username', 'Unknown') if user_accounts else 'Unknown'
-        
-        # Get user stats
-        user_in_progress = tracking.get("today_added", {}).get(user_id_str, 0)
-        user_success = tracking.get("today_success_counts", {}).get(user_id_str, 0)
-        user_otp_success = otp_stats.get("user_stats", {}).get(user_id_str, {}).get("today_success", 0)
-        
-        total_in_progress += user_in_progress
-        total_success += user_success
-        
-        user_stats.append({
-            'user_id': user_id_str,
-            'username': username,
-            'in_progress': user_in_progress,
-            'success': user_success,
-            'otp_success': user_otp_success,
-            'accounts': len(user_accounts)
-        })
-    
-    # Sort users by success count (descending)
-    user_stats.sort(key=lambda x: x['success'], reverse=True)
-    
-    # Send summary
-    summary_message = "👑 ADMIN STATISTICS SUMMARY 👑\n\n"
-    
-    summary_message += f"📅 Date: {today_display}\n"
-    summary_message += f"⏰ Time: {datetime.now().strftime('%H:%M:%S')} (BD Time)\n"
-    summary_message += f"🔄 Next Reset: Today 4:00 PM (BD Time)\n\n"
-    
-    summary_message += "📊 TODAY'S OVERVIEW:\n"
-    summary_message += f"• 👥 Total Users: {total_users}\n"
-    summary_message += f"• 🔵 Total In Progress: {total_in_progress}\n"
-    summary_message += f"• 🟢 Total Success: {total_success}\n"
-    summary_message += f"• ✅ Total OTP Success: {otp_stats.get('today_success', 0)}\n"
-    summary_message += f"• 📊 Total Checked: {stats.get('today_checked', 0)}\n"
-    summary_message += f"• 🗑️ Total Deleted: {stats.get('today_deleted', 0)}\n\n"
-    
-    await message_obj.edit_message_text(summary_message, parse_mode='none')
-    
-    # Send user details in chunks of 10
-    users_per_message = 10
-    total_chunks = (len(user_stats) + users_per_message - 1) // users_per_message
-    
-    for chunk_index in range(total_chunks):
-        start_idx = chunk_index * users_per_message
-        end_idx = min(start_idx + users_per_message, len(user_stats))
-        chunk = user_stats[start_idx:end_idx]
-        
-        details_message = f"📋 USER STATISTICS - PART {chunk_index + 1}/{total_chunks} 📋\n\n"
-        details_message += f"📅 Date: {today_display}\n\n"
-        
-        for i, user in enumerate(chunk, start=start_idx + 1):
-            details_message += f"{i}. {user['username']} (ID: {user['user_id']})\n"
-            details_message += f"   ├─ 📱 Accounts: {user['accounts']}\n"
-            details_message += f"   ├─ 🔵 In Progress: {user['in_progress']}\n"
-            details_message += f"   ├─ 🟢 Success: {user['success']}\n"
-            details_message += f"   ├─ ✅ OTP Success: {user['otp_success']}\n"
-            
-            if user['in_progress'] > 0:
-                success_rate = (user['success'] / user['in_progress']) * 100
-                details_message += f"   └─ 📈 Success Rate: {success_rate:.1f}%\n"
-            else:
-                details_message += f"   └─ 📈 Success Rate: 0%\n"
-            
-            details_message += "\n"
-        
-        chunk_in_progress = sum(u['in_progress'] for u in chunk)
-        chunk_success = sum(u['success'] for u in chunk)
-        
-        details_message += f"📊 Chunk {chunk_index + 1} Summary:\n"
-        details_message += f"• 👥 Users: {len(chunk)}\n"
-        details_message += f"• 🔵 In Progress: {chunk_in_progress}\n"
-        details_message += f"• 🟢 Success: {chunk_success}\n"
-        
-        if chunk_index < total_chunks - 1:
-            details_message += "\n⬇️ More users in next message..."
-        
-        try:
-            await context.bot.send_message(
-                ADMIN_ID,
-                details_message,
-                parse_mode='none'
-            )
-            await asyncio.sleep(1)
-        except Exception as e:
-            print(f"❌ Error sending statistics chunk {chunk_index + 1}: {e}")
-    
-    # Send final totals
-    final_message = "🎯 FINAL DAILY SUMMARY 🎯\n\n"
-    
-    final_message += f"📅 Date: {today_display}\n"
-    final_message += f"⏰ Report Time: {datetime.now().strftime('%H:%M:%S')}\n\n"
-    
-    final_message += "📊 TOTAL STATISTICS:\n"
-    final_message += f"• 👥 Total Active Users: {total_users}\n"
-    final_message += f"• 🔵 Total In Progress Numbers: {total_in_progress}\n"
-    final_message += f"• 🟢 Total Success Counts: {total_success}\n"
-    final_message += f"• ✅ Total OTP Success: {otp_stats.get('today_success', 0)}\n\n"
-    
-    if total_in_progress > 0:
-        overall_success_rate = (total_success / total_in_progress) * 100
-        final_message += f"📈 OVERALL SUCCESS RATE: {overall_success_rate:.1f}%\n\n"
-    
-    if len(user_stats) >= 3:
-        final_message += "🏆 TOP 3 PERFORMERS TODAY:\n"
-        for i in range(min(3, len(user_stats))):
-            user = user_stats[i]
-            final_message += f"{i+1}. {user['username']} - {user['success']} success\n"
-        final_message += "\n"
-    
-    final_message += "🔄 Statistics will reset at 4:00 PM (Bangladesh Time)\n"
-    final_message += "✅ Report generation complete!"
-    
-    await context.bot.send_message(ADMIN_ID, final_message, parse_mode='none')
+    await send_admin_statistics(query, context)
 
 def extract_phone_numbers(text: str) -> List[Dict[str, str]]:
     """
@@ -1320,174 +1609,504 @@ def extract_phone_numbers(text: str) -> List[Dict[str, str]]:
     
     return unique_numbers
     
-async def add_number_async(session, token, cc, phone, retry_count=2):
-    for attempt in range(retry_count):
+# Shared keep-alive session for panel requests
+http_session = None
+
+def get_http_session():
+    """The shared aiohttp session; created on first use inside the running loop"""
+    global http_session
+    if http_session is None or http_session.closed:
+        http_session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=HTTP_POOL_SIZE, ttl_dns_cache=300)
+        )
+    return http_session
+
+async def close_http_session():
+    if http_session is not None and not http_session.closed:
+        await http_session.close()
+
+class PanelUnavailable(Exception):
+    """Raised instead of calling the panel while its circuit breaker is open"""
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+    
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+    
+    def take(self):
+        """Take one token; returns 0 or the seconds to wait for the next one"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+class CircuitBreaker:
+    """
+    closed -> open when the error rate over the last calls crosses the
+    threshold; open -> half_open after the cooldown, letting one probe call
+    through; only the probe's outcome closes or re-opens it.
+    """
+    def __init__(self, window, min_calls, threshold, cooldown):
+        self.outcomes = deque(maxlen=window)
+        self.failures = 0
+        self.min_calls = min_calls
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.opened_at = 0.0
+        self.probe_in_flight = False
+        self.times_opened = 0
+    
+    def allow(self):
+        if self.state == 'closed':
+            return True
+        if self.state == 'open' and time.monotonic() - self.opened_at >= self.cooldown:
+            self.state = 'half_open'
+            self.probe_in_flight = False
+        if self.state == 'half_open' and not self.probe_in_flight:
+            self.probe_in_flight = True
+            return True
+        return False
+    
+    def retry_after(self):
+        """Seconds until calls may be attempted again; 0 while closed"""
+        if self.state == 'closed':
+            return 0
+        return max(1.0, self.opened_at + self.cooldown - time.monotonic())
+    
+    def error_rate(self):
+        return self.failures / len(self.outcomes) if self.outcomes else 0.0
+    
+    def release_probe(self):
+        """The probe was cancelled before it had an outcome; let the next call probe"""
+        self.probe_in_flight = False
+    
+    def record(self, ok, probe=False):
+        if self.state == 'half_open':
+            # Calls that started before the breaker opened say nothing about recovery
+            if not probe:
+                return
+            self.probe_in_flight = False
+            if ok:
+                print("✅ Panel recovered, circuit breaker closed")
+                self.state = 'closed'
+                self.outcomes.clear()
+                self.failures = 0
+            else:
+                self._open()
+            return
+        
+        if len(self.outcomes) == self.outcomes.maxlen and not self.outcomes[0]:
+            self.failures -= 1
+        self.outcomes.append(ok)
+        if not ok:
+            self.failures += 1
+        
+        if (self.state == 'closed' and len(self.outcomes) >= self.min_calls
+                and self.error_rate() >= self.threshold):
+            print(f"🚨 Panel error rate {self.error_rate():.0%}, pausing calls for {self.cooldown}s")
+            self._open()
+    
+    def _open(self):
+        self.state = 'open'
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+
+class PanelGate:
+    """Rate limits and circuit breaker shared by every panel API call"""
+    def __init__(self):
+        self.host_buckets = {}
+        self.token_buckets = {}
+        self.breaker = CircuitBreaker(
+            PANEL_BREAKER_WINDOW, PANEL_BREAKER_MIN_CALLS,
+            PANEL_BREAKER_THRESHOLD, PANEL_BREAKER_COOLDOWN
+        )
+        self.requests = 0
+        self.failures = 0
+        self.rejected = 0
+        self.throttled_seconds = 0.0
+    
+    def _bucket(self, buckets, key, rate, burst):
+        bucket = buckets.get(key)
+        if bucket is None:
+            # Tokens are renewed at every login; forget buckets nobody used for a while
+            if len(buckets) >= 1000:
+                idle_before = time.monotonic() - 60
+                for stale_key in [k for k, b in buckets.items() if b.updated < idle_before]:
+                    del buckets[stale_key]
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+    
+    async def acquire(self, url, token=None, wait=False, deadline=None):
+        """
+        Wait for rate-limit capacity. While the breaker is open, raise
+        PanelUnavailable, or with wait=True hold the call until it closes
+        (but not past the monotonic deadline).
+        Returns True if this call is the breaker's half-open probe; its
+        outcome must be passed back to record() or release_probe().
+        """
+        while not self.breaker.allow():
+            retry_after = self.breaker.retry_after()
+            if not wait or (deadline is not None and time.monotonic() + retry_after > deadline):
+                self.rejected += 1
+                raise PanelUnavailable(f"panel paused for {retry_after:.0f}s")
+            await asyncio.sleep(retry_after)
+        probe = self.breaker.state == 'half_open'
+        
+        buckets = [self._bucket(self.host_buckets, urlsplit(url).netloc, PANEL_HOST_RATE, PANEL_HOST_BURST)]
+        if token:
+            buckets.append(self._bucket(self.token_buckets, token, PANEL_TOKEN_RATE, PANEL_TOKEN_BURST))
+        try:
+            for bucket in buckets:
+                delay = bucket.take()
+                while delay:
+                    self.throttled_seconds += delay
+                    await asyncio.sleep(delay)
+                    delay = bucket.take()
+        except BaseException:
+            self.release_probe(probe)
+            raise
+        self.requests += 1
+        return probe
+    
+    def record(self, ok, probe=False):
+        if not ok:
+            self.failures += 1
+        self.breaker.record(ok, probe)
+    
+    def release_probe(self, probe):
+        if probe:
+            self.breaker.release_probe()
+    
+    def snapshot(self):
+        return {
+            "breaker_state": self.breaker.state,
+            "error_rate": round(self.breaker.error_rate(), 3),
+            "retry_after": round(self.breaker.retry_after(), 1),
+            "times_opened": self.breaker.times_opened,
+            "requests": self.requests,
+            "failures": self.failures,
+            "rejected": self.rejected,
+            "throttled_seconds": round(self.throttled_seconds, 1),
+            "host_tokens": {host: round(b.tokens, 1) for host, b in self.host_buckets.items()},
+            "token_buckets": len(self.token_buckets)
+        }
+
+panel_gate = PanelGate()
+
+async def panel_request(session, method, url, token=None, wait=False, timeout=10, deadline=None, **kwargs):
+    """
+    One attempt at a panel API call: rate limited per host and per account
+    token, and counted by the circuit breaker (5xx, 429 and network errors
+    are failures). Returns (http_status, body_bytes); the body is read once.
+    """
+    probe = await panel_gate.acquire(url, token, wait, deadline)
+    headers = {"Admin-Token": token} if token else None
+    try:
+        async with session.request(method, url, headers=headers, timeout=timeout, **kwargs) as response:
+            body = await response.read()
+    except Exception:
+        panel_gate.record(False, probe)
+        raise
+    except BaseException:
+        # Cancelled mid-call: no verdict on the panel, but never strand the probe
+        panel_gate.release_probe(probe)
+        raise
+    panel_gate.record(response.status < 500 and response.status != 429, probe)
+    return response.status, body
+
+def decode_panel_json(body):
+    """Decode a panel response body (bytes), tolerating a UTF-8 BOM and surrounding whitespace"""
+    body = body.strip()
+    if body.startswith(codecs.BOM_UTF8):
+        body = body[len(codecs.BOM_UTF8):].lstrip()
+    return json_loads(body)
+
+PHONE_FIELDS = ("phone", "phoneNumber", "mobile", "number")
+
+def parse_status_response(body):
+    """
+    Pull only what the status checks use out of a getAullNum response:
+    (code, msg, has_data, first_record), first_record being
+    (registrationStatus, id, phone) of the first record, or None.
+    """
+    res = decode_panel_json(body)
+    if not isinstance(res, dict):
+        raise ValueError(f"unexpected status response: {body[:100]!r}")
+    
+    data = res.get('data')
+    first_record = None
+    if isinstance(data, dict):
+        records = data.get('records')
+        if records:
+            record = records[0]
+            actual_phone = record.get("phoneNum")
+            if not actual_phone:
+                for field in PHONE_FIELDS:
+                    if field in record:
+                        actual_phone = record[field]
+                        break
+            first_record = (record.get("registrationStatus"), record.get("id"), actual_phone)
+    
+    return res.get('code'), str(res.get('msg') or ''), 'data' in res, first_record
+
+def parse_number_listing(body):
+    """{phoneNum: (registrationStatus, id)} for every record of a getAullNum page"""
+    res = decode_panel_json(body)
+    data = res.get('data') if isinstance(res, dict) else None
+    records = data.get('records') if isinstance(data, dict) else None
+    listing = {}
+    for record in records or ():
+        phone = record.get("phoneNum")
+        if phone:
+            listing[str(phone)] = (record.get("registrationStatus"), record.get("id"))
+    return listing
+
+class RetryPolicy:
+    __slots__ = ('attempts', 'base_delay', 'max_delay', 'timeout', 'deadline', 'idempotent', 'wait')
+    
+    def __init__(self, attempts, base_delay, max_delay, timeout, deadline, idempotent, wait=False):
+        self.attempts = attempts
+        self.base_delay = base_delay  # Backoff before the 2nd attempt, doubled after that
+        self.max_delay = max_delay
+        self.timeout = timeout  # Per attempt
+        self.deadline = deadline  # Budget in seconds for all attempts together
+        self.idempotent = idempotent  # Safe to resend after a timeout or a 5xx
+        self.wait = wait  # Wait out an open circuit breaker instead of failing
+
+# addNum and uploadCode are not idempotent: they are only resent when the
+# panel certainly did not act on them (connection refused, 429/503, expired token)
+PANEL_RETRY_POLICIES = {
+    'status': RetryPolicy(3, 0.3, 2, 10, 8, True),
+    'delete': RetryPolicy(3, 0.5, 4, 10, 15, True),
+    'settlements': RetryPolicy(3, 0.5, 4, 10, 20, True),
+    'login': RetryPolicy(3, 1, 5, 30, 45, True, wait=True),
+    'add': RetryPolicy(3, 0.5, 4, 10, 30, False, wait=True),
+    'otp': RetryPolicy(2, 0.3, 1, 10, 10, False),
+}
+
+def panel_token_expired(http_status, body):
+    if http_status == 401:
+        return True
+    if b'28004' not in body:
+        return False
+    try:
+        return decode_panel_json(body).get('code') == 28004
+    except Exception:
+        return False
+
+async def panel_call(session, endpoint, method, url, token=None, **kwargs):
+    """
+    panel_request with the endpoint's RetryPolicy: jittered exponential
+    backoff within a deadline, and one re-login when the account token has
+    expired (401 / code 28004) before trying again. token is the handle the
+    bot tracks the account by; the request is sent with its live token.
+    Returns (http_status, body_bytes) of the last attempt.
+    """
+    policy = PANEL_RETRY_POLICIES[endpoint]
+    deadline = time.monotonic() + policy.deadline
+    refreshed = False
+    attempt = 0
+    
+    while True:
+        attempt += 1
+        live_token = account_manager.live_token(token) if token else None
+        remaining = deadline - time.monotonic()
+        retryable = attempt < policy.attempts
         try:
-            headers = {"Admin-Token": token}
-            add_url = f"{BASE_URL}/z-number-base/addNum?cc={cc}&phoneNum={phone}&smsStatus=2"
-            async with session.post(add_url, headers=headers, timeout=10) as response:
-                if response.status == 200:
-                    print(f"✅ Number {phone} added successfully")
-                    return True
-                elif response.status == 401:
-                    print(f"❌ Token expired during add for {phone}, attempt {attempt + 1}")
+            http_status, body = await panel_request(
+                session, method, url, live_token, wait=policy.wait,
+                timeout=max(1, min(policy.timeout, remaining)), deadline=deadline, **kwargs
+            )
+        except PanelUnavailable:
+            raise
+        except aiohttp.ClientConnectorError:
+            # Never reached the panel, so resending is safe for any endpoint
+            if not retryable:
+                raise
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if not (retryable and policy.idempotent):
+                raise
+        else:
+            if token and not refreshed and panel_token_expired(http_status, body):
+                refreshed = True
+                if await account_manager.refresh_token(token):
                     continue
-                elif response.status in (400, 409):
-                    print(f"❌ Number {phone} already exists or invalid, status {response.status}")
-                    return False
-                else:
-                    print(f"❌ Add failed for {phone} with status {response.status}")
-        except Exception as e:
-            print(f"❌ Add number error for {phone} (attempt {attempt + 1}): {e}")
-    return False
+                return http_status, body
+            
+            transient = http_status in (429, 503) or (policy.idempotent and http_status >= 500)
+            if not (retryable and transient):
+                return http_status, body
+        
+        delay = random.uniform(0, min(policy.max_delay, policy.base_delay * 2 ** (attempt - 1)))
+        if time.monotonic() + delay >= deadline:
+            raise asyncio.TimeoutError(f"{endpoint} deadline of {policy.deadline}s exceeded")
+        await asyncio.sleep(delay)
+
+async def add_number_async(session, token, cc, phone):
+    """Returns 'added', 'exists' (panel rejected it as present/invalid) or 'failed'"""
+    try:
+        add_url = f"{BASE_URL}/z-number-base/addNum?cc={cc}&phoneNum={phone}&smsStatus=2"
+        http_status, _ = await panel_call(session, 'add', 'POST', add_url, token)
+        if http_status == 200:
+            print(f"✅ Number {phone} added successfully")
+            return 'added'
+        elif http_status == 401:
+            print(f"❌ Token expired during add for {phone}")
+        elif http_status in (400, 409):
+            print(f"❌ Number {phone} already exists or invalid, status {http_status}")
+            return 'exists'
+        else:
+            print(f"❌ Add failed for {phone} with status {http_status}")
+    except Exception as e:
+        print(f"❌ Add number error for {phone}: {type(e).__name__}: {e}")
+    return 'failed'
+
+async def fetch_number_listing(session, token, page_size=ADD_LISTING_PAGE_SIZE):
+    """The account's latest numbers as {phone: (registrationStatus, id)}, or None on failure"""
+    url = f"{BASE_URL}/z-number-base/getAullNum?page=1&pageSize={page_size}"
+    try:
+        http_status, body = await panel_call(session, 'status', 'GET', url, token)
+        if http_status == 200:
+            return parse_number_listing(body)
+        print(f"⚠️ Number listing failed with status {http_status}")
+    except Exception as e:
+        print(f"⚠️ Number listing error: {type(e).__name__}: {e}")
+    return None
+
+def find_in_listing(listing, cc, phone):
+    return listing.get(phone) or listing.get(f"{cc}{phone}")
 
 async def get_status_async(session, token, phone):
     try:
-        headers = {"Admin-Token": token}
         status_url = f"{BASE_URL}/z-number-base/getAullNum?page=1&pageSize=15&phoneNum={phone}"
         
-        async with session.get(status_url, headers=headers, timeout=10) as response:
-            response_text = await response.text()
-            
-            if response.status == 401:
-                print(f"❌ Token expired for {phone}")
-                return -1, "❌ Token Expired", None
-            
-            try:
-                res = await response.json(content_type=None)
-            except Exception as json_error:
-                print(f"❌ JSON parse attempt 1 failed for {phone}: {json_error}")
-                try:
-                    cleaned_text = response_text.strip()
-                    if cleaned_text.startswith('\ufeff'):
-                        cleaned_text = cleaned_text[1:]
-                    res = json.loads(cleaned_text)
-                except Exception as e2:
-                    print(f"❌ Manual JSON parse also failed for {phone}: {e2}")
-                    print(f"❌ Raw response: {response_text[:500]}")
-                    return -2, "❌ API Error", None
-            
-            if res.get('code') == 28004:
-                print(f"❌ Login required for {phone}")
-                return -1, "❌ Token Expired", None
-            
-            if res.get('msg') and any(keyword in str(res.get('msg')).lower() for keyword in ["already exists", "cannot register", "number exists"]):
-                print(f"❌ Number {phone} already exists or cannot register")
-                return 16, "🚫 Already Exists", None
-            
-            if res.get('code') in (400, 409):
-                print(f"❌ Number {phone} already exists, code {res.get('code')}")
-                return 16, "🚫 Already Exists", None
-            
-            if (res and "data" in res and "records" in res["data"] and 
-                res["data"]["records"] and len(res["data"]["records"]) > 0):
-                record = res["data"]["records"][0]
-                status_code = record.get("registrationStatus")
-                record_id = record.get("id")
-                status_name = status_map.get(status_code, f"🔸 Status {status_code}")
-                return status_code, status_name, record_id
-            
-            if res and "data" in res and "records" in res["data"]:
-                return None, "🚫 Already Registered...", None
-            
-            return None, "🚫 Already Registered...", None
-            
+        http_status, body = await panel_call(session, 'status', 'GET', status_url, token)
+        
+        if http_status == 401:
+            print(f"❌ Token expired for {phone}")
+            return -1, "❌ Token Expired", None
+        
+        code, msg, has_data, first_record = parse_status_response(body)
+        
+        if code == 28004:
+            print(f"❌ Login required for {phone}")
+            return -1, "❌ Token Expired", None
+        
+        if msg and any(keyword in msg.lower() for keyword in ["already exists", "cannot register", "number exists"]):
+            print(f"❌ Number {phone} already exists or cannot register")
+            return 16, "🚫 Already Exists", None
+        
+        if code in (400, 409):
+            print(f"❌ Number {phone} already exists, code {code}")
+            return 16, "🚫 Already Exists", None
+        
+        if first_record:
+            status_code, record_id, _ = first_record
+            status_name = status_map.get(status_code, f"🔸 Status {status_code}")
+            return status_code, status_name, record_id
+        
+        return None, "🚫 Already Registered...", None
+        
     except Exception as e:
         print(f"❌ Status error for {phone}: {type(e).__name__}: {e}")
         return -2, "🔄 Refresh Server", None
 
 async def delete_single_number_async(session, token, record_id, username):
     try:
-        headers = {"Admin-Token": token}
         delete_url = f"{BASE_URL}/z-number-base/deleteNum/{record_id}"
-        async with session.delete(delete_url, headers=headers, timeout=10) as response:
-            if response.status == 200:
-                return True
-            else:
-                print(f"❌ Delete failed for {record_id}: Status {response.status}")
-                return False
+        http_status, _ = await panel_call(session, 'delete', 'DELETE', delete_url, token)
+        if http_status == 200:
+            return True
+        else:
+            print(f"❌ Delete failed for {record_id}: Status {http_status}")
+            return False
     except Exception as e:
         print(f"❌ Delete error for {record_id}: {e}")
         return False
 
 async def submit_otp_async(session, token, phone, code):
     try:
-        headers = {"Admin-Token": token}
         otp_url = f"{BASE_URL}/z-number-base/allNum/uploadCode?phoneNum={phone}&code={code}"
-        async with session.get(otp_url, headers=headers, timeout=10) as response:
-            if response.status == 200:
-                try:
-                    result = await response.json(content_type=None)
-                    if result.get('code') == 200:
-                        print(f"✅ OTP submitted successfully for {phone}")
-                        return True, "OTP verified successfully"
-                    else:
-                        print(f"❌ OTP submission failed for {phone}: {result.get('msg', 'Unknown error')}")
-                        return False, result.get('msg', 'Unknown error')
-                except:
-                    text_result = await response.text()
-                    if "success" in text_result.lower() or "200" in text_result:
-                        print(f"✅ OTP submitted successfully for {phone} (text response)")
-                        return True, "OTP verified successfully"
-                    else:
-                        print(f"❌ OTP submission failed for {phone}: {text_result}")
-                        return False, text_result
-            else:
-                print(f"❌ OTP submission failed for {phone}: Status {response.status}")
-                return False, f"HTTP Error: {response.status}"
+        http_status, body = await panel_call(session, 'otp', 'GET', otp_url, token)
+        if http_status == 200:
+            try:
+                result = decode_panel_json(body)
+                if result.get('code') == 200:
+                    print(f"✅ OTP submitted successfully for {phone}")
+                    return True, "OTP verified successfully"
+                else:
+                    print(f"❌ OTP submission failed for {phone}: {result.get('msg', 'Unknown error')}")
+                    return False, result.get('msg', 'Unknown error')
+            except:
+                response_text = body.decode('utf-8', 'replace')
+                if "success" in response_text.lower() or "200" in response_text:
+                    print(f"✅ OTP submitted successfully for {phone} (text response)")
+                    return True, "OTP verified successfully"
+                else:
+                    print(f"❌ OTP submission failed for {phone}: {response_text}")
+                    return False, response_text
+        else:
+            print(f"❌ OTP submission failed for {phone}: Status {http_status}")
+            return False, f"HTTP Error: {http_status}"
     except Exception as e:
         print(f"❌ OTP submission error for {phone}: {e}")
         return False, str(e)
 
 async def get_user_settlements(session, token, user_id, page=1, page_size=2):
     try:
-        headers = {"Admin-Token": token}
         url = f"{BASE_URL}/m-settle-accounts/closingEntries?page={page}&pageSize={page_size}&userid={user_id}"
         
         print(f"🔍 Fetching settlements for user {user_id}")
         
-        async with session.get(url, headers=headers, timeout=10) as response:
-            response_text = await response.text()
-            print(f"📥 Response status: {response.status}")
-            
-            if response.status == 200:
-                try:
-                    result = await response.json(content_type=None)
+        http_status, body = await panel_call(session, 'settlements', 'GET', url, token)
+        print(f"📥 Response status: {http_status}")
+        
+        if http_status == 200:
+            try:
+                result = decode_panel_json(body)
+                
+                if result.get('code') == 200:
+                    data = result.get('data', {})
                     
-                    if result.get('code') == 200:
-                        data = result.get('data', {})
+                    if 'records' in data:
+                        records = data.get('records', [])
+                        total = data.get('total', len(records))
+                        pages = data.get('pages', 1)
                         
-                        if 'records' in data:
-                            records = data.get('records', [])
-                            total = data.get('total', len(records))
-                            pages = data.get('pages', 1)
-                            
-                            return {
-                                'records': records,
-                                'total': total,
-                                'pages': pages,
-                                'page': page,
-                                'size': page_size
-                            }, None
-                        else:
-                            print(f"⚠️ No 'records' key in data: {data}")
-                            return {
-                                'records': [],
-                                'total': 0,
-                                'pages': 0,
-                                'page': page,
-                                'size': page_size
-                            }, None
+                        return {
+                            'records': records,
+                            'total': total,
+                            'pages': pages,
+                            'page': page,
+                            'size': page_size
+                        }, None
                     else:
-                        error_msg = result.get('msg', 'Unknown error')
-                        print(f"❌ API returned error: {error_msg}")
-                        return None, f"API Error: {error_msg}"
-                except Exception as e:
-                    print(f"❌ JSON parse error in get_user_settlements: {e}")
-                    return None, f"JSON parse error: {e}"
-            else:
-                print(f"❌ HTTP Error in get_user_settlements: {response.status}")
-                return None, f"HTTP Error: {response.status}"
+                        print(f"⚠️ No 'records' key in data: {data}")
+                        return {
+                            'records': [],
+                            'total': 0,
+                            'pages': 0,
+                            'page': page,
+                            'size': page_size
+                        }, None
+                else:
+                    error_msg = result.get('msg', 'Unknown error')
+                    print(f"❌ API returned error: {error_msg}")
+                    return None, f"API Error: {error_msg}"
+            except Exception as e:
+                print(f"❌ JSON parse error in get_user_settlements: {e}")
+                return None, f"JSON parse error: {e}"
+        else:
+            print(f"❌ HTTP Error in get_user_settlements: {http_status}")
+            return None, f"HTTP Error: {http_status}"
     except Exception as e:
         print(f"❌ Exception in get_user_settlements: {e}")
         return None, str(e)
@@ -1504,6 +2123,12 @@ class AccountManager:
         self.user_selected_accounts = {}
         self.user_accounts_data = {}  # Store user accounts data
         
+        # Tokens renewed after expiring mid-session (handle -> live token)
+        self.renewed_tokens = {}
+        self.token_refreshes = {}
+        self.token_refreshed_at = {}
+        self.token_refresh_results = {}  # handle -> token from the last re-login, None if it failed
+        
     def _load_accounts_compatible(self):
         """Load accounts with backward compatibility"""
         try:
@@ -1559,8 +2184,10 @@ class AccountManager:
             if converted_accounts != accounts_data:
                 save_accounts(converted_accounts)
                 print("✅ Accounts converted to new format")
+                return converted_accounts
             
-            return converted_accounts
+            # Keep working on the directory's own dict so its lookups see our edits
+            return accounts_data
             
         except Exception as e:
             print(f"❌ Error loading accounts: {e}")
@@ -1659,7 +2286,7 @@ class AccountManager:
                     selected_account['active'] = False
         
         # Save updated accounts
-        save_accounts(self.accounts)
+        save_accounts(self.accounts, [user_id_str])
         
         # Initialize token tracking
         self.user_tokens[user_id_str] = []
@@ -1683,15 +2310,68 @@ class AccountManager:
     async def validate_token(self, token):
         """Validate if token is still working"""
         try:
-            async with aiohttp.ClientSession() as session:
-                status_code, _, _ = await get_status_async(session, token, "0000000000")
-                if status_code is not None and status_code != -1:
-                    return True
+            session = get_http_session()
+            status_code, _, _ = await get_status_async(session, token, "0000000000")
+            if status_code is not None and status_code != -1:
+                return True
             return False
         except Exception as e:
             print(f"❌ Token validation error: {e}")
             return False
     
+    def live_token(self, token):
+        """The token to send for an account handle, after any mid-session re-login"""
+        return self.renewed_tokens.get(token, token)
+    
+    async def refresh_token(self, token):
+        """
+        Log in again the account behind an expired token. The original token
+        stays the handle for leases and tracking; panel calls use the renewed
+        one via live_token. Concurrent callers share one login.
+        Returns the live token, or None if the account could not log in.
+        Within TOKEN_REFRESH_COOLDOWN the last re-login's outcome is reused.
+        """
+        if token not in self.token_owners:
+            return None
+        
+        pending = self.token_refreshes.get(token)
+        if pending is None:
+            if time.monotonic() - self.token_refreshed_at.get(token, 0) < TOKEN_REFRESH_COOLDOWN:
+                return self.token_refresh_results.get(token)
+            pending = self.token_refreshes[token] = asyncio.ensure_future(self._relogin_token(token))
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if pending.done():
+                self.token_refreshes.pop(token, None)
+    
+    async def _relogin_token(self, token):
+        user_id_str, username, custom_name, account_id = self.token_owners[token]
+        self.token_refreshed_at[token] = time.monotonic()
+        self.token_refresh_results[token] = None
+        
+        found = account_directory.account(user_id_str, account_id)
+        if not found:
+            return None
+        acc = found[1]
+        
+        print(f"🔄 Token expired for {custom_name}, logging in again")
+        new_token, api_user_id, nickname = await login_api_async(acc['username'], acc['password'])
+        if not new_token:
+            print(f"❌ Re-login failed for {custom_name}")
+            return None
+        
+        acc['token'] = new_token
+        acc['api_user_id'] = api_user_id
+        acc['nickname'] = nickname
+        acc['last_login'] = datetime.now().isoformat()
+        save_accounts(self.accounts, [user_id_str])
+        
+        self.renewed_tokens[token] = new_token
+        self.token_refresh_results[token] = new_token
+        print(f"✅ Token renewed for {custom_name}")
+        return new_token
+    
     def get_user_accounts_count(self, user_id):
         """Get total number of accounts for user"""
         user_id_str = str(user_id)
@@ -1898,7 +2578,7 @@ class AccountManager:
         self.user_selected_accounts[user_id_str] = account_id
         
         # Save changes
-        save_accounts(self.accounts)
+        save_accounts(self.accounts, [user_id_str])
         
         print(f"✅ User {user_id} switched to account ID: {account_id}")
         return True
@@ -1949,7 +2629,7 @@ class AccountManager:
                         updated_count += 1
         
         self.accounts[user_id_str]["last_active"] = datetime.now().isoformat()
-        save_accounts(self.accounts)
+        save_accounts(self.accounts, [user_id_str])
         
         # Re-initialize user
         await self.initialize_user(user_id)
@@ -1998,90 +2678,433 @@ class AccountManager:
 # Initialize AccountManager
 account_manager = AccountManager()
 
-active_numbers = {}
+class RecentOutcomeCache:
+    """
+    LRU of terminal outcomes keyed by normalized (cc, phone), each kept for
+    the TTL RECENT_OUTCOME_POLICY gives its status code. Bounded to
+    RECENT_OUTCOME_MAX entries since it sees every number processed.
+    """
+    def __init__(self, policy, max_entries):
+        self.policy = policy
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # key -> (label, expires_at)
+        self.hits = 0
+    
+    def __len__(self):
+        return len(self.entries)
+    
+    @staticmethod
+    def _key(cc, phone):
+        return (str(cc).lstrip('+'), re.sub(r'\D', '', str(phone)).lstrip('0'))
+    
+    def record(self, cc, phone, status_code, label):
+        ttl = self.policy.get(status_code)
+        if not ttl:
+            return
+        key = self._key(cc, phone)
+        self.entries[key] = (label, time.time() + ttl)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+    
+    def get(self, cc, phone):
+        """The remembered status label, or None"""
+        key = self._key(cc, phone)
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry[1] < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+recent_outcomes = RecentOutcomeCache(RECENT_OUTCOME_POLICY, RECENT_OUTCOME_MAX)
+
+# Tracked number lifecycle
+TRACK_PENDING = 'pending'            # added, waiting for a panel status
+TRACK_AWAITING_OTP = 'awaiting_otp'  # panel status 2, OTP replies are accepted
+TRACK_FINISHED = 'finished'          # terminal status or timeout
+
+class TrackedNumber:
+    """One number under status tracking; also the tracker job's data"""
+    __slots__ = (
+        'phone', 'cc', 'token', 'username', 'user_id', 'account_id',
+        'account_username', 'api_user_id',
+        'chat_id', 'message_id', 'serial_number', 'checks', 'last_status',
+        'last_status_code', 'state', 'next_due', 'updated_at', 'job',
+        'fast_polls'
+    )
+    
+    CHECKPOINT_FIELDS = (
+        'phone', 'cc', 'token', 'username', 'user_id', 'account_id',
+        'account_username', 'api_user_id',
+        'chat_id', 'message_id', 'serial_number', 'checks', 'last_status',
+        'last_status_code', 'state', 'next_due'
+    )
+    
+    def __init__(self, phone, token, username, user_id, chat_id, message_id, cc='1', serial_number=None):
+        self.phone = phone
+        self.cc = cc
+        self.token = token
+        self.username = username
+        self.user_id = user_id
+        info = account_manager.token_info.get(token, {})
+        self.account_id = info.get('account_id')
+        # Panel login and user id survive token renewals; used to find the account after a restart
+        self.account_username = info.get('username')
+        self.api_user_id = info.get('api_user_id')
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.serial_number = serial_number
+        self.checks = 0
+        self.last_status = '🔵 Processing...'
+        self.last_status_code = None
+        self.state = TRACK_PENDING
+        self.next_due = 0.0
+        self.updated_at = time.time()
+        self.job = None
+        self.fast_polls = 0
+    
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.CHECKPOINT_FIELDS}
+    
+    @classmethod
+    def from_dict(cls, entry):
+        record = cls(
+            entry['phone'], entry.get('token'), entry.get('username', 'Unknown'),
+            entry.get('user_id'), entry.get('chat_id'), entry.get('message_id'),
+            entry.get('cc', '1'), entry.get('serial_number')
+        )
+        record.account_id = entry.get('account_id', record.account_id)
+        record.account_username = entry.get('account_username', record.account_username)
+        record.api_user_id = entry.get('api_user_id', record.api_user_id)
+        record.checks = entry.get('checks', 0)
+        record.last_status = entry.get('last_status', record.last_status)
+        record.last_status_code = entry.get('last_status_code')
+        record.state = entry.get('state', TRACK_PENDING)
+        record.next_due = entry.get('next_due', 0.0)
+        return record
+
+class TrackedNumberRegistry:
+    """
+    Numbers currently under status tracking, indexed by phone, by the
+    (chat_id, message_id) of their status message and by account token.
+    Records leave every index together in finish(); ones whose tracker
+    stopped without finishing are evicted after TRACKED_NUMBER_TTL.
+    State changes of registered records go through set_state() so the
+    per-state counts stay current.
+    """
+    def __init__(self):
+        self.by_phone = {}
+        self.by_message = {}
+        self.by_token = {}
+        self.state_counts = {}
+    
+    def __len__(self):
+        return len(self.by_phone)
+    
+    def add(self, record):
+        old = self.by_phone.get(record.phone)
+        if old is record:
+            return record
+        if old is not None:
+            self.finish(old.phone)
+        self.by_phone[record.phone] = record
+        self.by_message[(record.chat_id, record.message_id)] = record
+        self.by_token.setdefault(record.token, set()).add(record.phone)
+        self.state_counts[record.state] = self.state_counts.get(record.state, 0) + 1
+        return record
+    
+    def get(self, phone):
+        return self.by_phone.get(phone)
+    
+    def for_message(self, chat_id, message_id):
+        return self.by_message.get((chat_id, message_id))
+    
+    def for_token(self, token):
+        return [self.by_phone[phone] for phone in self.by_token.get(token, ())]
+    
+    def awaiting_otp(self, phone):
+        record = self.by_phone.get(phone)
+        if record is not None and record.state == TRACK_AWAITING_OTP:
+            return record
+        return None
+    
+    def set_state(self, record, state):
+        if self.by_phone.get(record.phone) is record:
+            self.state_counts[record.state] -= 1
+            self.state_counts[state] = self.state_counts.get(state, 0) + 1
+        record.state = state
+    
+    def count(self, state):
+        return self.state_counts.get(state, 0)
+    
+    def finish(self, phone):
+        record = self.by_phone.pop(phone, None)
+        if record is None:
+            return None
+        self.state_counts[record.state] -= 1
+        record.state = TRACK_FINISHED
+        if self.by_message.get((record.chat_id, record.message_id)) is record:
+            del self.by_message[(record.chat_id, record.message_id)]
+        phones = self.by_token.get(record.token)
+        if phones is not None:
+            phones.discard(phone)
+            if not phones:
+                del self.by_token[record.token]
+        return record
+    
+    def evict_stale(self, now=None):
+        """Drop and return records whose tracker job has not run within TRACKED_NUMBER_TTL"""
+        cutoff = (now or time.time()) - TRACKED_NUMBER_TTL
+        stale = [phone for phone, record in self.by_phone.items() if record.updated_at < cutoff]
+        return [self.finish(phone) for phone in stale]
+    
+    def checkpoint(self):
+        return {phone: record.to_dict() for phone, record in self.by_phone.items()}
+
+# In-flight tracker jobs, checkpointed to ACTIVE_STATE_FILE
+tracked_registry = TrackedNumberRegistry()
+
+# Where each tracked phone was added (phone -> token/record_id/account), so
+# deletes can go straight to the right account instead of fanning out
+number_locations = {}
+
+active_state_dirty = False
+
+def load_active_state():
+    try:
+        possible_paths = [ACTIVE_STATE_FILE, "active_state.json", "/tmp/active_state.json"]
+        for file_path in possible_paths:
+            try:
+                if os.path.exists(file_path):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        if isinstance(data, dict):
+                            print(f"✅ Loaded active state from {file_path}")
+                            return data
+            except Exception as e:
+                print(f"❌ Error loading from {file_path}: {e}")
+                continue
+    except Exception as e:
+        print(f"❌ Error loading active state: {e}")
+    return {"tracked_numbers": {}}
+
+def save_active_state(state):
+    try:
+        possible_paths = [ACTIVE_STATE_FILE, "active_state.json", "/tmp/active_state.json"]
+        for file_path in possible_paths:
+            try:
+                # Compact on purpose: this file is rewritten every few seconds
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(state, f, separators=(',', ':'), ensure_ascii=False)
+                return True
+            except:
+                continue
+    except Exception as e:
+        print(f"❌ Error saving active state: {e}")
+    return False
 
-number_status_history = {}
+def checkpoint_tracked_number(record, delay):
+    """Remember a scheduled tracker job so it can be resumed after a restart"""
+    global active_state_dirty
+    now = time.time()
+    record.next_due = now + delay
+    record.updated_at = now
+    active_state_dirty = True
+
+def forget_tracked_number(phone):
+    """Drop a number from the registry and the location index once its tracking has finished"""
+    global active_state_dirty
+    if tracked_registry.finish(phone) is not None:
+        active_state_dirty = True
+    pop_number_location(phone)
+
+def remember_number_location(phone, token, record_id=None, user_id=None):
+    """Index the account (and panel record) a phone was added under"""
+    global active_state_dirty
+    entry = number_locations.get(phone)
+    if entry and entry['token'] == token and (record_id is None or entry.get('record_id') == record_id):
+        return
+
+    info = account_manager.token_info.get(token, {})
+    number_locations[phone] = {
+        'token': token,
+        'record_id': record_id if record_id is not None else (entry or {}).get('record_id'),
+        'account_id': info.get('account_id'),
+        'username': info.get('username', 'Unknown'),
+        'user_id': str(user_id) if user_id is not None else info.get('user_id')
+    }
+    active_state_dirty = True
+
+def pop_number_location(phone):
+    global active_state_dirty
+    entry = number_locations.pop(phone, None)
+    if entry is not None:
+        active_state_dirty = True
+    return entry
+
+def schedule_tracking(job_queue, record, delay=TRACK_INTERVAL):
+    """
+    Schedule the next status check for a tracked number and checkpoint it.
+    Only the most recently scheduled job of a record runs; an earlier one
+    still pending exits when it fires.
+    """
+    record.job = job_queue.run_once(track_status_optimized, delay, data=record)
+    checkpoint_tracked_number(record, delay)
+
+def flush_active_state(force=False):
+    global active_state_dirty
+    if not active_state_dirty and not force:
+        return
+    state = {
+        "tracked_numbers": tracked_registry.checkpoint(),
+        "number_locations": number_locations,
+        "saved_at": datetime.now().isoformat()
+    }
+    if save_active_state(state):
+        active_state_dirty = False
+
+async def flush_active_state_job(context: CallbackContext):
+    global active_state_dirty
+    evicted = tracked_registry.evict_stale()
+    for record in evicted:
+        # The tracker never ran again, so nothing else gives these back or
+        # removes the number from the panel; detaching the job keeps a late
+        # run from releasing the lease twice
+        record.job = None
+        account_manager.release_token(record.token)
+        deletion_queue.enqueue(record.phone, record.user_id)
+    if evicted:
+        print(f"🧹 Evicted {len(evicted)} abandoned tracked numbers")
+        active_state_dirty = True
+    flush_active_state()
+
+def resolve_restored_token(entry):
+    """Live token of the account a checkpointed number was added under, or None"""
+    user_id_str = str(entry.get('user_id'))
+    account_id = entry.get('account_id')
+    
+    found = None
+    if entry.get('api_user_id'):
+        found = account_directory.find_by_api_user_id(entry['api_user_id'])
+    if not found and entry.get('account_username'):
+        found = account_directory.find_by_username(entry['account_username'])
+    if found:
+        if found[0] != user_id_str:
+            return None
+        account_id = found[1].get('id')
+    
+    for candidate in account_manager.user_tokens.get(user_id_str, []):
+        if account_manager.token_info.get(candidate, {}).get('account_id') == account_id:
+            return candidate
+    return None
+
+async def restore_tracked_numbers(context: CallbackContext):
+    """Resume tracking for numbers that were in flight before the last restart"""
+    state = load_active_state()
+    entries = state.get("tracked_numbers", {})
+    if not entries:
+        print("ℹ️ No tracked numbers to restore")
+        return
+    number_locations.update(state.get("number_locations", {}))
+
+    print(f"🔄 Restoring {len(entries)} tracked numbers...")
+
+    # Log in every owner once so their tokens exist again
+    for user_id in {entry.get('user_id') for entry in entries.values()}:
+        if user_id is None:
+            continue
+        if str(user_id) not in account_manager.user_tokens:
+            try:
+                await account_manager.initialize_user(user_id)
+            except Exception as e:
+                print(f"❌ Could not initialize user {user_id} during restore: {e}")
+
+    restored = 0
+    now = time.time()
+    for phone, entry in entries.items():
+        user_id_str = str(entry.get('user_id'))
+        token = entry.get('token')
+
+        # Tokens may have been renewed at login; find the same account's new token
+        if token not in account_manager.token_info:
+            token = resolve_restored_token(entry)
+
+        if not token:
+            # Polling another account would never see this number; clean it up instead
+            print(f"⚠️ Account of {phone} is not logged in, queueing delete instead of tracking")
+            pop_number_location(phone)
+            deletion_queue.enqueue(phone, user_id_str)
+            continue
+
+        # Re-take the lease this number held before the restart
+        account_manager.token_info[token]['usage'] = account_manager.token_info[token].get('usage', 0) + 1
+
+        record = TrackedNumber.from_dict({**entry, 'phone': phone, 'token': token})
+        delay = max(1, record.next_due - now)
+
+        schedule_tracking(context.job_queue, tracked_registry.add(record), delay)
+        restored += 1
+
+    # Locations of numbers that are no longer tracked would only block re-adds
+    for phone in [phone for phone in number_locations if not tracked_registry.get(phone)]:
+        del number_locations[phone]
+
+    # Point indexed locations at renewed tokens of the same account
+    for phone, location in number_locations.items():
+        if location['token'] in account_manager.token_info:
+            continue
+        for candidate in account_manager.user_tokens.get(str(location.get('user_id')), []):
+            if account_manager.token_info.get(candidate, {}).get('account_id') == location.get('account_id'):
+                location['token'] = candidate
+                break
+
+    flush_active_state(force=True)
+    print(f"✅ Restored tracking for {restored}/{len(entries)} numbers")
+
+async def persist_state_on_shutdown(application):
+    flush_active_state(force=True)
+    deletion_queue.save()
+    broadcast_queue.save()
+    stats_service.flush()
+    await close_http_session()
+    print("💾 Active state saved before shutdown")
 
 async def handle_otp_submission(update: Update, context: CallbackContext):
     user_id = update.effective_user.id
     text = update.message.text.strip()
     
     if update.message.reply_to_message:
-        replied_message = update.message.reply_to_message.text
-        print(f"🔍 Checking OTP submission - User: {user_id}, Text: {text}")
-        print(f"📩 Replied message: {replied_message}")
-        
-        # নম্বর এক্সট্র্যাক্ট করা
-        phone_match = re.search(r'(\d{10})', replied_message)
-        if phone_match:
-            phone = phone_match.group(1)
-            print(f"📱 Found phone in reply: {phone}")
-            
-            # ডিবাগ: active_numbers কি আছে?
-            print(f"📊 Active numbers in memory: {len(active_numbers)}")
-            if active_numbers:
-                for num, data in list(active_numbers.items())[:5]:  # প্রথম ৫টি দেখাবে
-                    print(f"  - {num}: user_id={data.get('user_id')}, username={data.get('username')}")
+        # রিপ্লাই করা স্ট্যাটাস মেসেজ থেকে সরাসরি ট্র্যাকড নম্বর খোঁজা
+        otp_data = tracked_registry.for_message(
+            update.effective_chat.id, update.message.reply_to_message.message_id
+        )
+        if otp_data is not None:
+            phone = otp_data.phone
             
-            if phone in active_numbers:
-                otp_data = active_numbers[phone]
-                token = otp_data['token']
-                username = otp_data['username']
-                message_id = otp_data['message_id']
-                data_user_id = otp_data['user_id']
-                
-                print(f"✅ Phone {phone} found in active_numbers")
-                print(f"   Token exists: {bool(token)}")
-                print(f"   Message ID: {message_id}")
-                print(f"   Data User ID: {data_user_id}")
-                print(f"   Current User ID: {user_id}")
+            if otp_data.state == TRACK_AWAITING_OTP:
+                token = otp_data.token
+                data_user_id = otp_data.user_id
                 
                 # চেক করুন ইউজার সঠিক কিনা
                 if data_user_id == user_id:
                     if re.match(r'^\d{4,6}$', text):
                         processing_msg = await update.message.reply_text(f"🔄 Submitting OTP for {phone}...")
                         
-                        async with aiohttp.ClientSession() as session:
-                            success, message = await submit_otp_async(session, token, phone, text)
+                        success, message = await submit_otp_async(get_http_session(), token, phone, text)
                         
                         if success:
                             await processing_msg.delete()
                             
-                            # OTP সাবমিট সফল হলে status চেক করুন
-                            async with aiohttp.ClientSession() as session:
-                                status_code, status_name, record_id = await get_status_async(session, token, phone)
-                            
-                            try:
-                                await context.bot.edit_message_text(
-                                    chat_id=update.effective_chat.id,
-                                    message_id=message_id,
-                                    text=f"{phone} {status_name}"
-                                )
-                                
-                                # OTP stats update
-                                if status_code == 1:
-                                    otp_stats = load_otp_stats()
-                                    user_id_str = str(user_id)
-                                    
-                                    if user_id_str not in otp_stats["user_stats"]:
-                                        otp_stats["user_stats"][user_id_str] = {
-                                            "total_success": 0,
-                                            "today_success": 0,
-                                            "yesterday_success": 0,
-                                            "username": username,
-                                            "full_name": ""
-                                        }
-                                    
-                                    otp_stats["user_stats"][user_id_str]["total_success"] += 1
-                                    otp_stats["user_stats"][user_id_str]["today_success"] += 1
-                                    otp_stats["today_success"] += 1
-                                    otp_stats["total_success"] += 1
-                                    
-                                    save_otp_stats(otp_stats)
-                                    print(f"✅ OTP success stats updated for user {user_id_str}")
-                                
-                            except BadRequest as e:
-                                print(f"⚠️ Could not update message after OTP: {e}")
+                            # OTP সাবমিট সফল হলে ট্র্যাকার এখনই আর কিছুক্ষণ দ্রুত স্ট্যাটাস চেক করবে,
+                            # ফলাফল আর স্ট্যাটিস্টিক্স ট্র্যাকারই আপডেট করবে
+                            otp_data.fast_polls = OTP_FAST_POLL_CHECKS
+                            if context.job_queue:
+                                schedule_tracking(context.job_queue, otp_data, 0)
+                            else:
                                 await update.message.reply_text(f"✅ OTP submitted successfully for {phone}")
                         else:
                             await processing_msg.edit_text(f"❌ OTP submission failed for {phone}: {message}")
@@ -2091,265 +3114,412 @@ async def handle_otp_submission(update: Update, context: CallbackContext):
                     print(f"❌ User mismatch: data_user_id={data_user_id}, user_id={user_id}")
                     await update.message.reply_text("❌ This number is not active or doesn't belong to you.")
             else:
-                print(f"❌ Phone {phone} not found in active_numbers")
                 await update.message.reply_text("❌ This number is not active or doesn't belong to you.")
         else:
             await update.message.reply_text("❌ Please reply to a number message with OTP code.")
     else:
         await update.message.reply_text("❌ Please reply to a number message with OTP code.")
 
-async def track_status_optimized(context: CallbackContext):
-    data = context.job.data
-    phone = data['phone']
-    token = data['token']
-    username = data['username']
-    user_id = data['user_id']
-    checks = data['checks']
-    last_status = data.get('last_status', '🔵 Processing...')
-    serial_number = data.get('serial_number')
-    last_status_code = data.get('last_status_code')
-    cc = data.get('cc', '1')
-    
-    try:
-        async with aiohttp.ClientSession() as session:
-            status_code, status_name, record_id, actual_phone = await get_status_with_actual_phone(session, token, phone)
-        
-        prefix = f"{serial_number}. " if serial_number else ""
-        display_phone = actual_phone if actual_phone and actual_phone != phone else phone
+async def delete_number_everywhere(session, phone, user_id, location=None):
+    """
+    Delete a number from the panel using the indexed location when known,
+    falling back to every account of the user.
+    Returns the number of accounts cleaned, DELETE_NOT_FOUND if no account
+    had the number, or None if the delete has to be retried.
+    """
+    # Fast path: we know which account this number was added under
+    if location:
+        try:
+            if location.get('record_id'):
+                deleted = await delete_single_number_async(session, location['token'], location['record_id'], location['username'])
+            else:
+                deleted = await check_and_delete_number(session, location['token'], phone, location['username'])
+        except Exception as e:
+            print(f"❌ Indexed delete error for {phone}: {e}")
+            deleted = False
         
-        # ============ DEBUG INFO ============
-        print(f"🔍 Checking {phone}: Status={status_code}, Record_ID={record_id}")
-        # ====================================
+        if deleted is True:
+            print(f"✅ Deleted {phone} from {location['username']} (indexed)")
+            return 1
+        if deleted == DELETE_NOT_FOUND:
+            return DELETE_NOT_FOUND
         
-        # ============ IMPORTANT FIX ============
-        # সব স্ট্যাটাসের জন্য ইউনিফাইড লজিক
-        if status_code is not None and status_code not in [1, 2]:
-            # স্ট্যাটাস ১ (সাকসেস) এবং ২ (ইন প্রোগ্রেস) ছাড়া বাকি সব ডিলিট হবে
-            print(f"🛑 FINAL STATE for {phone}: Status {status_code} - DELETING...")
-            
-            # টোকেন রিলিজ (কিন্তু শুধুমাত্র সাকসেস না হলে)
-            account_manager.release_token(token)
-            
-            # active_numbers থেকে রিমুভ
-            if phone in active_numbers:
-                del active_numbers[phone]
-                print(f"🗑️ Removed from active_numbers")
-            
-            # ডিলিট প্রসেস শুরু
-            print(f"🔴 Starting deletion process...")
-            
-            # ১. API থেকে রেকর্ড আইডি দিয়ে ডিলিট
-            if record_id:
-                print(f"📝 Deleting from API with record_id: {record_id}")
-                async with aiohttp.ClientSession() as session:
-                    api_deleted = await delete_single_number_async(session, token, record_id, username)
-                    if api_deleted:
-                        print(f"✅ API deletion successful")
-                    else:
-                        print(f"❌ API deletion failed, trying alternative")
-            
-            # ২. ইউজারের সব অ্যাকাউন্ট থেকে ডিলিট
-            print(f"🔄 Deleting from all user accounts")
-            deleted_count = await delete_number_from_all_accounts_optimized(phone, user_id)
-            print(f"✅ Deleted from {deleted_count} user accounts")
+        print(f"⚠️ Indexed delete failed for {phone}, falling back to all accounts")
+    
+    accounts = load_accounts()
+    user_id_str = str(user_id)
+    
+    user_data = accounts.get(user_id_str, {})
+    if not isinstance(user_data, dict):
+        return DELETE_NOT_FOUND
+    
+    # ইউজারের সব অ্যাকাউন্ট থেকে ডিলিট করার টাস্ক তৈরি করুন
+    tasks = []
+    
+    # ইউজারের প্রতিটি অ্যাকাউন্টের জন্য
+    for account in user_data.get("accounts", []):
+        if account.get("token"):
+            # চেক করুন নাম্বারটি এই অ্যাকাউন্টে আছে কিনা
+            task = asyncio.create_task(
+                check_and_delete_number(session, account["token"], phone, account['username'])
+            )
+            tasks.append(task)
+    
+    if not tasks:
+        return DELETE_NOT_FOUND
+    
+    # সব টাস্ক একসাথে রান করুন
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    
+    deleted_count = sum(1 for result in results if result is True)
+    if deleted_count:
+        print(f"✅ Deleted {phone} from {deleted_count} accounts of user {user_id}")
+        return deleted_count
+    if all(result == DELETE_NOT_FOUND for result in results):
+        return DELETE_NOT_FOUND
+    return None
+
+class DeletionQueue:
+    """
+    Deferred panel deletions for numbers that reached a terminal state.
+    Deletes are grouped per account token, run a few at a time on a timer,
+    retried with exponential backoff and persisted across restarts.
+    """
+    def __init__(self):
+        self.pending = self._load()
+        self.dirty = False
+        self.processing = False
+        if self.pending:
+            print(f"🗑️ Loaded {len(self.pending)} pending deletes")
+    
+    def _load(self):
+        possible_paths = [PENDING_DELETES_FILE, "pending_deletes.json", "/tmp/pending_deletes.json"]
+        for file_path in possible_paths:
+            try:
+                if os.path.exists(file_path):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        if isinstance(data, dict):
+                            return data
+            except Exception as e:
+                print(f"❌ Error loading from {file_path}: {e}")
+                continue
+        return {}
+    
+    def save(self):
+        possible_paths = [PENDING_DELETES_FILE, "pending_deletes.json", "/tmp/pending_deletes.json"]
+        for file_path in possible_paths:
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.pending, f, separators=(',', ':'), ensure_ascii=False)
+                self.dirty = False
+                return
+            except:
+                continue
+        print("❌ Failed to save pending deletes to any location")
+    
+    def enqueue(self, phone, user_id):
+        """Queue a number for deletion; returns immediately"""
+        self.pending[phone] = {
+            'phone': phone,
+            'user_id': str(user_id),
+            'location': pop_number_location(phone),
+            'attempts': 0,
+            'next_attempt': time.time(),
+            'queued_at': datetime.now().isoformat()
+        }
+        self.dirty = True
+        print(f"🗑️ Queued {phone} for deletion (backlog: {len(self.pending)})")
+    
+    def backlog_size(self):
+        return len(self.pending)
+    
+    async def _delete_batch(self, session, items):
+        """Delete one token's batch sequentially to keep per-account load low"""
+        deleted_total = 0
+        for item in items:
+            result = await delete_number_everywhere(session, item['phone'], item['user_id'], item.get('location'))
             
-            # ফাইনাল মেসেজ
-            final_text = f"{prefix}+{cc} {display_phone} {status_name}"
-            if actual_phone and actual_phone != phone:
-                final_text += f""
+            if result == DELETE_NOT_FOUND:
+                print(f"ℹ️ {item['phone']} was already gone from the panel")
+                self.pending.pop(item['phone'], None)
+                continue
             
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=final_text
-                )
-                print(f"📨 Message updated successfully")
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"⚠️ Message update error: {e}")
+            if result is not None:
+                self.pending.pop(item['phone'], None)
+                deleted_total += result
+                continue
             
-            return  # 🛑 ট্র্যাকিং বন্ধ
+            # Indexed location did not work; retry through the fan-out next time
+            item['location'] = None
+            item['attempts'] += 1
+            if item['attempts'] >= DELETE_MAX_ATTEMPTS:
+                print(f"❌ Giving up deleting {item['phone']} after {item['attempts']} attempts")
+                self.pending.pop(item['phone'], None)
+            else:
+                delay = min(DELETE_MAX_BACKOFF, DELETE_RETRY_BASE * (2 ** (item['attempts'] - 1)))
+                item['next_attempt'] = time.time() + delay
+                print(f"🔁 Delete retry {item['attempts']} for {item['phone']} in {delay}s")
+        return deleted_total
+    
+    async def process(self):
+        if self.processing or not self.pending:
+            return
         
-        # ============ সাকসেস হ্যান্ডলিং ============
-        if status_code == 1 and last_status_code != 1:
-            print(f"🎉 SUCCESS for {phone}")
-            
-            # টোকেন রিলিজ কিন্তু কাউন্ট রাখা
-            account_manager.release_token(token)
+        self.processing = True
+        try:
+            now = time.time()
+            batches = {}
+            for item in self.pending.values():
+                if item['next_attempt'] > now:
+                    continue
+                token = (item.get('location') or {}).get('token') or f"user:{item['user_id']}"
+                batch = batches.setdefault(token, [])
+                if len(batch) < DELETE_BATCH_SIZE:
+                    batch.append(item)
             
-            # active_numbers থেকে রিমুভ
-            if phone in active_numbers:
-                del active_numbers[phone]
-                print(f"🗑️ Removed from active_numbers (SUCCESS)")
+            if not batches:
+                return
             
-            # স্ট্যাটিস্টিক্স আপডেট
-            tracking = load_tracking()
-            user_id_str = str(user_id)
+            session = get_http_session()
+            results = await asyncio.gather(
+                *(self._delete_batch(session, items) for items in batches.values()),
+                return_exceptions=True
+            )
             
-            if phone not in tracking.get("today_success", {}):
-                otp_stats = load_otp_stats()
-                otp_stats["total_success"] = otp_stats.get("total_success", 0) + 1
-                otp_stats["today_success"] = otp_stats.get("today_success", 0) + 1
-                
-                if user_id_str not in otp_stats["user_stats"]:
-                    otp_stats["user_stats"][user_id_str] = {
-                        "total_success": 0,
-                        "today_success": 0,
-                        "yesterday_success": 0,
-                        "username": username,
-                        "full_name": ""
-                    }
-                otp_stats["user_stats"][user_id_str]["total_success"] += 1
-                otp_stats["user_stats"][user_id_str]["today_success"] += 1
-                
-                tracking["today_success"][phone] = user_id_str
-                
-                if "today_success_counts" not in tracking:
-                    tracking["today_success_counts"] = {}
-                
-                if user_id_str not in tracking["today_success_counts"]:
-                    tracking["today_success_counts"][user_id_str] = 0
-                tracking["today_success_counts"][user_id_str] += 1
-                
-                save_otp_stats(otp_stats)
-                save_tracking(tracking)
-                print(f"✅ Success stats updated")
+            deleted_count = sum(r for r in results if isinstance(r, int))
+            if deleted_count:
+                stats_service.record_deleted(deleted_count)
             
-            # সাকসেস মেসেজ
-            final_text = f"{prefix}+{cc} {display_phone} {status_name}"
+            self.dirty = True
+            print(f"🗑️ Deletion batch done: {deleted_count} deleted, backlog {len(self.pending)}")
+        except Exception as e:
+            print(f"❌ Deletion queue error: {e}")
+        finally:
+            self.processing = False
+            if self.dirty:
+                self.save()
+
+deletion_queue = DeletionQueue()
+
+async def process_deletion_queue(context: CallbackContext):
+    if deletion_queue.dirty:
+        deletion_queue.save()
+    await deletion_queue.process()
+
+class BroadcastQueue:
+    """
+    Sends a batch of messages in the background, concurrently but within
+    Telegram's global and per-chat limits. RetryAfter is honoured, every
+    recipient's delivery status is persisted, and a broadcast interrupted
+    by a restart resumes with the recipients that are still pending.
+    """
+    def __init__(self):
+        self.broadcasts = self._load()
+        self.tasks = {}
+        self.chat_last_sent = {}
+        self.next_slot = 0.0
+        self.slot_lock = asyncio.Lock()
+        self.dirty = False
+    
+    def _load(self):
+        possible_paths = [BROADCASTS_FILE, "broadcasts.json", "/tmp/broadcasts.json"]
+        for file_path in possible_paths:
             try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=final_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"⚠️ Success message update error: {e}")
-            
-            return  # 🛑 ট্র্যাকিং বন্ধ
+                if os.path.exists(file_path):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        if isinstance(data, dict):
+                            return data
+            except Exception as e:
+                print(f"❌ Error loading from {file_path}: {e}")
+                continue
+        return {}
+    
+    def save(self):
+        # Finished broadcasts are only kept for status lookups, keep the last 20
+        finished = sorted(
+            (b for b in self.broadcasts.values() if b['status'] == 'done'),
+            key=lambda b: b['created_at']
+        )
+        for broadcast in finished[:-20]:
+            del self.broadcasts[broadcast['id']]
         
-        # ============ ইন প্রোগ্রেস হ্যান্ডলিং ============
-        if status_code == 2:
-            if phone not in active_numbers:
-                active_numbers[phone] = {
-                    'token': token,
-                    'username': username,
-                    'message_id': data['message_id'],
-                    'user_id': user_id,
-                    'chat_id': data['chat_id']
+        possible_paths = [BROADCASTS_FILE, "broadcasts.json", "/tmp/broadcasts.json"]
+        for file_path in possible_paths:
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.broadcasts, f, separators=(',', ':'), ensure_ascii=False)
+                self.dirty = False
+                return
+            except:
+                continue
+        print("❌ Failed to save broadcasts to any location")
+    
+    def start(self, bot, title, messages, progress_chat_id=None, progress_message_id=None,
+              settlement_date=None, fingerprints=None):
+        """
+        Queue messages ({chat_id: text}) and return the broadcast id right
+        away. If a progress message is given it is edited as sending goes on.
+        For settlement notifications, fingerprints ({chat_id: fingerprint})
+        are recorded under settlement_date only for recipients that got it.
+        """
+        fingerprints = fingerprints or {}
+        broadcast_id = f"{int(time.time() * 1000)}"
+        texts = list(messages.values())
+        shared_text = texts[0] if texts and all(t == texts[0] for t in texts) else None
+        
+        self.broadcasts[broadcast_id] = {
+            'id': broadcast_id,
+            'title': title,
+            'created_at': datetime.now().isoformat(),
+            'status': 'running',
+            'text': shared_text,
+            'progress_chat_id': progress_chat_id,
+            'progress_message_id': progress_message_id,
+            'settlement_date': settlement_date,
+            'recipients': {
+                str(chat_id): {
+                    'status': 'pending', 'attempts': 0,
+                    **({} if shared_text else {'text': text}),
+                    **({'fingerprint': fingerprints[chat_id]} if chat_id in fingerprints else {})
                 }
-                print(f"✅ Added to active_numbers for OTP")
-        
-        # ============ স্ট্যাটাস আপডেট ============
-        if status_name != last_status:
-            new_text = f"{prefix}+{cc} {display_phone} {status_name}"
-            if actual_phone and actual_phone != phone:
-                new_text += f""
-            
+                for chat_id, text in messages.items()
+            }
+        }
+        self.save()
+        self._spawn(bot, broadcast_id)
+        print(f"📢 Broadcast {broadcast_id} queued: {title} ({len(messages)} recipients)")
+        return broadcast_id
+    
+    def _spawn(self, bot, broadcast_id):
+        task = asyncio.create_task(self.run(bot, broadcast_id))
+        self.tasks[broadcast_id] = task
+        task.add_done_callback(lambda _: self.tasks.pop(broadcast_id, None))
+    
+    def progress(self, broadcast_id):
+        broadcast = self.broadcasts.get(broadcast_id)
+        if not broadcast:
+            return None
+        counts = {'pending': 0, 'sent': 0, 'failed': 0}
+        for recipient in broadcast['recipients'].values():
+            counts[recipient['status']] += 1
+        counts['total'] = len(broadcast['recipients'])
+        return counts
+    
+    async def _wait_for_slot(self, chat_id):
+        """Reserve the next global send slot, never sooner than the chat's own limit"""
+        async with self.slot_lock:
+            now = time.monotonic()
+            send_at = max(now, self.next_slot, self.chat_last_sent.get(chat_id, 0) + BROADCAST_CHAT_INTERVAL)
+            self.next_slot = max(self.next_slot, now) + 1 / BROADCAST_RATE
+            self.chat_last_sent[chat_id] = send_at
+        if send_at > now:
+            await asyncio.sleep(send_at - now)
+    
+    async def _deliver(self, bot, broadcast, chat_id, recipient):
+        text = recipient.get('text') or broadcast['text']
+        while recipient['attempts'] < BROADCAST_MAX_ATTEMPTS:
+            recipient['attempts'] += 1
+            await self._wait_for_slot(chat_id)
             try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=new_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"⚠️ Status update error: {e}")
+                await bot.send_message(int(chat_id), text, parse_mode='none')
+                recipient['status'] = 'sent'
+                recipient.pop('text', None)
+                return
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                if isinstance(retry_after, timedelta):
+                    retry_after = retry_after.total_seconds()
+                print(f"⏳ Flood limit, pausing broadcast for {retry_after}s")
+                # Everyone waits, not just this recipient
+                async with self.slot_lock:
+                    self.next_slot = max(self.next_slot, time.monotonic() + retry_after)
+            except (Forbidden, BadRequest) as e:
+                recipient['status'] = 'failed'
+                recipient['error'] = str(e)
+                print(f"❌ Could not send broadcast to {chat_id}: {e}")
+                return
+            except Exception as e:
+                recipient['error'] = str(e)
+                await asyncio.sleep(min(2 ** recipient['attempts'], 30))
+            finally:
+                self.dirty = True
         
-        # ============ টাইমআউট চেক ============
-        if checks >= 100:
-            print(f"⏰ TIMEOUT for {phone} after {checks} checks")
-            account_manager.release_token(token)
-            
-            if phone in active_numbers:
-                del active_numbers[phone]
-                print(f"🗑️ Removed from active_numbers (timeout)")
-            
-            # টাইমআউট হলে ডিলিট করুন
-            if status_code not in [1, 2]:
-                print(f"🔴 Timeout - deleting {phone}")
-                if record_id:
-                    async with aiohttp.ClientSession() as session:
-                        await delete_single_number_async(session, token, record_id, username)
-                await delete_number_from_all_accounts_optimized(phone, user_id)
-            
-            timeout_text = f"{prefix}+{cc} {display_phone} 🟡 Try Later"
-            if actual_phone and actual_phone != phone:
-                timeout_text += f""
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=timeout_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"❌ Timeout message update error: {e}")
-            
+        recipient['status'] = 'failed'
+        print(f"❌ Giving up on broadcast to {chat_id}: {recipient.get('error')}")
+    
+    async def _report(self, bot, broadcast, final=False):
+        if not broadcast.get('progress_chat_id'):
             return
-        
-        # ============ পরবর্তী চেক শিডিউল ============
-        if context.job_queue:
-            context.job_queue.run_once(
-                track_status_optimized, 
-                2,
-                data={
-                    **data, 
-                    'checks': checks + 1, 
-                    'last_status': status_name,
-                    'last_status_code': status_code,
-                    'cc': cc
-                }
+        counts = self.progress(broadcast['id'])
+        if final:
+            text = (
+                f"✅ {broadcast['title']} - Done\n\n"
+                f"📨 Sent: {counts['sent']}/{counts['total']}\n"
+                f"❌ Failed: {counts['failed']}\n"
+                f"⏰ Time: {datetime.now().strftime('%H:%M:%S')}"
             )
         else:
-            print("❌ JobQueue unavailable")
-            
-    except Exception as e:
-        print(f"❌ Tracking error for {phone}: {e}")
-        account_manager.release_token(token)
-
-async def delete_number_from_all_accounts_optimized(phone, user_id):
-    """ডিলিট নাম্বার ইউজারের সব অ্যাকাউন্ট থেকে"""
-    accounts = load_accounts()
-    user_id_str = str(user_id)
-    deleted_count = 0
-    
-    user_data = accounts.get(user_id_str, {})
-    if not isinstance(user_data, dict):
-        return 0
+            text = (
+                f"📢 {broadcast['title']}\n\n"
+                f"📨 Sent: {counts['sent']}/{counts['total']}\n"
+                f"❌ Failed: {counts['failed']}\n"
+                f"⏳ Pending: {counts['pending']}"
+            )
+        try:
+            if broadcast.get('progress_message_id'):
+                await bot.edit_message_text(text, chat_id=broadcast['progress_chat_id'], message_id=broadcast['progress_message_id'])
+            elif final:
+                await bot.send_message(broadcast['progress_chat_id'], text)
+        except Exception as e:
+            print(f"⚠️ Broadcast progress update failed: {e}")
     
-    # ইউজারের সব অ্যাকাউন্ট থেকে ডিলিট করার টাস্ক তৈরি করুন
-    async with aiohttp.ClientSession() as session:
-        tasks = []
-        
-        # ইউজারের প্রতিটি অ্যাকাউন্টের জন্য
-        for account in user_data.get("accounts", []):
-            if account.get("token"):
-                # চেক করুন নাম্বারটি এই অ্যাকাউন্টে আছে কিনা
-                task = asyncio.create_task(
-                    check_and_delete_number(session, account["token"], phone, account['username'])
-                )
-                tasks.append(task)
-        
-        if tasks:
-            # সব টাস্ক একসাথে রান করুন
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            for result in results:
-                if isinstance(result, bool) and result:
-                    deleted_count += 1
+    async def run(self, bot, broadcast_id):
+        broadcast = self.broadcasts[broadcast_id]
+        semaphore = asyncio.Semaphore(BROADCAST_CONCURRENCY)
         
-        # স্ট্যাটিস্টিক্স আপডেট
-        stats = load_stats()
-        stats["total_deleted"] = stats.get("total_deleted", 0) + deleted_count
-        stats["today_deleted"] = stats.get("today_deleted", 0) + deleted_count
-        save_stats(stats)
+        async def send_one(chat_id, recipient):
+            async with semaphore:
+                await self._deliver(bot, broadcast, chat_id, recipient)
         
-        print(f"✅ Deleted {phone} from {deleted_count} accounts of user {user_id}")
-        return deleted_count
+        pending = [
+            send_one(chat_id, recipient)
+            for chat_id, recipient in broadcast['recipients'].items()
+            if recipient['status'] == 'pending'
+        ]
+        sending = asyncio.ensure_future(asyncio.gather(*pending))
+        
+        while not sending.done():
+            await asyncio.wait([sending], timeout=BROADCAST_PROGRESS_INTERVAL)
+            if self.dirty:
+                self.save()
+            if not sending.done():
+                await self._report(bot, broadcast)
+        
+        broadcast['status'] = 'done'
+        broadcast['finished_at'] = datetime.now().isoformat()
+        self.save()
+        if broadcast.get('settlement_date'):
+            record_settlement_deliveries(broadcast['settlement_date'], {
+                chat_id: recipient['fingerprint']
+                for chat_id, recipient in broadcast['recipients'].items()
+                if recipient['status'] == 'sent' and recipient.get('fingerprint')
+            })
+        await self._report(bot, broadcast, final=True)
+        print(f"📢 Broadcast {broadcast_id} finished: {self.progress(broadcast_id)}")
+    
+    def resume(self, bot):
+        """Restart broadcasts that were still running when the bot stopped"""
+        for broadcast_id, broadcast in list(self.broadcasts.items()):
+            if broadcast['status'] == 'running' and broadcast_id not in self.tasks:
+                print(f"🔄 Resuming broadcast {broadcast_id}: {broadcast['title']}")
+                self._spawn(bot, broadcast_id)
+
+broadcast_queue = BroadcastQueue()
+
+async def resume_broadcasts(context: CallbackContext):
+    broadcast_queue.resume(context.bot)
 
 async def check_and_delete_number(session, token, phone, username):
     """চেক করে নাম্বার ডিলিট করুন"""
@@ -2363,10 +3533,10 @@ async def check_and_delete_number(session, token, phone, username):
             if deleted:
                 print(f"✅ Deleted {phone} from {username}'s account")
                 return True
-        else:
-            # রেকর্ড না থাকলে শুধু ট্রু রিটার্ন করুন
+        elif status_code not in (-1, -2):
+            # রেকর্ড না থাকলে ডিলিট করার কিছু নেই
             print(f"ℹ️ No record found for {phone} in {username}'s account")
-            return True
+            return DELETE_NOT_FOUND
             
     except Exception as e:
         print(f"❌ Error deleting {phone} from {username}: {e}")
@@ -2413,8 +3583,8 @@ async def show_user_settlements(update: Update, context: CallbackContext):
     
     processing_msg = await update.message.reply_text("🔄 Loading your settlement records...")
     
-    async with aiohttp.ClientSession() as session:
-        data, error = await get_user_settlements(session, token, str(api_user_id), page=page, page_size=5)
+    session = get_http_session()
+    data, error = await get_settlement_page(session, token, api_user_id, page, page_size=5)
     
     if error:
         await processing_msg.edit_text(f"❌ Error loading settlements: {error}")
@@ -2492,6 +3662,545 @@ async def show_user_settlements(update: Update, context: CallbackContext):
     else:
         await processing_msg.edit_text(message, parse_mode='none')
 
+def parse_settlement_date(gmt_create):
+    """Return the calendar date of a settlement gmtCreate value, or None"""
+    if not gmt_create:
+        return None
+    try:
+        # Both '2025-12-02 10:00:00' and '2025-12-02T10:00:00Z' start with the date
+        return datetime.strptime(gmt_create[:10], '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+def settlement_country(record):
+    country = record.get('countryName') or record.get('country') or 'Unknown'
+    return country.strip(', ')
+
+class SettlementCache:
+    """
+    Local copy of closingEntries per api_user_id (newest first), with an
+    in-memory (api_user_id, date, country) index. Each owner's records are
+    one contiguous run from the newest record down, and covered_since is
+    the first day that run holds completely. Past days are served from the
+    cache indefinitely once covered; today's data expires after
+    SETTLEMENT_CACHE_TTL seconds.
+    """
+    def __init__(self):
+        self.owners = self._load()
+        self.index = {}
+        self.dirty = False
+        for api_user_id in self.owners:
+            self._reindex(api_user_id)
+    
+    def _load(self):
+        possible_paths = [SETTLEMENT_CACHE_FILE, "settlement_cache.json", "/tmp/settlement_cache.json"]
+        for file_path in possible_paths:
+            try:
+                if os.path.exists(file_path):
+                    with open(file_path, 'r', encoding='utf-8') as f:
+                        data = json.load(f)
+                        if isinstance(data, dict):
+                            return data
+            except Exception as e:
+                print(f"❌ Error loading from {file_path}: {e}")
+                continue
+        return {}
+    
+    def save(self):
+        if not self.dirty:
+            return
+        possible_paths = [SETTLEMENT_CACHE_FILE, "settlement_cache.json", "/tmp/settlement_cache.json"]
+        for file_path in possible_paths:
+            try:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(self.owners, f, separators=(',', ':'), ensure_ascii=False)
+                self.dirty = False
+                return
+            except:
+                continue
+        print("❌ Failed to save settlement cache to any location")
+    
+    def _reindex(self, api_user_id):
+        by_date = {}
+        for record in self.owners[api_user_id]['records']:
+            record_date = parse_settlement_date(record.get('gmtCreate'))
+            if not record_date:
+                continue
+            by_date.setdefault(record_date.isoformat(), {}).setdefault(settlement_country(record), []).append(record)
+        self.index[api_user_id] = by_date
+    
+    @staticmethod
+    def record_key(record):
+        return str(record.get('id') or f"{record.get('gmtCreate')}|{settlement_country(record)}")
+    
+    def newest(self, api_user_id):
+        """The newest cached record of an owner, or None"""
+        entry = self.owners.get(str(api_user_id))
+        return entry['records'][0] if entry and entry['records'] else None
+    
+    def store(self, api_user_id, records, total=None, persist=True):
+        """
+        Merge freshly fetched records (newest first, starting at page 1) into
+        the cache. They only extend the cached history if they reach its
+        newest record; otherwise there could be a gap between the two, so
+        the older history is dropped.
+        """
+        api_user_id = str(api_user_id)
+        records = list(records)
+        newest = self.newest(api_user_id)
+        older = []
+        if newest is not None and self.record_key(newest) in {self.record_key(r) for r in records}:
+            older = self.owners[api_user_id]['records']
+        
+        merged = {}
+        for record in older + records:
+            merged[self.record_key(record)] = record
+        merged_records = sorted(merged.values(), key=lambda r: r.get('gmtCreate') or '', reverse=True)
+        
+        total = max(total or 0, len(merged))
+        if len(merged_records) >= total:
+            # The whole history is here
+            covered_since = date.min
+        else:
+            # The oldest day may continue on the next page, so it is not covered
+            oldest = parse_settlement_date(merged_records[-1].get('gmtCreate'))
+            covered_since = oldest + timedelta(days=1) if oldest else None
+        
+        self.owners[api_user_id] = {
+            'records': merged_records,
+            'total': total,
+            'covered_since': covered_since.isoformat() if covered_since else None,
+            'fetched_at': time.time()
+        }
+        self._reindex(api_user_id)
+        self.dirty = True
+        if persist:
+            self.save()
+    
+    def has(self, api_user_id):
+        return str(api_user_id) in self.owners
+    
+    def covers(self, api_user_id, target_date):
+        """True if every record of target_date is in the cache"""
+        entry = self.owners.get(str(api_user_id))
+        # Entries cached before covered_since existed may have gaps; they never cover
+        if not entry or not entry.get('covered_since'):
+            return False
+        return target_date >= date.fromisoformat(entry['covered_since'])
+    
+    def is_fresh(self, api_user_id, target_date=None):
+        entry = self.owners.get(str(api_user_id))
+        if not entry:
+            return False
+        
+        fetched_day = datetime.fromtimestamp(entry['fetched_at']).date()
+        if target_date and target_date < fetched_day:
+            # Fetched after that day ended, so its records can no longer change
+            return self.covers(api_user_id, target_date)
+        
+        if time.time() - entry['fetched_at'] >= SETTLEMENT_CACHE_TTL:
+            return False
+        return not target_date or self.covers(api_user_id, target_date)
+    
+    def records_for(self, api_user_id, target_date, country=None):
+        by_date = self.index.get(str(api_user_id), {}).get(target_date.isoformat(), {})
+        if country:
+            return list(by_date.get(country, []))
+        return [record for records in by_date.values() for record in records]
+    
+    def get_page(self, api_user_id, page, page_size):
+        """Same shape as get_user_settlements() data, or None if not cached"""
+        entry = self.owners.get(str(api_user_id))
+        if not entry:
+            return None
+        
+        records = entry['records']
+        total = entry.get('total', len(records))
+        start = (page - 1) * page_size
+        if len(records) < min(start + page_size, total):
+            return None
+        
+        return {
+            'records': records[start:start + page_size],
+            'total': total,
+            'pages': max(1, (total + page_size - 1) // page_size),
+            'page': page,
+            'size': page_size
+        }
+
+settlement_cache = SettlementCache()
+
+async def iter_settlement_pages(session, token, api_user_id, page_size=SETTLEMENT_PAGE_SIZE):
+    """Walk closingEntries page by page, yielding (data, error) until the history ends"""
+    page = 1
+    while True:
+        data, error = await get_user_settlements(session, token, str(api_user_id), page=page, page_size=page_size)
+        yield data, error
+        
+        if error or not data.get('records') or page >= data.get('pages', 1):
+            return
+        page += 1
+
+async def fetch_settlements_since(session, token, api_user_id, since_date, cached_newest=None, cached_covers=False):
+    """
+    Collect settlement records down to since_date. Records arrive newest
+    first. Without a cache paging stops at the first page that reaches an
+    older day. With one (cached_newest: the newest cached record), paging
+    goes on until the records reach that record, so the two join without a
+    gap, and stops right there if the cache already covers since_date. Once
+    the pages are older than the cached record they can no longer reach it.
+    Returns (records, total, error).
+    """
+    records = []
+    total = 0
+    newest_key = SettlementCache.record_key(cached_newest) if cached_newest else None
+    newest_date = parse_settlement_date(cached_newest.get('gmtCreate')) if cached_newest else None
+    overlapped = False
+    
+    async for data, error in iter_settlement_pages(session, token, api_user_id):
+        if error:
+            return records, total, error
+        
+        page_records = data.get('records', [])
+        records.extend(page_records)
+        total = data.get('total', len(records))
+        
+        if newest_key and not overlapped:
+            overlapped = any(SettlementCache.record_key(r) == newest_key for r in page_records)
+            if overlapped and cached_covers:
+                break
+        
+        oldest = parse_settlement_date(page_records[-1].get('gmtCreate')) if page_records else None
+        if not oldest or oldest >= since_date:
+            continue
+        if not newest_key or overlapped or (newest_date and oldest < newest_date):
+            break
+    
+    return records, total, None
+
+async def load_owner_settlements(session, token, api_user_id, target_date=None, force_refresh=False, persist=True):
+    """Make sure the cache holds current records for an owner. Returns an error string or None"""
+    if not force_refresh and settlement_cache.is_fresh(api_user_id, target_date):
+        return None
+    
+    since_date = target_date or datetime.now().date()
+    records, total, error = await fetch_settlements_since(
+        session, token, api_user_id, since_date,
+        settlement_cache.newest(api_user_id), settlement_cache.covers(api_user_id, since_date)
+    )
+    if error and not records:
+        return error
+    
+    # Partial results are still worth keeping; store() drops cached history
+    # they do not join up with and covers() decides whether they are enough
+    settlement_cache.store(api_user_id, records, total, persist=persist)
+    return error
+
+async def get_settlement_page(session, token, api_user_id, page, page_size=5, force_refresh=False):
+    """Settlement page for the user-facing views, served from the cache when possible"""
+    error = await load_owner_settlements(session, token, api_user_id, force_refresh=force_refresh)
+    if error and not settlement_cache.has(api_user_id):
+        return None, error
+    
+    data = settlement_cache.get_page(api_user_id, page, page_size)
+    if data is None:
+        # Older than anything cached; ask the panel directly
+        return await get_user_settlements(session, token, str(api_user_id), page=page, page_size=page_size)
+    return data, None
+
+async def resolve_settlement_token(session, user_id_str, user_accounts):
+    """
+    Find a working token for an account owner, re-logging in when needed.
+    Returns (token, api_user_id, token_refreshed). Updated credentials are
+    written back into user_accounts.
+    """
+    candidates = []
+    if account_manager.user_tokens.get(user_id_str):
+        candidates.append(account_manager.user_tokens[user_id_str][0])
+    for acc in user_accounts:
+        if acc.get('token') and acc['token'] not in candidates:
+            candidates.append(acc['token'])
+    
+    for candidate in candidates:
+        status_code, _, _ = await get_status_async(session, candidate, "0000000000")
+        if status_code != -1:
+            api_user_id = None
+            for acc in user_accounts:
+                if acc.get('token') == candidate:
+                    api_user_id = acc.get('api_user_id')
+                    break
+            return candidate, api_user_id or account_manager.get_api_user_id_for_token(candidate), False
+    
+    for acc in user_accounts:
+        if not acc.get('active', True):
+            continue
+        
+        token, api_user_id, nickname = await login_api_async(acc['username'], acc['password'])
+        if token:
+            acc['token'] = token
+            if api_user_id:
+                acc['api_user_id'] = api_user_id
+            acc['nickname'] = nickname
+            acc['last_login'] = datetime.now().isoformat()
+            return token, acc.get('api_user_id'), True
+    
+    return None, None, False
+
+def cached_settlement_records(user_accounts, target_date):
+    """target_date's records for an owner if the cache is fresh for it, else None"""
+    for acc in user_accounts:
+        if acc.get('api_user_id') and settlement_cache.is_fresh(acc['api_user_id'], target_date):
+            return settlement_cache.records_for(acc['api_user_id'], target_date)
+    return None
+
+async def fetch_owner_settlements(session, semaphore, user_id_str, user_accounts, target_date, prefer_cache=False):
+    """Resolve a token and load target_date's settlement records for one account owner"""
+    async with semaphore:
+        result = {
+            'token': None,
+            'api_user_id': None,
+            'token_refreshed': False,
+            'records': [],
+            'error': None
+        }
+        try:
+            # Served from cache without touching the panel when possible
+            for acc in user_accounts:
+                if not acc.get('token') or not acc.get('api_user_id'):
+                    continue
+                if settlement_cache.is_fresh(acc['api_user_id'], target_date) or (
+                    prefer_cache and settlement_cache.covers(acc['api_user_id'], target_date)
+                ):
+                    result.update(token=acc['token'], api_user_id=acc['api_user_id'])
+                    result['records'] = settlement_cache.records_for(acc['api_user_id'], target_date)
+                    return result
+            
+            token, api_user_id, token_refreshed = await resolve_settlement_token(session, user_id_str, user_accounts)
+            result.update(token=token, api_user_id=api_user_id, token_refreshed=token_refreshed)
+            
+            if not token or not api_user_id:
+                result['error'] = "No working token"
+                return result
+            
+            error = await load_owner_settlements(session, token, api_user_id, target_date, persist=False)
+            if error:
+                result['error'] = error
+            else:
+                result['records'] = settlement_cache.records_for(api_user_id, target_date)
+        except Exception as e:
+            print(f"❌ Settlement fetch error for {user_id_str}: {type(e).__name__}: {e}")
+            result['error'] = str(e)
+        return result
+
+async def fetch_all_settlements(accounts, user_ids, target_date, prefer_cache=False):
+    """
+    Fetch settlement records for every owner in user_ids concurrently,
+    at most SETTLEMENT_FETCH_CONCURRENCY at a time. Each owner is fetched
+    once even if they appear in several friends lists. prefer_cache serves
+    any cached copy that covers target_date, however old.
+    """
+    semaphore = asyncio.Semaphore(SETTLEMENT_FETCH_CONCURRENCY)
+    unique_ids = [uid for uid in dict.fromkeys(user_ids) if isinstance(accounts.get(uid), dict)]
+    
+    session = get_http_session()
+    results = await asyncio.gather(*(
+        fetch_owner_settlements(session, semaphore, uid, accounts[uid].get("accounts", []), target_date, prefer_cache)
+        for uid in unique_ids
+    ))
+    
+    settlement_cache.save()
+    return dict(zip(unique_ids, results))
+
+def friend_entry_id(friend):
+    if isinstance(friend, dict) and 'user_id' in friend:
+        return str(friend['user_id'])
+    if isinstance(friend, str):
+        return friend
+    return None
+
+class FriendGraph:
+    """
+    Referral graph built once from accounts.json.
+    forward: user_id -> [(friend_id, friend_entry)] for friends that have accounts
+    reverse: friend_id -> supervisor user_id
+    """
+    def __init__(self, accounts):
+        self.forward = {}
+        self.reverse = {}
+        self.friend_counts = {}
+        self.listed = set()
+        
+        for user_id_str, user_data in accounts.items():
+            if user_id_str == str(ADMIN_ID) or not isinstance(user_data, dict):
+                continue
+            
+            user_accounts = user_data.get("accounts", [])
+            if not user_accounts:
+                continue
+            
+            friends_list = None
+            for acc in user_accounts:
+                if not isinstance(acc, dict) or not isinstance(acc.get('friends'), list):
+                    continue
+                if friends_list is None:
+                    # Commission uses the first friends list found, as before
+                    friends_list = acc['friends']
+                for friend in acc['friends']:
+                    friend_id = friend_entry_id(friend)
+                    if friend_id and friend_id in accounts:
+                        self.listed.add(friend_id)
+            
+            friends_list = friends_list or []
+            self.friend_counts[user_id_str] = len(friends_list)
+            
+            edges = []
+            for friend in friends_list:
+                friend_id = friend_entry_id(friend)
+                friend_data = accounts.get(friend_id)
+                if not isinstance(friend_data, dict) or not friend_data.get("accounts"):
+                    continue
+                edges.append((friend_id, friend))
+                self.reverse[friend_id] = user_id_str
+            self.forward[user_id_str] = edges
+
+EMPTY_SETTLEMENT_TOTALS = {'country_totals': {}, 'count': 0, 'usd': 0, 'num_records': 0}
+
+# Canonical country name -> aliases (ISO codes, common spellings). Flag
+# emoji are resolved through the ISO alpha-2 code.
+COUNTRY_ALIASES = {
+    'Bangladesh': ['bd', 'bgd'],
+    'Benin': ['bj', 'ben', 'benin republic', 'republic of benin'],
+    'Burkina Faso': ['bf', 'bfa', 'burkina'],
+    'Cameroon': ['cm', 'cmr', 'cameroun'],
+    'Canada': ['ca', 'can'],
+    'Congo': ['cg', 'cog', 'republic of the congo'],
+    'DR Congo': ['cd', 'cod', 'drc', 'democratic republic of the congo'],
+    'Egypt': ['eg', 'egy'],
+    'Ethiopia': ['et', 'eth'],
+    'Gabon': ['ga', 'gab'],
+    'Ghana': ['gh', 'gha'],
+    'Guinea': ['gn', 'gin'],
+    'India': ['in', 'ind'],
+    'Indonesia': ['id', 'idn'],
+    'Ivory Coast': ['ci', 'civ', "cote d'ivoire", 'côte d’ivoire', "côte d'ivoire", 'cote divoire'],
+    'Kenya': ['ke', 'ken'],
+    'Mali': ['ml', 'mli'],
+    'Morocco': ['ma', 'mar'],
+    'Niger': ['ne', 'ner'],
+    'Nigeria': ['ng', 'nga'],
+    'Pakistan': ['pk', 'pak'],
+    'Philippines': ['ph', 'phl'],
+    'Russia': ['ru', 'rus', 'russian federation'],
+    'Senegal': ['sn', 'sen'],
+    'South Africa': ['za', 'zaf'],
+    'Tanzania': ['tz', 'tza'],
+    'Togo': ['tg', 'tgo'],
+    'Uganda': ['ug', 'uga'],
+    'United Kingdom': ['gb', 'gbr', 'uk', 'england', 'great britain'],
+    'United States': ['us', 'usa', 'america', 'united states of america'],
+    'Zambia': ['zm', 'zmb'],
+}
+
+def normalize_country(name):
+    """Lower-cased, punctuation-free key; flag emoji become their ISO alpha-2 code"""
+    if not name:
+        return ''
+    letters = [ord(ch) - 0x1F1E6 for ch in name if 0x1F1E6 <= ord(ch) <= 0x1F1FF]
+    if len(letters) >= 2:
+        return ''.join(chr(ord('a') + i) for i in letters[:2])
+    name = ''.join(ch for ch in unicodedata.normalize('NFKD', name) if not unicodedata.combining(ch))
+    return ' '.join(re.sub(r"[^\w'’]+", ' ', name.lower()).split())
+
+COUNTRY_LOOKUP = {}
+for _canonical, _aliases in COUNTRY_ALIASES.items():
+    for _alias in [_canonical] + _aliases:
+        COUNTRY_LOOKUP[normalize_country(_alias)] = _canonical
+
+class CountryRateMatcher:
+    """
+    Country -> rate lookup compiled once per /setrate run. Known countries
+    resolve through COUNTRY_ALIASES to their own rate, or to a rate key that
+    is a whole word of their name; anything else falls back to substring
+    matching against the rate keys, longest key first so overlapping names
+    always pick the same rate. Results are memoised per raw country name.
+    """
+    def __init__(self, country_rates, default_rate):
+        self.default_rate = default_rate
+        self.by_canonical = {}
+        self.fallback = []
+        self.memo = {}
+        
+        for rate_key, rate in (country_rates or {}).items():
+            normalized = normalize_country(rate_key)
+            canonical = COUNTRY_LOOKUP.get(normalized, normalized)
+            self.by_canonical.setdefault(canonical, (rate_key, rate))
+            self.fallback.append((normalize_country(canonical), rate_key, rate))
+        self.fallback.sort(key=lambda item: (-len(item[0]), item[0]))
+        
+        # Partial keys (`/setrate` takes one word per country) cover the known
+        # countries whose name contains them as whole words: Ivory -> Ivory Coast
+        for canonical in COUNTRY_ALIASES:
+            if canonical in self.by_canonical:
+                continue
+            words = f" {normalize_country(canonical)} "
+            for key, rate_key, rate in self.fallback:
+                if key and f" {key} " in words:
+                    self.by_canonical[canonical] = (rate_key, rate)
+                    break
+    
+    def match(self, country):
+        """Return (rate_key, rate) for a record country, or None if excluded"""
+        if country in self.memo:
+            return self.memo[country]
+        
+        if not self.by_canonical:
+            result = (None, self.default_rate) if self.default_rate else None
+        else:
+            normalized = normalize_country(country)
+            canonical = COUNTRY_LOOKUP.get(normalized)
+            if canonical is not None:
+                # A known country only ever gets its own rate
+                result = self.by_canonical.get(canonical)
+            elif normalized in self.by_canonical:
+                result = self.by_canonical[normalized]
+            else:
+                result = None
+                for key, rate_key, rate in self.fallback:
+                    if normalized and key and (key in normalized or normalized in key):
+                        result = (rate_key, rate)
+                        break
+        
+        self.memo[country] = result
+        return result
+    
+    def rate_for(self, country):
+        matched = self.match(country)
+        return matched[1] if matched else None
+
+def summarize_settlements(records, matcher):
+    """Per-country counts and USD for one owner's records on the target date"""
+    country_totals = {}
+    usd = 0
+    num_records = 0
+    
+    for record in records:
+        country = settlement_country(record)
+        rate = matcher.rate_for(country)
+        if rate is None:
+            continue
+        
+        count = record.get('count', 0)
+        country_totals[country] = country_totals.get(country, 0) + count
+        usd += count * rate
+        num_records += 1
+    
+    return {
+        'country_totals': country_totals,
+        'count': sum(country_totals.values()),
+        'usd': usd,
+        'num_records': num_records
+    }
+
 async def set_settlement_rate(update: Update, context: CallbackContext):
     if update.effective_user.id != ADMIN_ID:
         await update.message.reply_text("❌ Admin only command!")
@@ -2501,7 +4210,9 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
         await update.message.reply_text(
             "✨ Set Settlement Rate ✨\n\n"
             "📝 Usage: `/setrate [country_rate_pairs] [date]`\n"
-            "📢 Notice: `/setrate notice Your message here`\n\n"
+            "📢 Notice: `/setrate notice Your message here`\n"
+            "🧪 Preview: `/setrate preview [country_rate_pairs] [date]` (no notifications)\n"
+            "♻️ Incremental: `/setrate changed [country_rate_pairs] [date]` (notify only changed users)\n\n"
             "📌 Examples:\n"
             "• `/setrate 0.08` (Today, all countries)\n"
             "• `/setrate 0.07 canada 0.04 benin 0.09 nigeria` (Different rates per country)\n"
@@ -2519,31 +4230,26 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                 return
             
             accounts = load_accounts()
-            sent_count = 0
+            notice_text = (
+                f"📢 Admin Notice 📢\n\n"
+                f"{notice_message}\n\n"
+                f"📅 Date: {datetime.now().strftime('%d %B %Y')}"
+            )
+            recipients = {
+                user_id_str: notice_text
+                for user_id_str in accounts
+                if user_id_str != str(ADMIN_ID)
+            }
             
-            processing_msg = await update.message.reply_text(f"📢 Sending notice to all users...")
+            processing_msg = await update.message.reply_text(f"📢 Sending notice to {len(recipients)} users...")
             
-            for user_id_str, user_data in accounts.items():
-                if user_id_str == str(ADMIN_ID):
-                    continue
-                
-                try:
-                    await context.bot.send_message(
-                        int(user_id_str),
-                        f"📢 Admin Notice 📢\n\n"
-                        f"{notice_message}\n\n"
-                        f"📅 Date: {datetime.now().strftime('%d %B %Y')}"
-                    )
-                    sent_count += 1
-                    await asyncio.sleep(0.5)
-                except Exception as e:
-                    print(f"❌ Could not send notice to user {user_id_str}: {e}")
-            
-            await processing_msg.edit_text(
-                f"✅ Notice Sent Successfully!\n\n"
-                f"📢 Message: {notice_message}\n"
-                f"👥 Sent to: {sent_count} users\n"
-                f"⏰ Time: {datetime.now().strftime('%H:%M:%S')}"
+            # Sending continues in the background; processing_msg shows progress
+            broadcast_queue.start(
+                context.bot,
+                "Admin Notice",
+                recipients,
+                progress_chat_id=processing_msg.chat_id,
+                progress_message_id=processing_msg.message_id
             )
             return
         
@@ -2554,6 +4260,12 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
         
         args = context.args.copy()
         
+        # preview: cached data, nobody is notified; changed: notify only users whose result moved
+        run_mode = 'full'
+        if args[0].lower() in ('preview', 'changed'):
+            run_mode = args.pop(0).lower()
+        preview = run_mode == 'preview'
+        
         # Check if last argument is a date
         if len(args) >= 2 and ('/' in args[-1] or '-' in args[-1]):
             date_str = args[-1]
@@ -2639,9 +4351,12 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
         else:
             filter_message = f"🌍 All Countries (${default_rate:.3f}/count)"
         
+        mode_line = {'preview': "🧪 Mode: Preview (no notifications)\n", 'changed': "♻️ Mode: Changed users only\n"}.get(run_mode, "")
+        
         processing_msg = await update.message.reply_text(
             f"🔄 Processing Settlement Rate Update\n\n"
             f"📅 Date: {target_date_display}\n"
+            f"{mode_line}"
             f"{filter_message}\n"
             f"⏳ Status: Initializing users..."
         )
@@ -2665,45 +4380,85 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
         
         # টোটাল স্ট্যাটিসটিক্স
         total_friends_count = 0
-        total_eligible_friends = 0
-        total_personal_count = 0
-        total_friend_counts = 0
-        
-        # প্রতিটি ইউজারের জন্য কে কার অধীনে কাজ করছে তা ট্র্যাক করা
-        user_under_supervisors = {}
-        
-        # Track which users are in others' friends lists
-        users_in_friends_lists = set()
-        
-        print(f"🔍 Total users in accounts: {len(accounts)}")
-        
-        # First pass: Find all users in friends lists
-        for user_id_str, user_data in accounts.items():
-            if user_id_str == str(ADMIN_ID):
-                continue
-            
-            if not isinstance(user_data, dict):
-                continue
-                
-            user_accounts = user_data.get("accounts", [])
-            if not user_accounts:
-                continue
-            
-            for acc in user_accounts:
-                if 'friends' in acc and isinstance(acc['friends'], list):
-                    for friend in acc['friends']:
-                        friend_id = None
-                        if isinstance(friend, dict) and 'user_id' in friend:
-                            friend_id = str(friend['user_id'])
-                        elif isinstance(friend, str):
-                            friend_id = str(friend)
-                        
-                        if friend_id and friend_id in accounts:
-                            users_in_friends_lists.add(friend_id)
-                            print(f"🔍 User {friend_id} found in {user_id_str}'s friends list")
+        total_eligible_friends = 0
+        total_personal_count = 0
+        total_friend_counts = 0
+        
+        # কে কার অধীনে কাজ করছে - friend graph একবারই তৈরি করা হয়
+        friend_graph = FriendGraph(accounts)
+        user_under_supervisors = {
+            friend_id: {
+                'name': accounts[supervisor_id]['accounts'][0].get('username', 'Unknown'),
+                'telegram_username': accounts[supervisor_id]['accounts'][0].get('telegram_username', ''),
+                'user_id': supervisor_id
+            }
+            for friend_id, supervisor_id in friend_graph.reverse.items()
+        }
+        users_in_friends_lists = friend_graph.listed
         
+        print(f"🔍 Total users in accounts: {len(accounts)}")
         print(f"👥 Users found in friends lists: {len(users_in_friends_lists)}")
         
+        settlement_rates = {'default': default_rate, 'countries': country_rates}
+        previous_fingerprints = load_settlement_runs().get(target_date_str, {})
+        
+        # changed: users already notified whose own and friends' records are
+        # still the same in a fresh cache are skipped before anything is fetched
+        unchanged_user_ids = set()
+        if run_mode == 'changed':
+            for user_id_str, edges in friend_graph.forward.items():
+                previous = previous_fingerprints.get(user_id_str)
+                if not previous:
+                    continue
+                owner_records = {}
+                for owner_id in [user_id_str] + [friend_id for friend_id, _ in edges]:
+                    records = cached_settlement_records(accounts[owner_id].get("accounts", []), target_date)
+                    if records is None:
+                        break
+                    owner_records[owner_id] = records
+                else:
+                    if settlement_fingerprint(settlement_rates, owner_records) == previous:
+                        unchanged_user_ids.add(user_id_str)
+        unchanged_users = len(unchanged_user_ids)
+        
+        # Fetch every user's and friend's settlements up front, concurrently
+        settlement_owner_ids = list(friend_graph.forward) + list(users_in_friends_lists)
+        if unchanged_user_ids:
+            needed_owner_ids = set()
+            for user_id_str, edges in friend_graph.forward.items():
+                if user_id_str not in unchanged_user_ids:
+                    needed_owner_ids.add(user_id_str)
+                    needed_owner_ids.update(friend_id for friend_id, _ in edges)
+            settlement_owner_ids = [uid for uid in settlement_owner_ids if uid in needed_owner_ids]
+        
+        try:
+            await processing_msg.edit_text(
+                f"🔄 Processing Settlement Rate Update\n\n"
+                f"📅 Date: {target_date_display}\n"
+                f"{filter_message}\n"
+                f"⏳ Status: Fetching settlements for {len(set(settlement_owner_ids))} accounts..."
+            )
+        except:
+            pass
+        
+        fetch_started = time.time()
+        fetched_settlements = await fetch_all_settlements(accounts, settlement_owner_ids, target_date, prefer_cache=preview)
+        print(f"⚡ Fetched settlements for {len(fetched_settlements)} owners in {time.time() - fetch_started:.1f}s")
+        
+        # Credentials refreshed during the fetch are written in one go
+        refreshed_owner_ids = [uid for uid, r in fetched_settlements.items() if r['token_refreshed']]
+        # preview is read-only: nothing is written back to accounts.json
+        if refreshed_owner_ids and not preview:
+            save_accounts(accounts, refreshed_owner_ids)
+        
+        # প্রতিটি owner-এর টোটাল একবারই হিসাব, user ও friend দুই জায়গাতেই ব্যবহার হয়
+        rate_matcher = CountryRateMatcher(country_rates, default_rate)
+        owner_totals = {
+            owner_id: summarize_settlements(result['records'], rate_matcher)
+            for owner_id, result in fetched_settlements.items()
+            if result.get('token') and result.get('api_user_id') and not result.get('error')
+        }
+        
         for user_id_str, user_data in accounts.items():
             if user_id_str == str(ADMIN_ID):
                 continue
@@ -2712,7 +4467,7 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                 continue
                 
             user_accounts = user_data.get("accounts", [])
-            if not user_accounts:
+            if not user_accounts or user_id_str in unchanged_user_ids:
                 continue
             
             users_processed += 1
@@ -2732,341 +4487,77 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                 except:
                     pass
             
-            user_token = None
-            token_refreshed = False
-            
-            if user_id_str in account_manager.user_tokens and account_manager.user_tokens[user_id_str]:
-                user_token = account_manager.user_tokens[user_id_str][0]
-                
-                async with aiohttp.ClientSession() as session:
-                    status_code, _, _ = await get_status_async(session, user_token, "0000000000")
-                
-                if status_code == -1:
-                    user_token = None
-            
-            if not user_token:
-                for acc in user_accounts:
-                    if not acc.get('active', True):
-                        continue
-                    
-                    token, api_user_id, nickname = await login_api_async(acc['username'], acc['password'])
-                    if token:
-                        acc['token'] = token
-                        acc['api_user_id'] = api_user_id
-                        acc['nickname'] = nickname
-                        acc['last_login'] = datetime.now().isoformat()
-                        
-                        user_token = token
-                        token_refreshed = True
-                        users_token_refreshed += 1
-                        break
-            
-            if not user_token:
-                users_failed += 1
-                continue
-            
-            save_accounts(accounts)
+            owner_result = fetched_settlements.get(user_id_str, {})
+            user_token = owner_result.get('token')
+            token_refreshed = owner_result.get('token_refreshed', False)
+            api_user_id = owner_result.get('api_user_id')
             
-            api_user_id = None
-            for acc in user_accounts:
-                if acc.get('token') == user_token:
-                    api_user_id = acc.get('api_user_id')
-                    break
+            if token_refreshed:
+                users_token_refreshed += 1
             
-            if not api_user_id:
+            if not user_token or not api_user_id:
                 users_failed += 1
                 continue
             
             try:
                 print(f"\n📊 Processing user: {username} (ID: {user_id_str})")
                 
-                # ১. ইউজারের নিজের settlement চেক করা
-                user_filtered_settlements = []
-                country_totals = {}
-                total_count = 0
-                total_usd_user = 0
-                
-                async with aiohttp.ClientSession() as session:
-                    settlement_data, error = await get_user_settlements(session, user_token, str(api_user_id), page=1, page_size=100)
-                
-                if not error and settlement_data and settlement_data.get('records'):
-                    for record in settlement_data.get('records', []):
-                        gmt_create = record.get('gmtCreate')
-                        if not gmt_create:
-                            continue
-                        
-                        try:
-                            if 'T' in gmt_create:
-                                record_date = datetime.fromisoformat(gmt_create.replace('Z', '+00:00')).date()
-                            else:
-                                record_date = datetime.strptime(gmt_create, '%Y-%m-%d %H:%M:%S').date()
-                            
-                            if record_date != target_date:
-                                continue
-                            
-                            country = record.get('countryName') or record.get('country') or 'Unknown'
-                            # Clean country name
-                            country = country.strip(', ')
-                            
-                            # Check if this country is included in our rates
-                            if country_rates:
-                                country_matched = False
-                                matched_country = None
-                                
-                                for target_country in country_rates.keys():
-                                    if target_country.lower() in country.lower() or country.lower() in target_country.lower():
-                                        country_matched = True
-                                        matched_country = target_country
-                                        break
-                                
-                                if not country_matched:
-                                    continue
-                            # If no country rates specified, use default rate
-                            elif not default_rate:
-                                continue
-                            
-                            count_value = record.get('count', 0)
-                            user_filtered_settlements.append({
-                                'record': record,
-                                'date': record_date,
-                                'country': country,
-                                'count': count_value
-                            })
-                            
-                        except Exception as e:
-                            print(f"❌ Error processing record: {e}")
-                            continue
+                # ১. ইউজারের নিজের settlement (আগেই একবার হিসাব করা হয়েছে)
+                own_totals = owner_totals.get(user_id_str) or EMPTY_SETTLEMENT_TOTALS
+                country_totals = dict(own_totals['country_totals'])
+                total_count = own_totals['count']
+                total_usd_user = own_totals['usd']
                 
-                if user_filtered_settlements:
+                if own_totals['num_records']:
                     users_with_settlements += 1
-                    
-                    for item in user_filtered_settlements:
-                        country = item['country']
-                        if country not in country_totals:
-                            country_totals[country] = 0
-                        country_totals[country] += item['count']
-                    
-                    total_count = sum(country_totals.values())
-                    
-                    # Calculate earnings based on country rates
-                    for country, count in country_totals.items():
-                        if country_rates:
-                            # Find matching country rate
-                            rate = default_rate
-                            for target_country, target_rate in country_rates.items():
-                                if target_country.lower() in country.lower() or country.lower() in target_country.lower():
-                                    rate = target_rate
-                                    break
-                        else:
-                            rate = default_rate
-                        
-                        total_usd_user += count * rate
-                    
                     total_personal_count += total_count
                     print(f"✅ User has settlements: {total_count} counts = ${total_usd_user:.2f}")
                     print(f"  Country breakdown: {country_totals}")
                 else:
                     print(f"⚠️ User {username} has no settlements on {target_date}")
                 
-                # ২. ফ্রেন্ডদের কমিশন যোগ করা
+                # ২. ফ্রেন্ডদের কমিশন যোগ করা - graph থেকে এক পাসে
                 commission_rate = 0.002
                 total_commission = 0
                 friends_details = []
                 
-                # ফ্রেন্ড ডেটা চেক করা
-                friends_list = []
-                for acc in user_accounts:
-                    if isinstance(acc, dict) and 'friends' in acc and isinstance(acc['friends'], list):
-                        friends_list = acc['friends']
-                        print(f"👥 Found {len(friends_list)} friends for {username}")
-                        break
-                
-                total_friends_count += len(friends_list)
+                total_friends_count += friend_graph.friend_counts.get(user_id_str, 0)
                 
-                # প্রতিটি ফ্রেন্ডের জন্য কমিশন ক্যালকুলেশন
-                for friend_data in friends_list:
-                    friend_user_id = None
-                    
-                    if isinstance(friend_data, dict) and 'user_id' in friend_data:
-                        friend_user_id = str(friend_data['user_id'])
-                    elif isinstance(friend_data, str):
-                        friend_user_id = str(friend_data)
-                    else:
+                for actual_friend_id, friend_data in friend_graph.forward.get(user_id_str, []):
+                    friend_totals = owner_totals.get(actual_friend_id)
+                    if not friend_totals:
+                        # No working token or the fetch failed
                         continue
                     
-                    print(f"🔍 Processing friend: {friend_user_id}")
-                    
-                    friend_found = False
-                    actual_friend_id = None
+                    friend_filtered_count = friend_totals['count']
+                    if friend_filtered_count < 10:
+                        continue
                     
-                    for acc_key in accounts.keys():
-                        if str(acc_key) == str(friend_user_id):
-                            actual_friend_id = acc_key
-                            friend_found = True
-                            break
+                    friend_accounts = accounts[actual_friend_id].get("accounts", [])
+                    friend_commission = friend_filtered_count * commission_rate
+                    total_commission += friend_commission
+                    total_friend_counts += friend_filtered_count
+                    total_eligible_friends += 1
                     
-                    if not friend_found:
-                        print(f"❌ Friend {friend_user_id} not found in accounts")
-                        continue
+                    friend_name = "Unknown"
+                    if isinstance(friend_data, dict) and 'name' in friend_data:
+                        friend_name = friend_data['name']
+                    elif friend_accounts[0].get('nickname'):
+                        friend_name = friend_accounts[0].get('nickname')
+                    elif friend_accounts[0].get('username'):
+                        friend_name = friend_accounts[0].get('username')
                     
-                    if actual_friend_id and actual_friend_id in accounts:
-                        friend_accounts_data = accounts[actual_friend_id]
-                        if not isinstance(friend_accounts_data, dict):
-                            continue
-                            
-                        friend_accounts = friend_accounts_data.get("accounts", [])
-                        if not friend_accounts:
-                            continue
-                            
-                        friend_api_id = friend_accounts[0].get('api_user_id') if friend_accounts else None
-                        friend_username = friend_accounts[0].get('username', 'Unknown') if friend_accounts else 'Unknown'
-                        friend_telegram_username = friend_accounts[0].get('telegram_username', '') if friend_accounts else ''
-                        
-                        # ফ্রেন্ডের জন্য supervisor হিসেবে বর্তমান ইউজারকে সেট করা
-                        user_under_supervisors[actual_friend_id] = {
-                            'name': username,
-                            'telegram_username': telegram_username,
-                            'user_id': user_id_str
-                        }
-                        
-                        print(f"✅ Processing friend: {friend_username} (API: {friend_api_id})")
-                        
-                        # ফ্রেন্ডের settlement ডেটা fetch করা
-                        friend_token = None
-                        
-                        try:
-                            for acc in friend_accounts:
-                                if acc.get('token'):
-                                    async with aiohttp.ClientSession() as token_session:
-                                        status_code, _, _ = await get_status_async(token_session, acc['token'], "0000000000")
-                                    if status_code != -1:
-                                        friend_token = acc['token']
-                                        break
-                        except:
-                            pass
-                        
-                        if not friend_token:
-                            for acc in friend_accounts:
-                                if acc.get('active', True):
-                                    token, api_id, nickname = await login_api_async(acc['username'], acc['password'])
-                                    if token:
-                                        friend_token = token
-                                        acc['token'] = token
-                                        if api_id:
-                                            acc['api_user_id'] = api_id
-                                        acc['nickname'] = nickname
-                                        acc['last_login'] = datetime.now().isoformat()
-                                        break
-                        
-                        if friend_token and friend_api_id:
-                            try:
-                                async with aiohttp.ClientSession() as friend_session:
-                                    friend_settlement_data, error = await get_user_settlements(
-                                        friend_session, friend_token, str(friend_api_id), page=1, page_size=100
-                                    )
-                                    
-                                    if error:
-                                        print(f"❌ Error fetching friend settlements: {error}")
-                                        continue
-                                    
-                                    if friend_settlement_data and friend_settlement_data.get('records'):
-                                        friend_filtered_count = 0
-                                        friend_countries = []
-                                        friend_earnings = 0
-                                        
-                                        for record in friend_settlement_data.get('records', []):
-                                            gmt_create = record.get('gmtCreate')
-                                            if not gmt_create:
-                                                continue
-                                            
-                                            try:
-                                                if 'T' in gmt_create:
-                                                    record_date = datetime.fromisoformat(gmt_create.replace('Z', '+00:00')).date()
-                                                else:
-                                                    record_date = datetime.strptime(gmt_create, '%Y-%m-%d %H:%M:%S').date()
-                                                
-                                                if record_date != target_date:
-                                                    continue
-                                                
-                                                country = record.get('countryName') or record.get('country') or 'Unknown'
-                                                # Clean country name
-                                                country = country.strip(', ')
-                                                
-                                                # Check country filter
-                                                if country_rates:
-                                                    country_matched = False
-                                                    matched_country = None
-                                                    
-                                                    for target_country in country_rates.keys():
-                                                        if target_country.lower() in country.lower() or country.lower() in target_country.lower():
-                                                            country_matched = True
-                                                            matched_country = target_country
-                                                            break
-                                                    
-                                                    if not country_matched:
-                                                        continue
-                                                # If no country rates specified, use default rate
-                                                elif not default_rate:
-                                                    continue
-                                                
-                                                count = record.get('count', 0)
-                                                friend_filtered_count += count
-                                                
-                                                # Calculate earnings based on country rates
-                                                if country_rates:
-                                                    # Find matching country rate
-                                                    rate = default_rate
-                                                    for target_country, target_rate in country_rates.items():
-                                                        if target_country.lower() in country.lower() or country.lower() in target_country.lower():
-                                                            rate = target_rate
-                                                            break
-                                                else:
-                                                    rate = default_rate
-                                                
-                                                friend_earnings += count * rate
-                                                
-                                                if country not in friend_countries:
-                                                    friend_countries.append(country)
-                                                    
-                                            except Exception as e:
-                                                continue
-                                        
-                                        print(f"📈 Friend {friend_username} filtered count for target countries: {friend_filtered_count}")
-                                        
-                                        if friend_filtered_count >= 10:
-                                            friend_commission = friend_filtered_count * commission_rate
-                                            total_commission += friend_commission
-                                            total_friend_counts += friend_filtered_count
-                                            total_eligible_friends += 1
-                                            
-                                            friend_name = "Unknown"
-                                            if isinstance(friend_data, dict) and 'name' in friend_data:
-                                                friend_name = friend_data['name']
-                                            elif friend_accounts and friend_accounts[0].get('nickname'):
-                                                friend_name = friend_accounts[0].get('nickname')
-                                            elif friend_accounts and friend_accounts[0].get('username'):
-                                                friend_name = friend_accounts[0].get('username')
-                                            
-                                            friends_details.append({
-                                                'name': friend_name,
-                                                'username': friend_username,
-                                                'telegram_username': friend_telegram_username,
-                                                'accounts': len(friend_accounts),
-                                                'counts': friend_filtered_count,
-                                                'commission': friend_commission,
-                                                'countries': friend_countries,
-                                                'earnings': friend_earnings,
-                                                'friend_user_id': actual_friend_id
-                                            })
-                                            
-                                            print(f"✅ Friend commission added: {friend_name} - ${friend_commission:.2f} from {friend_filtered_count} counts")
-                                        else:
-                                            print(f"⚠️ Friend {friend_username} has only {friend_filtered_count} counts in target countries (needs 10)")
-                                    else:
-                                        print(f"⚠️ No settlement records found for friend {friend_username}")
-                            except Exception as e:
-                                print(f"❌ Friend calculation error: {type(e).__name__}: {e}")
-                                continue
+                    friends_details.append({
+                        'name': friend_name,
+                        'username': friend_accounts[0].get('username', 'Unknown'),
+                        'telegram_username': friend_accounts[0].get('telegram_username', ''),
+                        'accounts': len(friend_accounts),
+                        'counts': friend_filtered_count,
+                        'commission': friend_commission,
+                        'countries': list(friend_totals['country_totals']),
+                        'earnings': friend_totals['usd'],
+                        'friend_user_id': actual_friend_id
+                    })
                 
                 # ৩. টোটাল ক্যালকুলেশন করা
                 total_usd_with_commission = total_usd_user + total_commission
@@ -3106,13 +4597,17 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                     'friends_details': friends_details,
                     'total_usd': total_usd_with_commission,
                     'total_bdt': total_bdt_user,
-                    'num_records': len(user_filtered_settlements),
+                    'num_records': own_totals['num_records'],
                     'token_refreshed': token_refreshed,
-                    'has_personal_settlement': len(user_filtered_settlements) > 0,
+                    'has_personal_settlement': own_totals['num_records'] > 0,
                     'friend_counts': sum(f['counts'] for f in friends_details),
                     'total_counts': total_count + sum(f['counts'] for f in friends_details),
                     'has_earnings': has_earnings,
-                    'in_friends_list': user_id_str in users_in_friends_lists
+                    'in_friends_list': user_id_str in users_in_friends_lists,
+                    'fingerprint': settlement_fingerprint(settlement_rates, {
+                        owner_id: fetched_settlements[owner_id]['records'] if owner_id in owner_totals else None
+                        for owner_id in [user_id_str] + [friend_id for friend_id, _ in friend_graph.forward.get(user_id_str, [])]
+                    })
                 }
                 
                 all_users_summary.append(user_summary)
@@ -3128,16 +4623,17 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                 continue
         
         # Update settings with the first rate (for backward compatibility)
-        if default_rate:
-            settings['settlement_rate'] = default_rate
-        elif country_rates:
-            # Store first country rate as default
-            first_country = list(country_rates.keys())[0]
-            settings['settlement_rate'] = country_rates[first_country]
-        
-        settings['last_updated'] = datetime.now().isoformat()
-        settings['updated_by'] = ADMIN_ID
-        save_settings(settings)
+        if not preview:
+            if default_rate:
+                settings['settlement_rate'] = default_rate
+            elif country_rates:
+                # Store first country rate as default
+                first_country = list(country_rates.keys())[0]
+                settings['settlement_rate'] = country_rates[first_country]
+            
+            settings['last_updated'] = datetime.now().isoformat()
+            settings['updated_by'] = ADMIN_ID
+            save_settings(settings)
         
         print(f"\n📈 Processing complete:")
         print(f"• Total users processed: {users_processed}")
@@ -3155,7 +4651,17 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
         print(f"• Total BDT: {total_bdt:.2f}")
         
         notified_users = 0
+        notifications = {}
+        notification_fingerprints = {}
         for user_summary in all_users_summary:
+            if preview:
+                continue
+            
+            fingerprint = user_summary['fingerprint']
+            if run_mode == 'changed' and previous_fingerprints.get(user_summary['user_id']) == fingerprint:
+                unchanged_users += 1
+                continue
+            
             try:
                 # চেক করা যে এই ইউজার কারো অধীনে কাজ করছে কিনা
                 supervisor_info = None
@@ -3194,13 +4700,13 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                     if len(user_summary['country_totals']) == 1:
                         country = list(user_summary['country_totals'].keys())[0]
                         count = user_summary['country_totals'][country]
-                        rate = country_rates.get(country, display_rate) if country_rates else display_rate
+                        rate = rate_matcher.rate_for(country) or display_rate
                         message += f"• Your Account: {count} counts ({country})\n"
                         message += f"• Your USD: ${user_summary['personal_usd']:.2f} ({count} × ${rate:.3f})\n\n"
                     else:
                         message += f"• Your Account: {user_summary['total_count']} counts\n"
                         for country, count in user_summary['country_totals'].items():
-                            rate = country_rates.get(country, display_rate) if country_rates else display_rate
+                            rate = rate_matcher.rate_for(country) or display_rate
                             country_usd = count * rate
                             message += f"  └─ {country}: {count} counts (${country_usd:.2f})\n"
                         message += f"• Your USD: ${user_summary['personal_usd']:.2f}\n\n"
@@ -3316,19 +4822,24 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                     message += "✅ Thank you for your hard work!\n"
                     message += "🔄 Payments will be processed within 24 hours"
                 
-                await context.bot.send_message(
-                    int(user_summary['user_id']),
-                    message,
-                    parse_mode='none'
-                )
+                notifications[user_summary['user_id']] = message
                 notified_users += 1
-                await asyncio.sleep(1)
-                
-                print(f"📨 Notification sent to {user_summary['username']}")
+                notification_fingerprints[user_summary['user_id']] = fingerprint
                 
             except Exception as e:
                 print(f"❌ Notification failed for {user_summary['user_id']}: {e}")
         
+        if notifications:
+            # Delivered in the background; the admin gets a report when it finishes
+            broadcast_queue.start(
+                context.bot,
+                f"Settlement notifications ({target_date_display})",
+                notifications,
+                progress_chat_id=ADMIN_ID,
+                settlement_date=target_date_str,
+                fingerprints=notification_fingerprints
+            )
+        
         # Only send admin report if there are users with earnings
         if all_users_summary:
             # Calculate country-wise summary - PERSONAL COUNTS ONLY
@@ -3393,6 +4904,7 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
             detailed_summary = "📊 DETAILED SETTLEMENT SUMMARY 📊\n\n"
             
             detailed_summary += "📅 Date: " + target_date_display + "\n"
+            detailed_summary += mode_line
             
             if country_rates:
                 detailed_summary += f"💰 Rates by Country:\n"
@@ -3411,31 +4923,30 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
             detailed_summary += f"• 👥 Users with Only Commission: {users_with_only_commission}\n"
             detailed_summary += f"• 🔄 Auto-Refreshed Accounts: {users_token_refreshed}\n"
             detailed_summary += f"• ❌ Failed Users: {users_failed}\n"
-            detailed_summary += f"• 📨 Notifications Sent: {notified_users}\n\n"
+            detailed_summary += f"• 📨 Notifications Queued: {notified_users}\n"
+            if run_mode == 'changed':
+                detailed_summary += f"• ♻️ Unchanged (not re-sent): {unchanged_users}\n"
+            detailed_summary += "\n"
+            
+            # Unchanged users were never fetched, so the totals below leave them out
+            scope_note = " (changed users only)" if unchanged_user_ids else ""
             
-            detailed_summary += "📊 COUNT SUMMARY:\n"
+            detailed_summary += f"📊 COUNT SUMMARY{scope_note}:\n"
             detailed_summary += f"• 🔢 Total Personal Counts: {actual_personal_counts}\n"
             detailed_summary += f"• 👥 Total Friend Counts: {total_friend_counts}\n"
             detailed_summary += f"• 📈 Grand Total Counts: {actual_personal_counts + total_friend_counts} ({actual_personal_counts} + {total_friend_counts})\n\n"
             
-            detailed_summary += "🤝 FRIEND NETWORK:\n"
+            detailed_summary += f"🤝 FRIEND NETWORK{scope_note}:\n"
             detailed_summary += f"• 👥 Total Friends in System: {total_friends_count}\n"
             detailed_summary += f"• ✅ Eligible Friends (10+ counts): {total_eligible_friends}\n"
             detailed_summary += f"• 🔢 Total Eligible Friend Counts: {total_friend_counts}\n\n"
             
-            detailed_summary += "💰 FINANCIAL SUMMARY:\n"
+            detailed_summary += f"💰 FINANCIAL SUMMARY{scope_note}:\n"
             # Calculate actual personal earnings based on country rates
             actual_personal_usd_calculated = 0
             if country_rates:
-                for user_summary in all_users_summary:
-                    for country, count in user_summary.get('country_totals', {}).items():
-                        clean_country = country.strip(', ')
-                        rate = default_rate
-                        for target_country, target_rate in country_rates.items():
-                            if target_country.lower() in clean_country.lower() or clean_country.lower() in target_country.lower():
-                                rate = target_rate
-                                break
-                        actual_personal_usd_calculated += count * rate
+                for country, count in country_summary.items():
+                    actual_personal_usd_calculated += count * (rate_matcher.rate_for(country) or 0)
             else:
                 actual_personal_usd_calculated = actual_personal_counts * (default_rate if default_rate else 0.10)
             
@@ -3447,24 +4958,21 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
             detailed_summary += f"• 📊 Total Records: {sum(u['num_records'] for u in all_users_summary)}\n\n"
             
             # 🌍 COUNTRY-WISE SUMMARY - PERSONAL COUNTS ONLY
-            detailed_summary += "🌍 COUNTRY-WISE SUMMARY (Personal Counts Only) 🌍\n\n"
+            detailed_summary += f"🌍 COUNTRY-WISE SUMMARY (Personal Counts Only){scope_note} 🌍\n\n"
             detailed_summary += f"📅 Date: {target_date_display}\n\n"
             
             if country_rates:
+                # Each record country counts towards exactly one rate key
+                counts_by_rate_key = {}
+                for country, count in country_summary.items():
+                    matched = rate_matcher.match(country)
+                    if matched:
+                        counts_by_rate_key[matched[0]] = counts_by_rate_key.get(matched[0], 0) + count
+                
                 # Show only specified countries with PERSONAL counts
                 for rate_country, rate in country_rates.items():
-                    # Clean country name from rate key
                     clean_rate_country = rate_country.strip(',')
-                    personal_country_count = 0
-                    
-                    # Find matching countries in PERSONAL counts only
-                    for user_summary in all_users_summary:
-                        for country, count in user_summary.get('country_totals', {}).items():
-                            clean_country = country.strip(', ')
-                            if (clean_rate_country.lower() == clean_country.lower() or
-                                clean_rate_country.lower() in clean_country.lower() or 
-                                clean_country.lower() in clean_rate_country.lower()):
-                                personal_country_count += count  # Only personal counts
+                    personal_country_count = counts_by_rate_key.get(rate_country, 0)
                     
                     country_usd = personal_country_count * rate
                     country_bdt = country_usd * USD_TO_BDT
@@ -3496,8 +5004,12 @@ async def set_settlement_rate(update: Update, context: CallbackContext):
                     detailed_summary += f"• 💵 USD: ${country_usd:.2f}\n"
                     detailed_summary += f"• 🇧🇩 BDT: {country_bdt:.2f}\n\n"
             
-            detailed_summary += "✅ OPERATION SUCCESSFUL!\n"
-            detailed_summary += "All payments have been calculated and notifications sent.\n\n"
+            if preview:
+                detailed_summary += "🧪 PREVIEW ONLY\n"
+                detailed_summary += "Nothing was sent and the saved rate is unchanged.\n\n"
+            else:
+                detailed_summary += "✅ OPERATION SUCCESSFUL!\n"
+                detailed_summary += "All payments have been calculated and notifications sent.\n\n"
             detailed_summary += f"⏰ Completed at: {datetime.now().strftime('%H:%M:%S')}"
             
             await processing_msg.edit_text(detailed_summary, parse_mode='none')
@@ -3764,7 +5276,7 @@ async def admin_add_account(update: Update, context: CallbackContext) -> None:
             })
         
         accounts[user_id_str] = user_data
-        save_accounts(accounts)
+        save_accounts(accounts, [user_id_str])
         
         if user_id_str in account_manager.user_tokens:
             await account_manager.initialize_user(int(target_user_id))
@@ -3817,7 +5329,7 @@ async def admin_remove_account(update: Update, context: CallbackContext) -> None
         if removed:
             user_data["accounts"] = new_accounts
             accounts[user_id_str] = user_data
-            save_accounts(accounts)
+            save_accounts(accounts, [user_id_str])
             
             if user_id_str in account_manager.user_tokens:
                 account_manager.user_tokens[user_id_str] = [
@@ -3880,7 +5392,8 @@ async def handle_settlement_callback(update: Update, context: CallbackContext):
     data = query.data
     
     if data.startswith('settlement_'):
-        if data.startswith('settlement_refresh_'):
+        force_refresh = data.startswith('settlement_refresh_')
+        if force_refresh:
             page = int(data.split('_')[2])
         else:
             page = int(data.split('_')[1])
@@ -3903,8 +5416,8 @@ async def handle_settlement_callback(update: Update, context: CallbackContext):
             )
             return
         
-        async with aiohttp.ClientSession() as session:
-            data_result, error = await get_user_settlements(session, token, str(api_user_id), page=page, page_size=5)
+        session = get_http_session()
+        data_result, error = await get_settlement_page(session, token, api_user_id, page, page_size=5, force_refresh=force_refresh)
         
         if error:
             await query.edit_message_text(f"❌ Error loading settlements: {error}")
@@ -4157,11 +5670,8 @@ async def handle_account_selection(update: Update, context: CallbackContext):
             return
         
         # Find the account
-        selected_account = None
-        for acc in user_data.get("accounts", []):
-            if acc["id"] == account_id:
-                selected_account = acc
-                break
+        found = account_directory.account(user_id_str, account_id)
+        selected_account = found[1] if found else None
         
         if not selected_account:
             await query.edit_message_text("❌ Account not found!")
@@ -4177,20 +5687,17 @@ async def handle_account_selection(update: Update, context: CallbackContext):
         
         if token:
             # Update account info
-            for acc in user_data["accounts"]:
-                if acc["id"] == account_id:
-                    acc['token'] = token
-                    acc['api_user_id'] = api_user_id
-                    acc['nickname'] = nickname
-                    acc['last_login'] = datetime.now().isoformat()
-                    acc['active'] = True
-                    break
+            selected_account['token'] = token
+            selected_account['api_user_id'] = api_user_id
+            selected_account['nickname'] = nickname
+            selected_account['last_login'] = datetime.now().isoformat()
+            selected_account['active'] = True
             
             # Set as selected
             user_data["selected_account_id"] = account_id
             user_data["last_active"] = datetime.now().isoformat()
             accounts[user_id_str] = user_data
-            save_accounts(accounts)
+            save_accounts(accounts, [user_id_str])
             
             # Update AccountManager
             await account_manager.initialize_user(user_id)
@@ -4287,7 +5794,7 @@ async def refresh_user_accounts(user_id):
     
     user_data["last_active"] = datetime.now().isoformat()
     accounts[user_id_str] = user_data
-    save_accounts(accounts)
+    save_accounts(accounts, [user_id_str])
     
     # Update AccountManager
     await account_manager.initialize_user(user_id)
@@ -4386,7 +5893,7 @@ async def admin_add_account_custom(update: Update, context: CallbackContext) ->
             user_data["selected_account_id"] = 1
         
         accounts[user_id_str] = user_data
-        save_accounts(accounts)
+        save_accounts(accounts, [user_id_str])
         
         # Update AccountManager
         if user_id_str in account_manager.user_tokens:
@@ -4433,66 +5940,72 @@ async def refresh_server(update: Update, context: CallbackContext) -> None:
         f"• Failed: {total_accounts - active_accounts}"
     )
 
-async def async_add_number_optimized(token, phone, msg, username, serial_number=None, user_id=None, cc='1'):
+async def add_numbers_batch(entries, user_id, job_queue, preflight=True):
     """
-    Add number with specific country code - IMPROVED VERSION
-    Shows actual phone number from API response
+    Add a user's numbers, given as (TrackedNumber, processing message) pairs
+    whose tokens are already leased.
+    With preflight, one listing page per account of the user finds numbers
+    already on the panel, which are not submitted; afterwards one listing per
+    used token gives the record ids of everything added, instead of a status
+    query per number. addNum calls run concurrently, at most
+    ADD_CONCURRENCY_PER_TOKEN per account token. Added numbers are registered
+    and their tracking scheduled; every other lease is released.
     """
-    try:
-        async with aiohttp.ClientSession() as session:
-            added = await add_number_async(session, token, cc, phone)
-            prefix = f"{serial_number}. " if serial_number else ""
-            
-            # Get actual status to see what API says
-            status_code, status_name, record_id, actual_phone = await get_status_with_actual_phone(session, token, phone)
-            
-            if added:
-                # Tracking update
-                tracking = load_tracking()
-                user_id_str = str(user_id)
-                
-                if user_id_str not in tracking["today_added"]:
-                    tracking["today_added"][user_id_str] = 0
-                
-                tracking["today_added"][user_id_str] += 1
-                save_tracking(tracking)
-                
-                stats = load_stats()
-                stats["total_checked"] = stats.get("total_checked", 0) + 1
-                stats["today_checked"] = stats.get("today_checked", 0) + 1
-                save_stats(stats)
-                
-                print(f"✅ Added count increased for user {user_id_str} - Number: {phone} (CC: {cc})")
-                
-                # Show actual phone from API if different
-                if actual_phone and actual_phone != phone:
-                    display_phone = f"{actual_phone}"
-                else:
-                    display_phone = phone
-                
-                await msg.edit_text(f"{prefix}+{cc} {display_phone} 🔵 In Progress")
-            else:
-                status_code, status_name, record_id, actual_phone = await get_status_with_actual_phone(session, token, phone)
-                
-                # Show actual phone from API
-                if actual_phone and actual_phone != phone:
-                    display_phone = f"{actual_phone}"
-                    status_name = f"{status_name} - Wrong Format"
-                else:
-                    display_phone = phone
-                
-                if status_code == 16:
-                    await msg.edit_text(f"{prefix}+{cc} {display_phone} 🚫 Already Exists")
-                    account_manager.release_token(token)
-                    return
-                
-                await msg.edit_text(f"{prefix}+{cc} {display_phone} ❌ Add Failed")
-                account_manager.release_token(token)
-    except Exception as e:
-        print(f"❌ Add error for {phone} (CC:{cc}): {e}")
-        prefix = f"{serial_number}. " if serial_number else ""
-        await msg.edit_text(f"{prefix}+{cc} {phone} ❌ Add Failed")
-        account_manager.release_token(token)
+    session = get_http_session()
+    
+    present = {}
+    if preflight:
+        tokens = account_manager.user_tokens.get(str(user_id), [])
+        for listing in await asyncio.gather(*(fetch_number_listing(session, token) for token in tokens)):
+            present.update(listing or {})
+    
+    semaphores = {}
+    
+    async def submit(record):
+        if find_in_listing(present, record.cc, record.phone):
+            print(f"⏭️ {record.phone} is already on the panel, not adding")
+            return 'exists'
+        semaphore = semaphores.setdefault(record.token, asyncio.Semaphore(ADD_CONCURRENCY_PER_TOKEN))
+        async with semaphore:
+            return await add_number_async(session, record.token, record.cc, record.phone)
+    
+    results = await asyncio.gather(*(submit(record) for record, _ in entries), return_exceptions=True)
+    
+    # One status snapshot per used account
+    snapshots = {}
+    if preflight:
+        added_tokens = list({record.token for (record, _), result in zip(entries, results) if result == 'added'})
+        listings = await asyncio.gather(*(fetch_number_listing(session, token) for token in added_tokens))
+        snapshots = dict(zip(added_tokens, listings))
+    
+    for (record, msg), result in zip(entries, results):
+        if isinstance(result, Exception):
+            print(f"❌ Add error for {record.phone} (CC:{record.cc}): {result}")
+            result = 'failed'
+        
+        if result == 'added':
+            stats_service.record_added(user_id, record.username, record.cc)
+            print(f"✅ Added count increased for user {user_id} - Number: {record.phone} (CC: {record.cc})")
+            
+            entry = find_in_listing(snapshots.get(record.token) or {}, record.cc, record.phone)
+            remember_number_location(record.phone, record.token, entry[1] if entry else None, user_id)
+            
+            tracked_registry.add(record)
+            if job_queue:
+                schedule_tracking(job_queue, record, TRACK_INTERVAL)
+            label = "🔵 In Progress"
+        else:
+            account_manager.release_token(record.token)
+            label = "🚫 Already Exists" if result == 'exists' else "❌ Add Failed"
+            if result == 'exists':
+                recent_outcomes.record(record.cc, record.phone, 16, label)
+        
+        prefix = f"{record.serial_number}. " if record.serial_number else ""
+        try:
+            await msg.edit_text(f"{prefix}+{record.cc} {record.phone} {label}")
+        except BadRequest as e:
+            if "Message is not modified" not in str(e):
+                print(f"⚠️ Message update error for {record.phone}: {e}")
 
 async def get_status_with_actual_phone(session, token, phone):
     """
@@ -4500,275 +6013,166 @@ async def get_status_with_actual_phone(session, token, phone):
     Returns: (status_code, status_name, record_id, actual_phone)
     """
     try:
-        headers = {"Admin-Token": token}
         status_url = f"{BASE_URL}/z-number-base/getAullNum?page=1&pageSize=15&phoneNum={phone}"
         
-        async with session.get(status_url, headers=headers, timeout=10) as response:
-            response_text = await response.text()
-            
-            if response.status == 401:
-                print(f"❌ Token expired for {phone}")
-                return -1, "❌ Token Expired", None, phone
-            
-            try:
-                res = await response.json(content_type=None)
-            except Exception as json_error:
-                print(f"❌ JSON parse attempt 1 failed for {phone}: {json_error}")
-                try:
-                    cleaned_text = response_text.strip()
-                    if cleaned_text.startswith('\ufeff'):
-                        cleaned_text = cleaned_text[1:]
-                    res = json.loads(cleaned_text)
-                except Exception as e2:
-                    print(f"❌ Manual JSON parse also failed for {phone}: {e2}")
-                    print(f"❌ Raw response: {response_text[:500]}")
-                    return -2, "❌ API Error", None, phone
-            
-            # Check for specific error messages
-            if res.get('code') == 28004:
-                print(f"❌ Login required for {phone}")
-                return -1, "❌ Token Expired", None, phone
-            
-            error_msg = res.get('msg', '').lower()
-            if any(keyword in error_msg for keyword in ["already exists", "cannot register", "number exists", "invalid", "wrong format"]):
-                print(f"❌ Number {phone} has issue: {error_msg}")
-                return 16, f"🚫 {res.get('msg', 'Already Exists')}", None, phone
-            
-            if res.get('code') in (400, 409):
-                error_msg = res.get('msg', f'Error {res.get("code")}')
-                print(f"❌ Number {phone} has issue, code {res.get('code')}: {error_msg}")
-                return 16, f"🚫 {error_msg}", None, phone
-            
-            if (res and "data" in res and "records" in res["data"] and 
-                res["data"]["records"] and len(res["data"]["records"]) > 0):
-                record = res["data"]["records"][0]
-                status_code = record.get("registrationStatus")
-                record_id = record.get("id")
-                
-                # Get actual phone number from API
-                actual_phone = record.get("phoneNum")
-                if not actual_phone:
-                    # Try to extract from other fields
-                    phone_fields = ["phone", "phoneNumber", "mobile", "number"]
-                    for field in phone_fields:
-                        if field in record:
-                            actual_phone = record[field]
-                            break
-                
-                status_name = status_map.get(status_code, f"🔸 Status {status_code}")
-                return status_code, status_name, record_id, actual_phone or phone
-            
-            # If no records but successful response
-            if res and "data" in res:
-                return None, "🚫 Already register or wrong number", None, phone
-            
-            return None, "🚫 API Response Error", None, phone
-            
+        http_status, body = await panel_call(session, 'status', 'GET', status_url, token)
+        
+        if http_status == 401:
+            print(f"❌ Token expired for {phone}")
+            return -1, "❌ Token Expired", None, phone
+        
+        code, msg, has_data, first_record = parse_status_response(body)
+        
+        # Check for specific error messages
+        if code == 28004:
+            print(f"❌ Login required for {phone}")
+            return -1, "❌ Token Expired", None, phone
+        
+        error_msg = msg.lower()
+        if any(keyword in error_msg for keyword in ["already exists", "cannot register", "number exists", "invalid", "wrong format"]):
+            print(f"❌ Number {phone} has issue: {error_msg}")
+            return 16, f"🚫 {msg or 'Already Exists'}", None, phone
+        
+        if code in (400, 409):
+            error_msg = msg or f'Error {code}'
+            print(f"❌ Number {phone} has issue, code {code}: {error_msg}")
+            return 16, f"🚫 {error_msg}", None, phone
+        
+        if first_record:
+            status_code, record_id, actual_phone = first_record
+            status_name = status_map.get(status_code, f"🔸 Status {status_code}")
+            return status_code, status_name, record_id, actual_phone or phone
+        
+        # If no records but successful response
+        if has_data:
+            return None, "🚫 Already register or wrong number", None, phone
+        
+        return None, "🚫 API Response Error", None, phone
+        
     except Exception as e:
         print(f"❌ Status error for {phone}: {type(e).__name__}: {e}")
         return -2, "🔄 Refresh Server", None, phone
 
+class StatusTransition:
+    """What the tracker does when a check returns a panel status"""
+    __slots__ = ('label', 'edit', 'finish', 'delete', 'count_success', 'await_otp', 'delay')
+    
+    def __init__(self, label=None, edit=True, finish=False, delete=False, count_success=False, await_otp=False, delay=TRACK_INTERVAL):
+        self.label = label  # Message text override; status_map name when None
+        self.edit = edit  # Show the status on the number's message
+        self.finish = finish  # Release the lease and stop tracking
+        self.delete = delete  # Queue the number for deletion from the panel
+        self.count_success = count_success
+        self.await_otp = await_otp  # Accept OTP replies from now on
+        self.delay = delay  # Seconds until the next check, None when finished
+
+TRACK_MAX_CHECKS = 200
+TERMINAL_STATUS_CODES = (0, 1, 4, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16)
+
+def build_status_transitions():
+    transitions = {
+        code: StatusTransition(finish=True, delete=True, delay=None)
+        for code in TERMINAL_STATUS_CODES
+    }
+    transitions[1] = StatusTransition(finish=True, count_success=True, delay=None)
+    transitions[2] = StatusTransition(await_otp=True)
+    transitions[-1] = StatusTransition(label="❌ Token Error (Auto-Retry)", finish=True, delay=None)
+    # Panel error or paused by the circuit breaker: keep the last status and poll again
+    transitions[-2] = StatusTransition(edit=False)
+    return transitions
+
+STATUS_TRANSITIONS = build_status_transitions()
+POLL_TRANSITION = StatusTransition()
+TIMEOUT_TRANSITION = StatusTransition(label="🟡 Try Later", finish=True, delete=True, delay=None)
+# A number still in progress at timeout stays on the panel
+TIMEOUT_IN_PROGRESS_TRANSITION = StatusTransition(label="🟡 Try Later", finish=True, delay=None)
+
+def status_transition(status_code, checks):
+    """Pick the transition for a status check; no allocation on the polling path"""
+    transition = STATUS_TRANSITIONS.get(status_code, POLL_TRANSITION)
+    if transition.finish or checks < TRACK_MAX_CHECKS:
+        return transition
+    return TIMEOUT_IN_PROGRESS_TRANSITION if status_code == 2 else TIMEOUT_TRANSITION
+
 async def track_status_optimized(context: CallbackContext):
-    data = context.job.data
-    phone = data['phone']
-    token = data['token']
-    username = data['username']
-    user_id = data['user_id']
-    checks = data['checks']
-    last_status = data.get('last_status', '🔵 Processing...')
-    serial_number = data.get('serial_number')
-    last_status_code = data.get('last_status_code')
-    cc = data.get('cc', '1')  # Add country code
+    record = context.job.data
+    phone = record.phone
+    token = record.token
+    username = record.username
+    user_id = record.user_id
+    
+    # A newer check was scheduled for this record (e.g. OTP fast path)
+    if context.job is not record.job:
+        return
+    
+    # Replaced by a newer add of the same phone, or evicted as abandoned
+    if record.state == TRACK_FINISHED:
+        account_manager.release_token(token)
+        return
     
     try:
-        async with aiohttp.ClientSession() as session:
-            status_code, status_name, record_id, actual_phone = await get_status_with_actual_phone(session, token, phone)
-        
-        prefix = f"{serial_number}. " if serial_number else ""
+        status_code, status_name, record_id, actual_phone = await get_status_with_actual_phone(get_http_session(), token, phone)
         
-        # Show actual phone if different
-        display_phone = actual_phone if actual_phone and actual_phone != phone else phone
-        
-        if status_code == -1:
-            account_manager.release_token(token)
-            error_text = f"{prefix}+{cc} {display_phone} ❌ Token Error (Auto-Retry)"
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=error_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"❌ Message update failed for {phone}: {e}")
-            return
-        
-        # IMPORTANT FIX: Stop tracking immediately for wrong/duplicate numbers
-        immediate_stop_codes = []  # Not Register, Ban, Already Exists, API Error
+        if record_id:
+            remember_number_location(phone, token, record_id, user_id)
         
-        if status_code in immediate_stop_codes:
-            account_manager.release_token(token)
-            if phone in active_numbers:
-                del active_numbers[phone]
-                print(f"🛑 Immediate stop for {phone} - Status: {status_name}")
-            
-            final_text = f"{prefix}+{cc} {display_phone} {status_name}"
-            
-            # Add extra info for wrong format
-            if status_code == 16 and actual_phone != phone:
-                final_text += f""
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=final_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"❌ Final message update failed for {phone}: {e}")
-            return
+        transition = status_transition(status_code, record.checks)
+        label = (transition.label or status_name) if transition.edit else record.last_status
         
-        if status_code == 2:
-            if phone not in active_numbers:
-                active_numbers[phone] = {
-                    'token': token,
-                    'username': username,
-                    'message_id': data['message_id'],
-                    'user_id': user_id,
-                    'chat_id': data['chat_id']
-                }
-                print(f"✅ Number {phone} added to active_numbers for OTP submission")
-                print(f"📱 Active numbers count: {len(active_numbers)}")
-            else:
-                print(f"ℹ️ Number {phone} already in active_numbers")
+        if transition.await_otp and record.state != TRACK_AWAITING_OTP:
+            tracked_registry.set_state(record, TRACK_AWAITING_OTP)
+            print(f"✅ Number {phone} is now awaiting OTP submission")
         
-        if status_code == 1 and last_status_code != 1:
+        if transition.count_success:
             print(f"🎉 SUCCESS detected for {phone} by user {user_id}")
             
-            tracking = load_tracking()
-            user_id_str = str(user_id)
-            
-            if phone in tracking.get("today_success", {}):
-                print(f"ℹ️ Number {phone} already had success today, skipping count")
+            if stats_service.record_success(phone, user_id, username, record.cc):
+                print(f"✅ Success count updated for user {user_id} - Total: {stats_service.user_today(user_id)['success']}")
             else:
-                print(f"✅ First time SUCCESS today for {phone} by user {user_id_str}")
-                
-                otp_stats = load_otp_stats()
-                otp_stats["total_success"] = otp_stats.get("total_success", 0) + 1
-                otp_stats["today_success"] = otp_stats.get("today_success", 0) + 1
-                
-                if user_id_str not in otp_stats["user_stats"]:
-                    otp_stats["user_stats"][user_id_str] = {
-                        "total_success": 0,
-                        "today_success": 0,
-                        "yesterday_success": 0,
-                        "username": username,
-                        "full_name": ""
-                    }
-                otp_stats["user_stats"][user_id_str]["total_success"] = otp_stats["user_stats"][user_id_str].get("total_success", 0) + 1
-                otp_stats["user_stats"][user_id_str]["today_success"] = otp_stats["user_stats"][user_id_str].get("today_success", 0) + 1
-                
-                tracking["today_success"][phone] = user_id_str
-                
-                if "today_success_counts" not in tracking:
-                    tracking["today_success_counts"] = {}
-                
-                if user_id_str not in tracking["today_success_counts"]:
-                    tracking["today_success_counts"][user_id_str] = 0
-                tracking["today_success_counts"][user_id_str] = tracking["today_success_counts"][user_id_str] + 1
-                
-                save_otp_stats(otp_stats)
-                save_tracking(tracking)
-                print(f"✅ Success count updated for user {user_id_str} - Total: {tracking['today_success_counts'][user_id_str]}")
-        
-        if status_name != last_status:
-            new_text = f"{prefix}+{cc} {display_phone} {status_name}"
-            
+                print(f"ℹ️ Number {phone} already had success today, skipping count")
+
+        if label != record.last_status:
+            prefix = f"{record.serial_number}. " if record.serial_number else ""
             # Show actual phone if different
-            if actual_phone and actual_phone != phone:
-                new_text += f""
-            
+            display_phone = actual_phone or phone
             try:
                 await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=new_text
+                    chat_id=record.chat_id, 
+                    message_id=record.message_id,
+                    text=f"{prefix}+{record.cc} {display_phone} {label}"
                 )
             except BadRequest as e:
                 if "Message is not modified" not in str(e):
                     print(f"❌ Message update failed for {phone}: {e}")
         
-        final_states = [0, 1, 4, 7, 6, 8, 9, 10, 11, 12, 13, 14, 15, 16, -2]
-        if status_code in final_states:
-            account_manager.release_token(token)
-            if phone in active_numbers:
-                del active_numbers[phone]
-                print(f"🗑️ Number {phone} removed from active_numbers (final state: {status_code})")
-            
-            if status_code not in [1, 2]:
-                deleted_count = await delete_number_from_all_accounts_optimized(phone, user_id)
-            
-            final_text = f"{prefix}+{cc} {display_phone} {status_name}"
-            
-            # Show actual phone if different
-            if actual_phone and actual_phone != phone:
-                final_text += f""
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=final_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"❌ Final message update failed for {phone}: {e}")
-            return
-        
-        if checks >= 200:  # Reduced from 150 to 100
+        if transition.finish:
             account_manager.release_token(token)
-            if phone in active_numbers:
-                del active_numbers[phone]
-                print(f"⏰ Number {phone} removed from active_numbers (timeout)")
-            
-            if status_code not in [1, 2]:
-                deleted_count = await delete_number_from_all_accounts_optimized(phone, user_id)
-            
-            timeout_text = f"{prefix}+{cc} {display_phone} 🟡 Try Later"
-            
-            # Show actual phone if different
-            if actual_phone and actual_phone != phone:
-                timeout_text += f""
-            
-            try:
-                await context.bot.edit_message_text(
-                    chat_id=data['chat_id'], 
-                    message_id=data['message_id'],
-                    text=timeout_text
-                )
-            except BadRequest as e:
-                if "Message is not modified" not in str(e):
-                    print(f"❌ Timeout message update failed for {phone}: {e}")
+            if transition.delete:
+                deletion_queue.enqueue(phone, user_id)
+            recent_outcomes.record(record.cc, phone, status_code, label)
+            print(f"🗑️ Number {phone} finished tracking ({label})")
+            forget_tracked_number(phone)
             return
         
         if context.job_queue:
-            context.job_queue.run_once(
-                track_status_optimized, 
-                2,  # Start checking after 2 seconds
-                data={
-                    **data, 
-                    'checks': checks + 1, 
-                    'last_status': status_name,
-                    'last_status_code': status_code,
-                    'cc': cc  # Pass country code
-                }
-            )
+            record.checks += 1
+            record.last_status = label
+            if transition.edit:
+                record.last_status_code = status_code
+            delay = transition.delay
+            if record.fast_polls:
+                record.fast_polls -= 1
+                delay = OTP_FAST_POLL_INTERVAL
+            # Hold polling while the panel's circuit breaker is open
+            delay = max(delay, panel_gate.breaker.retry_after())
+            schedule_tracking(context.job_queue, record, delay)
         else:
             print("❌ JobQueue not available, cannot schedule status check")
+            forget_tracked_number(phone)
     except Exception as e:
         print(f"❌ Tracking error for {phone}: {e}")
         account_manager.release_token(token)
+        forget_tracked_number(phone)
 
 async def process_multiple_numbers(update: Update, context: CallbackContext, text: str):
     numbers_data = extract_phone_numbers(text)  # Now returns dict with cc and phone
@@ -4778,8 +6182,24 @@ async def process_multiple_numbers(update: Update, context: CallbackContext, tex
         return
     
     user_id = update.effective_user.id
+    entries = []
     
     for index, num_data in enumerate(numbers_data, 1):
+        # Extract phone and cc
+        phone = num_data['phone']
+        cc = num_data.get('cc', '1')  # Default to 1 if not found
+        
+        # Already being tracked - don't spend a slot on it
+        if tracked_registry.get(phone):
+            await update.message.reply_text(f"{index}. +{cc} {phone} 🚫 Already Exists")
+            continue
+        
+        # Recently ended as banned/used/existing; admin always gets a fresh check
+        recent = recent_outcomes.get(cc, phone) if user_id != ADMIN_ID else None
+        if recent:
+            await update.message.reply_text(f"{index}. +{cc} {phone} {recent}")
+            continue
+        
         remaining = account_manager.get_user_remaining_checks(user_id)
         if remaining <= 0:
             active_accounts = account_manager.get_user_active_accounts_count(user_id)
@@ -4793,39 +6213,20 @@ async def process_multiple_numbers(update: Update, context: CallbackContext, tex
             
         token, username = token_data
         
-        # Extract phone and cc
-        phone = num_data['phone']
-        cc = num_data.get('cc', '1')  # Default to 1 if not found
-        
         # Stats update
-        stats = load_stats()
-        stats["total_checked"] = stats.get("total_checked", 0) + 1
-        stats["today_checked"] = stats.get("today_checked", 0) + 1
-        save_stats(stats)
+        stats_service.record_checked()
         
         msg = await update.message.reply_text(f"{index}. {phone} (CC:{cc}) 🔵 Processing...")
-        asyncio.create_task(async_add_number_optimized(
-            token, phone, msg, username, index, user_id, cc
-        ))
-        
-        if context.job_queue:
-            context.job_queue.run_once(
-                track_status_optimized, 
-                2,
-                data={
-                    'chat_id': update.message.chat_id,
-                    'message_id': msg.message_id,
-                    'phone': phone,
-                    'token': token,
-                    'username': username,
-                    'checks': 0,
-                    'last_status': '🔵 Processing...',
-                    'serial_number': index,
-                    'user_id': user_id,
-                    'last_status_code': None
-                }
-            )
-            
+        record = TrackedNumber(
+            phone, token, username, user_id,
+            update.message.chat_id, msg.message_id,
+            cc=cc, serial_number=index
+        )
+        entries.append((record, msg))
+    
+    if entries:
+        asyncio.create_task(add_numbers_batch(entries, user_id, context.job_queue))
+
 async def handle_message_optimized(update: Update, context: CallbackContext) -> None:
     user_id = update.effective_user.id
     
@@ -4908,6 +6309,17 @@ async def handle_message_optimized(update: Update, context: CallbackContext) ->
         phone = num_data['phone']
         cc = num_data.get('cc', '1')  # Default to US/Canada if not found
         
+        # Already being tracked - don't spend a slot on it
+        if tracked_registry.get(phone):
+            await update.message.reply_text(f"+{cc} {phone} 🚫 Already Exists")
+            return
+        
+        # Recently ended as banned/used/existing; admin always gets a fresh check
+        recent = recent_outcomes.get(cc, phone) if user_id != ADMIN_ID else None
+        if recent:
+            await update.message.reply_text(f"+{cc} {phone} {recent}")
+            return
+        
         # Check remaining checks
         remaining = account_manager.get_user_remaining_checks(user_id)
         if remaining <= 0:
@@ -4924,37 +6336,15 @@ async def handle_message_optimized(update: Update, context: CallbackContext) ->
         token, username = token_data
         
         # Update stats
-        stats = load_stats()
-        stats["total_checked"] = stats.get("total_checked", 0) + 1
-        stats["today_checked"] = stats.get("today_checked", 0) + 1
-        save_stats(stats)
+        stats_service.record_checked()
         
         # Send processing message
         msg = await update.message.reply_text(f"+{cc} {phone} 🔵 Processing...")
         
-        # Start async task to add number
-        asyncio.create_task(async_add_number_optimized(
-            token, phone, msg, username, user_id=user_id, cc=cc
-        ))
-        
-        # Schedule status tracking
-        if context.job_queue:
-            context.job_queue.run_once(
-                track_status_optimized, 
-                2,  # Start checking after 2 seconds
-                data={
-                    'chat_id': update.message.chat_id,
-                    'message_id': msg.message_id,
-                    'phone': phone,
-                    'token': token,
-                    'username': username,
-                    'checks': 0,
-                    'last_status': '🔵 Processing...',
-                    'user_id': user_id,
-                    'last_status_code': None,
-                    'cc': cc 
-                }
-            )
+        # Add in the background; tracking starts once the panel accepted it.
+        # A single number skips the listing pre-flight: one addNum is cheaper
+        record = TrackedNumber(phone, token, username, user_id, update.message.chat_id, msg.message_id, cc=cc)
+        asyncio.create_task(add_numbers_batch([(record, msg)], user_id, context.job_queue, preflight=False))
         
         return
     
@@ -5000,7 +6390,12 @@ def main():
     loop.run_until_complete(initialize_bot())
 
     # 🔹 Telegram Application
-    application = Application.builder().token(BOT_TOKEN).build()
+    application = (
+        Application.builder()
+        .token(BOT_TOKEN)
+        .post_shutdown(persist_state_on_shutdown)
+        .build()
+    )
 
     # ───────────────── COMMAND HANDLERS ─────────────────
 
@@ -5051,7 +6446,24 @@ def main():
     if application.job_queue:
         application.job_queue.run_daily(
             reset_daily_stats,
-            time=datetime.strptime("10:00", "%H:%M").time()
+            time=dtime(ROLLOVER_HOUR, 0, tzinfo=datetime.now(BD_TZ).tzinfo),
+            data=ROLLOVER_GRACE
+        )
+        # Roll over anything missed while the bot was down
+        application.job_queue.run_once(reset_daily_stats, 2)
+        # Resume numbers that were being tracked before the restart
+        application.job_queue.run_once(restore_tracked_numbers, 1)
+        application.job_queue.run_once(resume_broadcasts, 5)
+        application.job_queue.run_repeating(flush_stats_job, interval=STATS_FLUSH_INTERVAL, first=STATS_FLUSH_INTERVAL)
+        application.job_queue.run_repeating(
+            flush_active_state_job,
+            interval=ACTIVE_STATE_FLUSH_INTERVAL,
+            first=ACTIVE_STATE_FLUSH_INTERVAL
+        )
+        application.job_queue.run_repeating(
+            process_deletion_queue,
+            interval=DELETE_QUEUE_INTERVAL,
+            first=DELETE_QUEUE_INTERVAL
         )
     else:
         print("❌ JobQueue not available, daily stats reset not scheduled")